@@ -0,0 +1,45 @@
+#!/bin/bash
+# Build the one-file and one-folder executables, with and without upx,
+# and compare their size on disk and their launch time.
+# The launch time is measured with rcm --startup-budget, which exits as
+# soon as the main window is interactive.
+# Usage: ./build_compare.sh [number of launches per variant]
+
+RUNS=${1:-5}
+cd "$(dirname "$0")"
+
+# embed the icons as a compiled Qt resource
+pyrcc5 icons.qrc -o icons_rc.py || exit 1
+
+results=""
+for profile in onefile onefolder; do
+	for upx in 1 0; do
+		variant="${profile}_upx${upx}"
+		echo -e "\033[0;32mBuilding $variant\033[0m"
+		rm -rf "dist_$variant" "build_$variant"
+		RCM_BUILD=$profile RCM_UPX=$upx pyinstaller --noconfirm --log-level WARN \
+			--distpath "dist_$variant" --workpath "build_$variant" rcm.spec || exit 1
+
+		if [ "$profile" == "onefolder" ]; then
+			executable="dist_$variant/rcm/rcm"
+		else
+			executable="dist_$variant/rcm"
+		fi
+
+		size=$(du -sh "dist_$variant" | cut -f1)
+
+		total=0
+		for run in $(seq "$RUNS"); do
+			start=$(date +%s.%N)
+			"$executable" --startup-budget 1000 > /dev/null 2>&1
+			end=$(date +%s.%N)
+			total=$(echo "$total + $end - $start" | bc)
+		done
+		launch=$(echo "scale=3; $total / $RUNS" | bc)
+
+		results="$results$variant\t$size\t${launch}s\n"
+	done
+done
+
+echo -e "\nvariant\t\tsize\tlaunch"
+echo -e "$results"
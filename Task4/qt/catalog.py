@@ -0,0 +1,122 @@
+# std lib
+import os
+import json
+import time
+import tempfile
+
+# pyqt5
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# local includes
+import metrics
+from rcm_core import DEFAULT_CATALOG
+from worker import AsyncTask
+from logger import logger
+
+
+class Catalog(QObject):
+    """
+    Queues and wm+vnc flavours of each host, cached on disk in
+    ~/.rcm/catalog.json. The cached lists are returned at once, also
+    when they are stale, and refreshed in background after the login.
+    """
+
+    # host, the catalog of the host
+    catalog_changed = pyqtSignal(str, dict)
+
+    def __init__(self, file_name=None, ttl=24 * 3600):
+        """
+        :param file_name: by default ~/.rcm/catalog.json
+        :param ttl: seconds after which the catalog of a host is refreshed
+        """
+        super(Catalog, self).__init__()
+
+        self.file_name = file_name or \
+            os.path.join(os.path.expanduser('~'), '.rcm', 'catalog.json')
+        self.ttl = ttl
+        self.hosts = None
+
+        # refresh running for each host
+        self._tasks = {}
+
+    def get(self, hostname):
+        """
+        :return: the cached catalog of the host, the default one if it is unknown
+        """
+        self._load()
+        entry = self.hosts.get(hostname, {})
+        return dict((key, entry.get(key) or DEFAULT_CATALOG[key]) for key in DEFAULT_CATALOG)
+
+    def is_stale(self, hostname):
+        self._load()
+        entry = self.hosts.get(hostname)
+        return entry is None or time.time() - entry.get('time', 0) > self.ttl
+
+    def refresh(self, session, force=False):
+        """
+        Fetch the catalog of the session host in background if it is stale
+        :param session: the logged in rcm_core.Session
+        """
+        hostname = session.hostname
+        if hostname in self._tasks or not (force or self.is_stale(hostname)):
+            return
+
+        self._tasks[hostname] = AsyncTask(session.catalog(),
+                                          lambda catalog: self.on_result(hostname, catalog),
+                                          lambda error: self.on_error(hostname, error))
+
+    def on_result(self, hostname, catalog):
+        self._tasks.pop(hostname, None)
+
+        old_catalog = self.get(hostname)
+        entry = dict((key, catalog[key]) for key in DEFAULT_CATALOG if catalog.get(key))
+        entry['time'] = time.time()
+        self.hosts[hostname] = entry
+        self._save()
+
+        new_catalog = self.get(hostname)
+        if new_catalog != old_catalog:
+            logger.debug("Updated the catalog of " + hostname)
+            self.catalog_changed.emit(hostname, new_catalog)
+
+    def on_error(self, hostname, error):
+        self._tasks.pop(hostname, None)
+        logger.debug("Failed to refresh the catalog of " + hostname + ": " + str(error))
+
+    def _load(self):
+        if self.hosts is not None:
+            return
+        self.hosts = {}
+        try:
+            with metrics.timer('io.catalog.load'), open(self.file_name, 'r') as catalog_file:
+                self.hosts = json.load(catalog_file)
+        except (IOError, OSError):
+            pass
+        except ValueError:
+            logger.error("Failed to load the catalog from " + self.file_name)
+
+    @metrics.timed('io.catalog.save')
+    def _save(self):
+        catalog_dir = os.path.dirname(self.file_name)
+        try:
+            if not os.path.exists(catalog_dir):
+                os.makedirs(catalog_dir)
+            fd, tmp_file_name = tempfile.mkstemp(dir=catalog_dir, prefix='.catalog.json.')
+            with os.fdopen(fd, 'w') as catalog_file:
+                json.dump(self.hosts, catalog_file, indent=1)
+            os.replace(tmp_file_name, self.file_name)
+        except (IOError, OSError):
+            logger.error("Failed to save the catalog in " + self.file_name)
+
+
+_catalog = None
+
+
+def get_catalog():
+    """
+    :return: the process wide catalog
+    """
+    global _catalog
+    if _catalog is None:
+        _catalog = Catalog()
+    return _catalog
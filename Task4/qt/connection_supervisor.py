@@ -0,0 +1,147 @@
+# std lib
+import random
+
+# pyqt5
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+# local includes
+from ssh import ssh_pool, is_authentication_error
+from worker import Worker, start_worker, cancel_worker
+from logger import logger
+
+
+# health of the connection, shown by the tab
+CONNECTED = "connected"
+RECONNECTING = "reconnecting"
+DISCONNECTED = "disconnected"
+
+
+class ConnectionSupervisor(QObject):
+    """
+    Probe the connection of a session and reconnect it after a drop,
+    waiting an exponential and jittered delay between the attempts.
+    The probes and the reconnections run on the worker threads.
+    """
+
+    # one of CONNECTED, RECONNECTING, DISCONNECTED
+    health_changed = pyqtSignal(str)
+
+    # emitted when a new connection replaced the dropped one
+    reconnected = pyqtSignal()
+
+    def __init__(self, hostname, port, username, check_interval=15000,
+                 probe_timeout=10, base_delay=1000, max_delay=60000):
+        """
+        :param check_interval: ms between the probes of a healthy connection
+        :param probe_timeout: seconds waited for the server to answer a probe
+        :param base_delay: ms waited before the first reconnection
+        :param max_delay: upper bound in ms of the delay between the reconnections
+        """
+        super(ConnectionSupervisor, self).__init__()
+
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.probe_timeout = probe_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.health = CONNECTED
+        self.attempts = 0
+
+        self._worker = None
+
+        self._check_timer = QTimer(self)
+        self._check_timer.setInterval(check_interval)
+        self._check_timer.timeout.connect(self.check)
+
+        self._reconnect_timer = QTimer(self)
+        self._reconnect_timer.setSingleShot(True)
+        self._reconnect_timer.timeout.connect(self.reconnect)
+
+    def start(self):
+        self._check_timer.start()
+
+    def stop(self):
+        self._check_timer.stop()
+        self._reconnect_timer.stop()
+        if self._worker is not None:
+            cancel_worker(self._worker)
+            self._worker = None
+
+    @pyqtSlot()
+    def check(self):
+        """
+        Probe the connection now, called by the timer or when a remote
+        command failed
+        """
+        if self._worker is not None or self.health != CONNECTED:
+            return
+
+        self._worker = Worker(ssh_pool.probe, self.hostname, self.port, self.username,
+                              self.probe_timeout)
+        self._worker.signals.result.connect(self.on_probe)
+        self._worker.signals.error.connect(lambda error: self.on_probe(False))
+        start_worker(self._worker)
+
+    @pyqtSlot(object)
+    def on_probe(self, alive):
+        self._worker = None
+        if alive or self.health != CONNECTED:
+            return
+
+        logger.warning("Lost the connection to " + self.username + "@" + self.hostname)
+        self._check_timer.stop()
+        self.attempts = 0
+        self._set_health(RECONNECTING)
+        self._schedule_reconnect()
+
+    @pyqtSlot()
+    def reconnect(self):
+        if self._worker is not None:
+            return
+
+        logger.info("Reconnecting to " + self.username + "@" + self.hostname +
+                    " (attempt " + str(self.attempts + 1) + ")")
+        # without a password the pool uses the keys or the cached password
+        self._worker = Worker(ssh_pool.acquire, self.hostname, self.port, self.username)
+        # if the session is closed meanwhile the new connection is released
+        self._worker.on_cancelled = lambda transport: ssh_pool.release(self.hostname,
+                                                                       self.port,
+                                                                       self.username)
+        self._worker.signals.result.connect(self.on_reconnected)
+        self._worker.signals.error.connect(self.on_reconnect_error)
+        start_worker(self._worker)
+
+    @pyqtSlot(object)
+    def on_reconnected(self, transport):
+        self._worker = None
+        logger.info("Reconnected to " + self.username + "@" + self.hostname)
+        self.attempts = 0
+        self._set_health(CONNECTED)
+        self._check_timer.start()
+        self.reconnected.emit()
+
+    @pyqtSlot(object)
+    def on_reconnect_error(self, error):
+        self._worker = None
+        if is_authentication_error(error):
+            # the credentials expired, only a new login can help
+            logger.error("Failed to reconnect to " + self.hostname + ": " + str(error))
+            self._set_health(DISCONNECTED)
+            return
+
+        logger.debug("Reconnection to " + self.hostname + " failed: " + str(error))
+        self.attempts += 1
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        # half of the delay is fixed, the other half is random, so that the
+        # clients dropped together do not reconnect all at the same time
+        delay = min(self.base_delay * 2 ** self.attempts, self.max_delay)
+        self._reconnect_timer.start(int(delay / 2 + random.uniform(0, delay / 2)))
+
+    def _set_health(self, health):
+        if health != self.health:
+            self.health = health
+            self.health_changed.emit(health)
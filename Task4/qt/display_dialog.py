@@ -1,18 +1,25 @@
 # stdlib
 import uuid
 from logger import logger
+from catalog import get_catalog
 
 # pyqt5
+from PyQt5.QtCore import pyqtSlot
 from PyQt5.QtWidgets import QLabel, QLineEdit, QDialog, QComboBox, \
     QHBoxLayout, QVBoxLayout, QGroupBox, QGridLayout, QPushButton
 
 
 class QDisplayDialog(QDialog):
 
-    def __init__(self, display_names):
+    def __init__(self, display_names, hostname=""):
         QDialog.__init__(self)
 
+        self.hostname = hostname
+
         self.display_name = ""
+        self.display_queue = ""
+        self.display_vnc = ""
+        self.display_size = ""
         self.display_names = display_names
 
         self.session_line = QLineEdit(self)
@@ -41,16 +48,11 @@ class QDisplayDialog(QDialog):
 
         session_queue = QLabel(self)
         session_queue.setText('Select queue:')
-        self.session_queue_combo.addItems(["12core_40gb_3h_slurm",
-                                           "4core_18gb_1h_slurm",
-                                           "4core_18gb_3h_slurm"])
         grid_layout.addWidget(session_queue, 2, 0)
         grid_layout.addWidget(self.session_queue_combo, 2, 1)
 
         session_vnc = QLabel(self)
         session_vnc.setText('Select wm+vnc:')
-        self.session_vnc_combo.addItems(["fluxbox_turbovnc",
-                                         "xfce_singularity_turbovnc"])
         grid_layout.addWidget(session_vnc, 3, 0)
         grid_layout.addWidget(self.session_vnc_combo, 3, 1)
 
@@ -89,6 +91,26 @@ class QDisplayDialog(QDialog):
         dialog_layout.addSpacing(20)
         self.setLayout(dialog_layout)
 
+        # fill the combos from the cache, a refresh updates them in place
+        catalog = get_catalog()
+        self.on_catalog_changed(self.hostname, catalog.get(self.hostname))
+        catalog.catalog_changed.connect(self.on_catalog_changed)
+
+    @pyqtSlot(str, dict)
+    def on_catalog_changed(self, hostname, catalog):
+        """
+        Replace the items of the combos, keeping the current choices
+        """
+        if hostname != self.hostname:
+            return
+        for combo, items in ((self.session_queue_combo, catalog['queues']),
+                             (self.session_vnc_combo, catalog['vnc'])):
+            current = combo.currentText()
+            combo.clear()
+            combo.addItems(items)
+            if current in items:
+                combo.setCurrentIndex(items.index(current))
+
     def on_ok(self):
         """
         :return: Return accept signal if the display name is unique
@@ -107,4 +129,8 @@ class QDisplayDialog(QDialog):
             logger.error("session " + str(self.display_name) + " already exists")
             return
 
+        self.display_queue = str(self.session_queue_combo.currentText())
+        self.display_vnc = str(self.session_vnc_combo.currentText())
+        self.display_size = str(self.display_combo.currentText())
+
         self.accept()
@@ -0,0 +1,161 @@
+# pyqt5
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, QSize, \
+    pyqtSignal
+from PyQt5.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+
+# local includes
+from pyinstaller_utils import get_icon
+
+
+class DisplayTableModel(QAbstractTableModel):
+    """
+    The displays of a session, one row per display.
+    The rows are plain data painted by the view, so only the visible ones
+    cost painting and a status update repaints a single cell.
+    """
+
+    # columns with a text, filled by the display poller and the submitter
+    fields = ['name', 'status', 'time', 'resources']
+    headers = ['Name', 'Status', 'Time', 'Resources', '', '', '']
+
+    # columns painted as buttons by DisplayButtonDelegate
+    actions = ['connect', 'share', 'kill']
+    action_icons = {'connect': 'icons/connect.png',
+                    'share': 'icons/share.png',
+                    'kill': 'icons/kill.png'}
+    action_tooltips = {'connect': 'Connect to the remote display',
+                       'share': 'Share the remote display via file',
+                       'kill': 'Kill the remote display'}
+
+    def __init__(self, parent=None):
+        super(DisplayTableModel, self).__init__(parent)
+
+        # one dictionary of the field texts per row
+        self._rows = []
+
+        # display name -> row
+        self._row_of = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        column = index.column()
+        if column < len(self.fields):
+            if role == Qt.DisplayRole:
+                text = self._rows[index.row()][self.fields[column]]
+                # long names are cut as the old labels did
+                return text[:16] if column == 0 else text
+            if role == Qt.ToolTipRole and column == 0:
+                return self._rows[index.row()]['name']
+            return None
+
+        action = self.actions[column - len(self.fields)]
+        if role == Qt.DecorationRole:
+            return get_icon(self.action_icons[action])
+        if role == Qt.ToolTipRole:
+            return self.action_tooltips[action]
+        return None
+
+    def action(self, column):
+        """
+        :return: the action of a button column, None for the text columns
+        """
+        if column < len(self.fields):
+            return None
+        return self.actions[column - len(self.fields)]
+
+    def name(self, row):
+        return self._rows[row]['name']
+
+    def names(self):
+        return [row['name'] for row in self._rows]
+
+    def __contains__(self, name):
+        return name in self._row_of
+
+    def add_display(self, name, status=""):
+        if name in self._row_of:
+            return
+        row = len(self._rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.append({'name': name, 'status': status, 'time': "", 'resources': ""})
+        self._row_of[name] = row
+        self.endInsertRows()
+
+    def remove_display(self, name):
+        row = self._row_of.pop(name, None)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row]
+        for moved_row in range(row, len(self._rows)):
+            self._row_of[self._rows[moved_row]['name']] = moved_row
+        self.endRemoveRows()
+
+    def set_fields(self, name, changes):
+        """
+        Update some fields of a display, notifying only the changed cells
+        """
+        row = self._row_of.get(name)
+        if row is None:
+            return
+        values = self._rows[row]
+        for field, text in changes.items():
+            if field not in values or values[field] == text:
+                continue
+            values[field] = text
+            index = self.index(row, self.fields.index(field))
+            self.dataChanged.emit(index, index, [Qt.DisplayRole])
+
+
+class DisplayButtonDelegate(QStyledItemDelegate):
+    """
+    Paint the cells of the action columns as push buttons and report the
+    clicks, without a widget for each button
+    """
+
+    # index of the clicked cell
+    clicked = pyqtSignal(QModelIndex)
+
+    def __init__(self, parent=None, icon_size=16):
+        super(DisplayButtonDelegate, self).__init__(parent)
+        self.icon_size = icon_size
+        self._pressed = None
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(2, 2, -2, -2)
+        button.icon = index.data(Qt.DecorationRole)
+        button.iconSize = QSize(self.icon_size, self.icon_size)
+        button.state = QStyle.State_Enabled | QStyle.State_Raised
+
+        style = option.widget.style() if option.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+
+    def sizeHint(self, option, index):
+        return QSize(self.icon_size + 16, self.icon_size + 10)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonPress and event.button() == Qt.LeftButton:
+            self._pressed = (index.row(), index.column())
+            return True
+        if event.type() == QEvent.MouseButtonRelease and self._pressed is not None:
+            # a click is a press and a release on the same cell
+            pressed = self._pressed
+            self._pressed = None
+            if pressed == (index.row(), index.column()) and option.rect.contains(event.pos()):
+                self.clicked.emit(index)
+            return True
+        return False
@@ -0,0 +1,227 @@
+# pyqt5
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+# local includes
+from rcm_core import BUSY_STATES
+from worker import AsyncTask
+from logger import logger
+
+
+class DisplayStatusPoller(QObject):
+    """
+    Refresh the status of the displays of all the sessions sharing a
+    connection with a single batched remote query per tick.
+    The interval shrinks while a job is pending, grows when nothing
+    changes and the polling stops while no session is visible.
+    The query runs on the connection of one of the subscribed sessions.
+    """
+
+    # display name, dictionary with only the changed label texts
+    status_changed = pyqtSignal(str, dict)
+
+    # display name, compute node and port of its vnc server
+    display_ready = pyqtSignal(str, str, int)
+
+    def __init__(self, busy_interval=2000, base_interval=5000, max_interval=60000):
+        """
+        :param busy_interval: interval in ms while a job is pending
+        :param base_interval: interval in ms after a change
+        :param max_interval: upper bound in ms of the back off
+        """
+        super(DisplayStatusPoller, self).__init__()
+
+        self.busy_interval = busy_interval
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.interval = base_interval
+
+        # display name -> uuid of the sessions showing it
+        self.displays = {}
+        self.statuses = {}
+        self.endpoints = {}
+
+        # uuid of the subscribed sessions -> visibility
+        self._subscribers = {}
+        # uuid of the subscribed sessions -> rcm_core.Session
+        self._sessions = {}
+        self._task = None
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.poll)
+
+    def subscribe(self, uuid, session):
+        """
+        :param session: the logged in rcm_core.Session of the tab
+        """
+        self._subscribers[uuid] = False
+        self._sessions[uuid] = session
+
+    def unsubscribe(self, uuid):
+        """
+        Forget the session and the displays only it was showing
+        """
+        self._subscribers.pop(uuid, None)
+        self._sessions.pop(uuid, None)
+        for name in [name for name, owners in self.displays.items() if uuid in owners]:
+            self.remove_display(name, uuid)
+        self._update_timer()
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def set_visible(self, uuid, visible):
+        """
+        The polling runs only while at least one session is visible
+        """
+        if uuid not in self._subscribers:
+            return
+        was_visible = self._subscribers[uuid]
+        self._subscribers[uuid] = visible
+        if visible and not was_visible:
+            # a tab just became visible, refresh it soon
+            self.interval = self.busy_interval
+        self._update_timer()
+
+    def add_display(self, name, uuid):
+        self.displays.setdefault(name, set()).add(uuid)
+        self.interval = self.busy_interval
+        self._update_timer(restart=True)
+
+    def remove_display(self, name, uuid):
+        """
+        The display is polled until the last session showing it removes it
+        """
+        owners = self.displays.get(name)
+        if owners is None:
+            return
+        owners.discard(uuid)
+        if owners:
+            return
+        del self.displays[name]
+        self.statuses.pop(name, None)
+        self.endpoints.pop(name, None)
+        self._update_timer()
+
+    def stop(self):
+        self._timer.stop()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @pyqtSlot()
+    def poll(self):
+        if self._task is not None:
+            return
+
+        # any session logged in as the user can run the query
+        session = next((session for session in self._sessions.values()
+                        if session.engine is not None), None)
+        if session is None:
+            logger.debug("No session to query the display status")
+            self._back_off()
+            self._update_timer()
+            return
+
+        self._task = AsyncTask(session.list_displays(), self.on_result, self.on_error)
+
+    @pyqtSlot(object)
+    def on_result(self, displays):
+        self._task = None
+
+        statuses = {}
+        endpoints = {}
+        for display in displays:
+            statuses[display['name']] = dict((key, display[key])
+                                             for key in ('status', 'time', 'resources'))
+            if display['endpoint'] is not None:
+                endpoints[display['name']] = display['endpoint']
+        changed = self.update_statuses(statuses)
+        self.update_endpoints(endpoints)
+
+        # refresh fast until the vnc servers of the running jobs are up
+        busy = any(status.get('status', '').upper() in BUSY_STATES or
+                   (status.get('status') == "Running" and name not in self.endpoints)
+                   for name, status in self.statuses.items())
+        if busy:
+            self.interval = self.busy_interval
+        elif changed:
+            self.interval = self.base_interval
+        else:
+            self._back_off()
+        self._update_timer()
+
+    @pyqtSlot(object)
+    def on_error(self, error):
+        self._task = None
+        logger.debug("Display status query failed: " + str(error))
+        self._back_off()
+        self._update_timer()
+
+    def update_statuses(self, statuses):
+        """
+        Compare the new statuses with the previous ones and notify the changed labels
+        :return: True if at least one label changed
+        """
+        changed = False
+        for name in self.displays:
+            new_status = statuses.get(name)
+            old_status = self.statuses.get(name, {})
+            if new_status is None:
+                # the job left the queue: only the displays seen running change
+                if not old_status or old_status.get('status') == "Finished":
+                    continue
+                new_status = {'status': "Finished", 'time': "", 'resources': ""}
+
+            diff = dict((key, value) for key, value in new_status.items()
+                        if old_status.get(key) != value)
+            if diff:
+                self.statuses[name] = new_status
+                self.status_changed.emit(name, diff)
+                changed = True
+        return changed
+
+    def update_endpoints(self, endpoints):
+        """
+        Notify the displays whose vnc server just started
+        """
+        for name in self.displays:
+            endpoint = endpoints.get(name)
+            if endpoint is not None and self.endpoints.get(name) != endpoint:
+                self.endpoints[name] = endpoint
+                self.display_ready.emit(name, endpoint[0], endpoint[1])
+
+    def _back_off(self):
+        self.interval = min(self.interval * 2, self.max_interval)
+
+    def _update_timer(self, restart=False):
+        active = self.displays and any(self._subscribers.values())
+        if not active:
+            self._timer.stop()
+        elif restart or not self._timer.isActive() or self._timer.remainingTime() > self.interval:
+            self._timer.start(self.interval)
+
+
+# pollers shared by the sessions, keyed by (host, port, user)
+_pollers = {}
+
+
+def get_poller(hostname, port, username):
+    key = (hostname, port, username)
+    if key not in _pollers:
+        _pollers[key] = DisplayStatusPoller()
+    return _pollers[key]
+
+
+def release_poller(hostname, port, username, uuid):
+    """
+    Unsubscribe a session and stop the poller if it was the last one
+    """
+    key = (hostname, port, username)
+    poller = _pollers.get(key)
+    if poller is None:
+        return
+    poller.unsubscribe(uuid)
+    if not poller.has_subscribers():
+        poller.stop()
+        del _pollers[key]
@@ -0,0 +1,272 @@
+# std lib
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+# Benchmark of the gui hot paths, run with the offscreen Qt platform:
+# the main window construction, the tabs, the display rows, the update of
+# the session history shared by the tabs and the log pane.
+#
+# Usage: python gui_benchmark.py --save baseline.json
+#        python gui_benchmark.py --compare baseline.json --threshold 25
+#
+# With --compare the exit status is 1 if the median time of a case grew
+# more than the threshold percent over the baseline.
+#
+# The remote side is not involved: the session widgets get stand-ins for
+# the submitter and the poller, see load_test.py for the ssh layer.
+
+# the benchmark must not touch the real configuration and logs
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ['HOME'] = tempfile.mkdtemp(prefix='rcm-gui-benchmark-')
+
+# pyqt5
+from PyQt5.QtWidgets import QApplication, QPlainTextEdit
+
+# local includes
+import rcm
+import session_widget
+from session_history import get_session_history
+from qt_logger import QTextEditLoggerHandler
+from logger import logger
+
+
+class _StandIn(object):
+    """
+    Accept the calls of the session widget to its submitter and poller
+    """
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class _AcceptedDisplayDialog(session_widget.QDisplayDialog):
+    """
+    The display dialog, built as usual and accepted without being shown
+    """
+
+    def exec(self):
+        self.on_ok()
+        return self.result()
+
+
+class GuiBenchmark(object):
+
+    def __init__(self, app, repeat, tabs, displays, records):
+        """
+        :param repeat: number of times each case is measured
+        :param tabs: number of tabs of the tab cases
+        :param displays: number of displays of the display cases
+        :param records: number of log records of the log case
+        """
+        self.app = app
+        self.repeat = repeat
+        self.tabs = tabs
+        self.displays = displays
+        self.records = records
+
+    def measure(self, function):
+        """
+        Time the function and the events it posted
+        :return: the elapsed seconds
+        """
+        start = time.perf_counter()
+        function()
+        self.app.processEvents()
+        return time.perf_counter() - start
+
+    def main_window(self):
+        times = []
+        for _ in range(self.repeat):
+            windows = []
+            times.append(self.measure(lambda: windows.append(self._show_main_window())))
+            self._close(windows[0])
+        return times
+
+    def add_tab(self):
+        window = self._show_main_window()
+        times = [self.measure(window.main_widget.on_new) for _ in range(self.tabs)]
+        self._close(window)
+        return times
+
+    def close_tab(self):
+        window = self._show_main_window()
+        for _ in range(self.tabs):
+            window.main_widget.on_new()
+        self.app.processEvents()
+        times = [self.measure(lambda uuid=widget.uuid: window.main_widget.on_close(uuid))
+                 for widget in window.main_widget.session_widgets()]
+        self._close(window)
+        return times
+
+    def add_display(self):
+        widget = self._session_widget()
+        times = [self.measure(widget.add_new_display) for _ in range(self.displays)]
+        widget.deleteLater()
+        return times
+
+    def kill_display(self):
+        widget = self._session_widget()
+        for _ in range(self.displays):
+            widget.add_new_display()
+        self.app.processEvents()
+        times = [self.measure(lambda name=name: widget.kill_display(name))
+                 for name in widget.display_model.names()]
+        widget.deleteLater()
+        return times
+
+    def session_history(self):
+        """
+        Move a session at the top of the history shared by the combos of all the tabs
+        """
+        window = self._show_main_window()
+        for _ in range(self.tabs):
+            window.main_widget.on_new()
+        self.app.processEvents()
+
+        history = get_session_history()
+        for index in range(history.max_sessions):
+            history.add("user@host%d" % index)
+        times = [self.measure(lambda index=index: history.add("user@host%d" %
+                                                               (index % history.max_sessions)))
+                 for index in range(self.repeat * 10)]
+        history.flush()
+        self._close(window)
+        return times
+
+    def log_append(self):
+        """
+        Records logged through the handler of the log pane, per record
+        """
+        text_edit = QPlainTextEdit()
+        text_edit.show()
+        handler = QTextEditLoggerHandler(text_edit)
+        handler.timer.stop()
+        records = [logger.makeRecord(logger.name, logging.INFO, __file__, 0,
+                                     "benchmark record %d", (index,), None)
+                   for index in range(self.records)]
+
+        def append():
+            for record in records:
+                handler.handle(record)
+            handler.flush_records()
+
+        times = [self.measure(append) / self.records for _ in range(self.repeat)]
+        handler.close()
+        text_edit.deleteLater()
+        return times
+
+    def _show_main_window(self):
+        handlers = list(logger.handlers)
+        window = rcm.RCMMainWindow()
+        window.show()
+        # the handler of the log pane goes away with the window
+        window.log_handlers = [handler for handler in logger.handlers if handler not in handlers]
+        return window
+
+    def _close(self, window):
+        window.close()
+        for handler in window.log_handlers:
+            logger.removeHandler(handler)
+            handler.close()
+        window.deleteLater()
+        self.app.processEvents()
+
+    def _session_widget(self):
+        widget = session_widget.QSessionWidget(None)
+        widget.max_displays = self.displays
+        widget.submitter = _StandIn()
+        widget.poller = _StandIn()
+        widget.containerLoginWidget.hide()
+        widget.containerSessionWidget.show()
+        widget.show()
+        self.app.processEvents()
+        return widget
+
+
+CASES = ['main_window', 'add_tab', 'close_tab', 'add_display', 'kill_display',
+         'session_history', 'log_append']
+
+
+def summary(times):
+    times = sorted(times)
+    return {'n': len(times),
+            'median_ms': round(1000 * statistics.median(times), 4),
+            'min_ms': round(1000 * times[0], 4),
+            'p95_ms': round(1000 * times[min(len(times) - 1, int(0.95 * len(times)))], 4)}
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of the median of each case
+    :return: the names of the cases slower than the threshold percent
+    """
+    regressions = []
+    for name, result in results.items():
+        old_result = baseline.get('cases', {}).get(name)
+        line = "  %-16s %10.3f ms" % (name, result['median_ms'])
+        if old_result and old_result['median_ms']:
+            change = 100.0 * (result['median_ms'] - old_result['median_ms']) / old_result['median_ms']
+            line += "   baseline %10.3f ms  %+6.1f%%" % (old_result['median_ms'], change)
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark of the RCM gui hot paths")
+    arg_parser.add_argument('--repeat', type=int, default=10,
+                            help="measures of the main window and of the log cases")
+    arg_parser.add_argument('--tabs', type=int, default=50, help="tabs of the tab cases")
+    arg_parser.add_argument('--displays', type=int, default=100,
+                            help="displays of the display cases")
+    arg_parser.add_argument('--records', type=int, default=1000,
+                            help="log records of the log case")
+    arg_parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    arg_parser.add_argument('--save', help="save the results as json baseline")
+    arg_parser.add_argument('--compare', help="json baseline of a previous run")
+    arg_parser.add_argument('--threshold', type=float, default=25,
+                            help="percent of slow down of a median flagged as a regression")
+    args, qt_args = arg_parser.parse_known_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    # the records of the cases go to the log pane only through the log case
+    logger.setLevel(logging.WARNING)
+
+    benchmark = GuiBenchmark(app, args.repeat, args.tabs, args.displays, args.records)
+    results = {}
+    for name in args.cases:
+        results[name] = summary(getattr(benchmark, name)())
+
+    print("platform: %s, python %s" % (app.platformName(), sys.version.split()[0]))
+    regressions = compare(results, baseline or {}, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump({'platform': app.platformName(),
+                       'python': sys.version.split()[0],
+                       'time': time.time(),
+                       'cases': results}, save_file, indent=1)
+
+    rcm.event_loop.stop()
+    rcm.tunnel_manager.stop()
+    rcm.ssh_pool.close_all()
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    # the session widgets get the accepted dialog instead of showing it
+    session_widget.QDisplayDialog = _AcceptedDisplayDialog
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# std lib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# pyqt5
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+# local includes
+from rcm_core import Job, RCMError, job_store, SUBMITTING, PENDING, VNC_READY, FAILED, \
+    FINISHED, TRANSITIONS, SCHEDULER_STATES, END_STATES
+from worker import AsyncTask
+from logger import logger
+
+# another client can hold the lock of the job store for seconds, so the
+# updates of the gui are written by a thread of their own, in order
+_store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rcm-jobs")
+
+
+def save_job(session_key, job):
+    """
+    Queue the update of the job in the job store, a copy of the job is
+    written so that its later changes do not race with the write
+    """
+    _store_executor.submit(_update_store, session_key, Job.from_dict(job.to_dict()))
+
+
+def _update_store(session_key, job):
+    try:
+        job_store.update(session_key, job)
+    except Exception as e:
+        logger.error("Failed to save display " + job.name + ": " + str(e))
+
+
+def flush_jobs(timeout=None):
+    """
+    Wait for the queued updates of the job store, called when the application exits
+    :return: True if they were all written within timeout seconds
+    """
+    try:
+        _store_executor.submit(lambda: None).result(timeout)
+    except TimeoutError:
+        return False
+    return True
+
+
+class JobSubmitter(QObject):
+    """
+    Submit the display jobs of a session and follow their state.
+    The submissions run concurrently on the session engine, the state
+    changes come from the display poller.
+    """
+
+    # display name, new state
+    job_changed = pyqtSignal(str, str)
+
+    def __init__(self, session, poller, uuid):
+        """
+        :param session: the logged in rcm_core.Session
+        :param uuid: the uuid of the session tab, owner of the displays in the poller
+        """
+        super(JobSubmitter, self).__init__()
+
+        self.session = session
+        self.poller = poller
+        self.uuid = uuid
+
+        self.jobs = {}
+
+        # running submissions, to cancel them when the session is closed
+        self._tasks = {}
+
+        self.poller.status_changed.connect(self.on_status_changed)
+        self.poller.display_ready.connect(self.on_display_ready)
+
+    def reattach(self):
+        """
+        Pick up the jobs left active by a previous run of the client, except
+        the ones followed by another tab of the same user
+        :return: the reattached jobs
+        """
+        reattached = []
+        for job in job_store.load(self.session.key).values():
+            if job.name in self.jobs or job.name in self.poller.displays:
+                continue
+            self.jobs[job.name] = job
+            self.poller.add_display(job.name, self.uuid)
+            if job.state == SUBMITTING:
+                # the submission is repeated, it does nothing if the job is queued
+                self._submit(job)
+            logger.info("Reattached display " + job.name + " (" + job.state + ")")
+            reattached.append(job)
+        return reattached
+
+    def submit(self, name, queue, vnc, size):
+        """
+        Start the submission of a new display job without waiting for it
+        """
+        job = Job(name, queue, vnc, size)
+        self.jobs[name] = job
+        save_job(self.session.key, job)
+        self.poller.add_display(name, self.uuid)
+        self._submit(job)
+        return job
+
+    def reconcile(self):
+        """
+        Repeat the submissions interrupted by a connection drop, called
+        after a reconnection. The submit command does nothing for the
+        jobs that reached the scheduler.
+        """
+        for job in self.jobs.values():
+            if job.state == SUBMITTING and job.name not in self._tasks:
+                self._submit(job)
+
+    def cancel(self, name):
+        # the other tabs showing the display keep it polled
+        self.poller.remove_display(name, self.uuid)
+        job = self.jobs.pop(name, None)
+        if job is None:
+            return
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+        job.state = FINISHED
+        save_job(self.session.key, job)
+
+        AsyncTask(self.session.cancel(name), on_error=lambda error: logger.error(str(error)))
+
+    def close(self):
+        """
+        Stop following the jobs, they stay active and saved for the next run
+        """
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self.poller.status_changed.disconnect(self.on_status_changed)
+        self.poller.display_ready.disconnect(self.on_display_ready)
+
+    def _submit(self, job):
+        self._tasks[job.name] = AsyncTask(self.session.submit(job),
+                                          lambda job_id: self.on_submitted(job.name, job_id),
+                                          lambda error: self.on_submit_error(job.name, error))
+
+    def on_submitted(self, name, job_id):
+        self._tasks.pop(name, None)
+        job = self.jobs.get(name)
+        if job is None:
+            return
+
+        job.job_id = job_id
+        self._set_state(job, PENDING)
+
+    def on_submit_error(self, name, error):
+        self._tasks.pop(name, None)
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        if isinstance(error, RCMError):
+            logger.error(str(error))
+            self._set_state(job, FAILED)
+            return
+        # the connection failed, the job stays submitting until reconcile
+        logger.error("Failed to submit display " + name + ": " + str(error))
+
+    @pyqtSlot(str, dict)
+    def on_status_changed(self, name, changes):
+        job = self.jobs.get(name)
+        if job is None or 'status' not in changes:
+            return
+
+        status = changes['status']
+        if status in SCHEDULER_STATES:
+            self._set_state(job, SCHEDULER_STATES[status])
+        elif status not in END_STATES:
+            logger.debug("Display " + name + " is " + status)
+        elif job.state == VNC_READY:
+            self._set_state(job, FINISHED)
+        else:
+            # the job ended before its vnc server started
+            self._set_state(job, FAILED)
+
+    @pyqtSlot(str, str, int)
+    def on_display_ready(self, name, node, port):
+        job = self.jobs.get(name)
+        if job is None:
+            return
+        job.endpoint = (node, port)
+        self._set_state(job, VNC_READY)
+
+    def _set_state(self, job, state):
+        if state == job.state or state not in TRANSITIONS.get(job.state, ()):
+            return
+        logger.debug("Display " + job.name + ": " + job.state + " -> " + state)
+        job.state = state
+        save_job(self.session.key, job)
+        self.job_changed.emit(job.name, state)
@@ -0,0 +1,486 @@
+# std lib
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Load test of the ssh layer of RCM: a local paramiko server stands in for
+# the cluster, with a fake slurm and fake vnc servers, and the sessions
+# log in, submit displays, poll them and pull data through the tunnels as
+# the tabs of the client do, without the gui.
+#
+# Usage: python load_test.py --sessions 20 --displays 3 --output run.json
+#        python load_test.py --sessions 20 --displays 3 --compare run.json
+#
+# The server runs in a child process, so the file descriptors, the threads
+# and the memory reported are the ones of the client only.
+
+PASSWORD = "load-test"
+
+# the fake slurm and vnc servers are the ones of the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests'))
+
+from fake_cluster import RFB_VERSION, install_slurm, serve_vnc, pump
+
+
+def percentile(values, q):
+    """
+    :return: the nearest rank percentile q (0-100) of the values, None if empty
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, int(round(q / 100.0 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+# ---------------------------------------------------------------- server
+
+
+def serve(root, pending):
+    """
+    Run the fake cluster, printing the ssh port on stdout
+    :param root: directory of the fake homes, jobs and slurm commands
+    :param pending: seconds a job waits before its vnc server is up
+    """
+    import paramiko
+
+    bin_dir = os.path.join(root, 'bin')
+    os.makedirs(bin_dir)
+    install_slurm(bin_dir)
+
+    vnc_port = serve_vnc()
+    host_key = paramiko.ECDSAKey.generate()
+
+    class Server(paramiko.ServerInterface):
+
+        def __init__(self):
+            self.username = None
+            self.destinations = {}
+
+        def get_allowed_auths(self, username):
+            return 'password'
+
+        def check_auth_password(self, username, password):
+            if password != PASSWORD:
+                return paramiko.AUTH_FAILED
+            self.username = username
+            return paramiko.AUTH_SUCCESSFUL
+
+        def check_global_request(self, kind, msg):
+            # answer the keepalive probes
+            return True
+
+        def check_channel_request(self, kind, chanid):
+            return paramiko.OPEN_SUCCEEDED
+
+        def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+            self.destinations[chanid] = destination
+            return paramiko.OPEN_SUCCEEDED
+
+        def check_channel_exec_request(self, channel, command):
+            threading.Thread(target=self.execute, args=(channel, command.decode()),
+                             daemon=True).start()
+            return True
+
+        def execute(self, channel, command):
+            home = os.path.join(root, 'home', self.username)
+            env = dict(os.environ,
+                       HOME=home,
+                       PATH=bin_dir + os.pathsep + os.environ.get('PATH', ''),
+                       RCM_FAKE_JOBS=os.path.join(root, 'jobs', self.username),
+                       RCM_FAKE_PENDING=str(pending),
+                       RCM_FAKE_VNC_PORT=str(vnc_port))
+            os.makedirs(home, exist_ok=True)
+            try:
+                process = subprocess.run(command, shell=True, cwd=home, env=env,
+                                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                channel.sendall(process.stdout)
+                channel.sendall_stderr(process.stderr)
+                channel.send_exit_status(process.returncode)
+                # the client closes the channel: closing it here could overtake
+                # the reply to the exec request, sent by the transport thread
+                channel.shutdown_write()
+            except (OSError, EOFError):
+                channel.close()
+
+    def forward(transport, server):
+        # paramiko closes the channels that are garbage collected, so the
+        # session channels are kept until their command closes them
+        sessions = []
+        while transport.is_active():
+            channel = transport.accept(1)
+            sessions = [session for session in sessions if not session.closed]
+            if channel is None:
+                continue
+            destination = server.destinations.pop(channel.get_id(), None)
+            if destination is None:
+                # a session channel, served by check_channel_exec_request
+                sessions.append(channel)
+                continue
+            try:
+                sock = socket.create_connection(destination)
+            except OSError:
+                channel.close()
+                continue
+            threading.Thread(target=pump, args=(channel, sock), daemon=True).start()
+            threading.Thread(target=pump, args=(sock, channel), daemon=True).start()
+
+    def start(sock):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(host_key)
+        server = Server()
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+        forward(transport, server)
+
+    listen_socket = socket.socket()
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind(('127.0.0.1', 0))
+    listen_socket.listen(256)
+    print(listen_socket.getsockname()[1], flush=True)
+
+    while True:
+        sock, _ = listen_socket.accept()
+        threading.Thread(target=start, args=(sock,), daemon=True).start()
+
+
+def start_server(pending):
+    """
+    Run the fake cluster in a child process
+    :return: the process, its ssh port and its root directory
+    """
+    root = tempfile.mkdtemp(prefix='rcm-load-test-')
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                                '--serve', root, '--pending', str(pending)],
+                               stdout=subprocess.PIPE)
+    port = int(process.stdout.readline())
+    return process, port, root
+
+
+# ---------------------------------------------------------------- client
+
+
+class ResourceSampler(object):
+    """
+    Record the open file descriptors, the threads and the resident memory
+    of the process at regular intervals, on a background thread
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.samples = []
+        self._start = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._start = time.time()
+        self._thread = threading.Thread(target=self._run, name="rcm-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def sample(self):
+        status = {}
+        try:
+            with open('/proc/self/status', 'r') as status_file:
+                for line in status_file:
+                    key, _, value = line.partition(':')
+                    status[key] = value.split()
+            fds = len(os.listdir('/proc/self/fd'))
+        except (IOError, OSError):
+            return
+        self.samples.append({'time': round(time.time() - self._start, 3),
+                             'fds': fds,
+                             'threads': int(status['Threads'][0]),
+                             'rss_mb': round(int(status['VmRSS'][0]) / 1024.0, 1)})
+
+    def peak(self, key):
+        return max(sample[key] for sample in self.samples) if self.samples else None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+class LoadTest(object):
+    """
+    Drive the simulated sessions and collect their measures
+    """
+
+    def __init__(self, port, sessions, concurrency, displays, commands, tunnel_mb, timeout):
+        self.port = port
+        self.sessions = sessions
+        self.concurrency = concurrency
+        self.displays = displays
+        self.commands = commands
+        self.tunnel_size = int(tunnel_mb * 1024 * 1024)
+        self.timeout = timeout
+
+        self.login_latencies = []
+        self.command_latencies = []
+        self.ready_latencies = []
+        self.tunnel_rates = []
+        self.tunnel_bytes = []
+        self.errors = []
+
+        # blocking calls of the sessions: logins and the vnc clients
+        self._executor = ThreadPoolExecutor(max_workers=concurrency * (displays + 1),
+                                            thread_name_prefix="rcm-load-test")
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(index):
+            async with semaphore:
+                try:
+                    await self.session(index)
+                except Exception as e:
+                    self.errors.append("session " + str(index) + ": " + repr(e))
+
+        start = time.time()
+        await asyncio.gather(*[limited(index) for index in range(self.sessions)])
+        self.duration = time.time() - start
+        self._executor.shutdown()
+
+    async def session(self, index):
+        """
+        One tab: login, submit the displays, wait for their vnc servers,
+        poll them, pull data through the tunnels, kill them and logout
+        """
+        from ssh import ssh_login, ssh_logout, ssh_pool
+        from remote_engine import RemoteCommandEngine
+        from rcm_core import submit_command, CANCEL_COMMAND, STATUS_COMMAND, parse_endpoints
+
+        loop = asyncio.get_event_loop()
+        username = "user%03d" % index
+        hostname = '127.0.0.1'
+
+        start = time.time()
+        await loop.run_in_executor(self._executor, ssh_login, hostname, self.port,
+                                   username, PASSWORD, 'true')
+        self.login_latencies.append(time.time() - start)
+
+        engine = RemoteCommandEngine(hostname, self.port, username)
+        try:
+            names = ["load%03d_%d" % (index, display) for display in range(self.displays)]
+            start = time.time()
+            results = await engine.run_many([submit_command(username, name,
+                                                            "4core_18gb_1h_slurm",
+                                                            "fluxbox_turbovnc",
+                                                            "1920x1080")
+                                             for name in names], self.timeout)
+            for result in results:
+                if not result.ok():
+                    raise RuntimeError("submission failed: " + result.stderr.strip())
+
+            # poll as the display poller does until all the vnc servers are up
+            status_command = STATUS_COMMAND.format(user=username)
+            endpoints = {}
+            while len(endpoints) < len(names):
+                if time.time() - start > self.timeout:
+                    raise RuntimeError("displays not ready after " + str(self.timeout) + "s")
+                endpoints = parse_endpoints((await self._command(engine, status_command)).stdout)
+                await asyncio.sleep(0.1)
+            self.ready_latencies.append(time.time() - start)
+
+            for _ in range(self.commands):
+                await self._command(engine, status_command)
+
+            transport = ssh_pool.get_transport(hostname, self.port, username)
+            await asyncio.gather(*[loop.run_in_executor(self._executor, self._pull,
+                                                        transport, endpoints[name])
+                                   for name in names])
+
+            await engine.run_many([CANCEL_COMMAND.format(user=username, name=name)
+                                   for name in names], self.timeout)
+        finally:
+            engine.close()
+            await loop.run_in_executor(self._executor, ssh_logout, hostname, self.port, username)
+
+    async def _command(self, engine, command):
+        start = time.time()
+        result = await engine.run(command, self.timeout)
+        self.command_latencies.append(time.time() - start)
+        return result
+
+    def _pull(self, transport, endpoint):
+        """
+        Read tunnel_size bytes from the vnc server through a tunnel, as a viewer would
+        """
+        from tunnel import tunnel_manager
+
+        tunnel = tunnel_manager.open_tunnel(transport, endpoint[0], endpoint[1])
+        try:
+            sock = socket.create_connection(('127.0.0.1', tunnel.local_port), self.timeout)
+            with sock:
+                greeting = b''
+                while len(greeting) < len(RFB_VERSION):
+                    data = sock.recv(len(RFB_VERSION) - len(greeting))
+                    if not data:
+                        raise RuntimeError("tunnel closed before the vnc greeting")
+                    greeting += data
+
+                start = time.time()
+                sock.sendall(struct.pack('>Q', self.tunnel_size))
+                received = 0
+                while received < self.tunnel_size:
+                    data = sock.recv(1024 * 1024)
+                    if not data:
+                        raise RuntimeError("tunnel closed after " + str(received) + " bytes")
+                    received += len(data)
+                elapsed = time.time() - start
+        finally:
+            tunnel_manager.close_tunnel(tunnel)
+
+        self.tunnel_rates.append(received / elapsed / 1e6 if elapsed > 0 else 0.0)
+        self.tunnel_bytes.append(received)
+
+    def report(self, sampler):
+        def ms(values, q):
+            value = percentile(values, q)
+            return None if value is None else round(value * 1000, 1)
+
+        return {'sessions': self.sessions,
+                'concurrency': self.concurrency,
+                'displays': self.displays,
+                'duration': round(self.duration, 3),
+                'errors': self.errors,
+                'login_ms': dict(('p' + str(q), ms(self.login_latencies, q))
+                                 for q in (50, 95, 99, 100)),
+                'ready_ms': dict(('p' + str(q), ms(self.ready_latencies, q))
+                                 for q in (50, 95, 100)),
+                'command_ms': dict(('p' + str(q), ms(self.command_latencies, q))
+                                   for q in (50, 95, 99, 100)),
+                'commands_per_second': round(len(self.command_latencies) / self.duration, 1),
+                'tunnel_mb_per_second': {
+                    'p50': round(percentile(self.tunnel_rates, 50) or 0, 2),
+                    'min': round(min(self.tunnel_rates or [0]), 2),
+                    'aggregate': round(sum(self.tunnel_bytes) / self.duration / 1e6, 2)},
+                'peak_fds': sampler.peak('fds'),
+                'peak_threads': sampler.peak('threads'),
+                'peak_rss_mb': sampler.peak('rss_mb'),
+                'samples': sampler.samples}
+
+
+# figures compared between two runs, with True if higher is better
+COMPARED = [('login_ms', 'p50', False),
+            ('login_ms', 'p95', False),
+            ('command_ms', 'p50', False),
+            ('command_ms', 'p95', False),
+            ('commands_per_second', None, True),
+            ('tunnel_mb_per_second', 'aggregate', True),
+            ('peak_fds', None, False),
+            ('peak_threads', None, False),
+            ('peak_rss_mb', None, False)]
+
+
+def print_report(report, baseline=None):
+    print("sessions: %d, concurrency: %d, displays per session: %d, duration: %.2fs" %
+          (report['sessions'], report['concurrency'], report['displays'], report['duration']))
+    for key, field, higher_is_better in COMPARED:
+        value = report[key] if field is None else report[key][field]
+        name = key if field is None else key + " " + field
+        line = "  %-32s %10s" % (name, value)
+        if baseline is not None:
+            old_value = baseline.get(key) if field is None else baseline.get(key, {}).get(field)
+            if old_value and value is not None:
+                change = 100.0 * (value - old_value) / old_value
+                if change == 0:
+                    verdict = "same"
+                else:
+                    verdict = "better" if (change > 0) == higher_is_better else "worse"
+                line += "   baseline %10s  %+6.1f%% %s" % (old_value, change, verdict)
+        print(line)
+    for error in report['errors']:
+        print("  error: " + error)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Load test of the RCM ssh sessions")
+    arg_parser.add_argument('--sessions', type=int, default=20,
+                            help="number of simulated tabs")
+    arg_parser.add_argument('--concurrency', type=int, default=None,
+                            help="sessions running at the same time, all of them by default")
+    arg_parser.add_argument('--displays', type=int, default=3,
+                            help="displays submitted by each session")
+    arg_parser.add_argument('--commands', type=int, default=20,
+                            help="status polls run by each session once its displays are up")
+    arg_parser.add_argument('--tunnel-mb', type=float, default=8,
+                            help="megabytes read through the tunnel of each display")
+    arg_parser.add_argument('--pending', type=float, default=0.5,
+                            help="seconds before the vnc server of a job is up")
+    arg_parser.add_argument('--timeout', type=float, default=120,
+                            help="seconds allowed to each remote operation")
+    arg_parser.add_argument('--output', help="save the report as json")
+    arg_parser.add_argument('--compare', help="json report of a previous run to compare with")
+    arg_parser.add_argument('--verbose', action='store_true', help="keep the debug log")
+    arg_parser.add_argument('--serve', metavar='ROOT', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.pending)
+        return 0
+
+    # only the password is tried, as on a box without keys and agent
+    os.environ.pop('SSH_AUTH_SOCK', None)
+
+    from logger import logger
+    from ssh import ssh_pool
+    from tunnel import tunnel_manager
+
+    # the import of paramiko is a startup cost, not a login one
+    import paramiko
+
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+    ssh_pool.key_files = []
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    server, port, root = start_server(args.pending)
+    # the fake cluster has a new host key at each run
+    ssh_pool.known_hosts_file = os.path.join(root, 'known_hosts')
+    sampler = ResourceSampler()
+    load_test = LoadTest(port, args.sessions, args.concurrency or args.sessions, args.displays,
+                         args.commands, args.tunnel_mb, args.timeout)
+    try:
+        sampler.start()
+        asyncio.run(load_test.run())
+        sampler.stop()
+    finally:
+        tunnel_manager.stop()
+        ssh_pool.close_all()
+        server.kill()
+        server.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = load_test.report(sampler)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=1)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,69 +1,131 @@
 # std lib
+import os
+import gzip
+import time
+import queue
+import atexit
+import shutil
 import logging
-
-from PyQt5.QtGui import QTextCursor
+import logging.handlers
 
 logger = logging.getLogger("RCM")
 logger.setLevel(logging.DEBUG)
 
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-fh = logging.FileHandler("Debug.log")
-fh.setLevel(logging.DEBUG)
-fh.setFormatter(formatter)
+default_log_dir = os.path.join(os.path.expanduser('~'), '.rcm', 'logs')
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Put the records in the queue as they are: the formatting is left to
+    the listener thread, so the caller only pays for the level check
+    """
 
-logger.addHandler(fh)
+    def prepare(self, record):
+        return record
 
 
-class QLabelLoggerHandler(logging.Handler):
+class RotatingLogFileHandler(logging.handlers.RotatingFileHandler):
     """
-    We redirect the log info messages to the log label of the main window
+    Rotate the log file when it grows over max_bytes or when it is older
+    than rotate_interval seconds, optionally compressing the rotated files
     """
 
-    def __init__(self, label):
-        super(logging.Handler, self).__init__()
+    def __init__(self, filename, max_bytes, backup_count, rotate_interval=0, compress=False):
+        logging.handlers.RotatingFileHandler.__init__(self, filename,
+                                                      maxBytes=max_bytes,
+                                                      backupCount=backup_count,
+                                                      delay=True)
+        self.rotate_interval = rotate_interval
+        self.rollover_at = time.time() + rotate_interval
 
-        self.setFormatter(logging.Formatter('%(message)s'))
-        self.setLevel(logging.DEBUG)
-        self.widget = label
-        self.lock = False
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = self.compress
 
-    def emit(self, record):
-        if record.levelno == logging.INFO:
-            msg = self.format(record)
-            self.widget.setText(msg)
+    def shouldRollover(self, record):
+        if self.rotate_interval and time.time() >= self.rollover_at:
+            return 1
+        return logging.handlers.RotatingFileHandler.shouldRollover(self, record)
 
-    def write(self, m):
-        pass
+    def doRollover(self):
+        logging.handlers.RotatingFileHandler.doRollover(self)
+        self.rollover_at = time.time() + self.rotate_interval
 
+    @staticmethod
+    def compress(source, dest):
+        with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+            shutil.copyfileobj(source_file, dest_file)
+        os.remove(source)
 
-class QTextEditLoggerHandler(logging.Handler):
-        """
-        We redirect the log info messages to the log text edit of the main window
-        """
 
-        def __init__(self, label):
-            super(logging.Handler, self).__init__()
+_file_listener = None
+_file_queue_handler = None
+
+
+def configure_file_logging(log_dir=None,
+                           level=logging.DEBUG,
+                           max_bytes=5 * 1024 * 1024,
+                           backup_count=5,
+                           rotate_interval=24 * 3600,
+                           compress=True):
+    """
+    Write the log file from a background listener thread
+    :param log_dir: directory of the log files, by default ~/.rcm/logs
+    :param level: records below this level are discarded before being queued
+    :param max_bytes: size in bytes triggering the rotation, 0 to disable
+    :param backup_count: number of rotated files kept
+    :param rotate_interval: age in seconds triggering the rotation, 0 to disable
+    :param compress: if true the rotated files are compressed with gzip
+    :return:
+    """
+    global _file_listener, _file_queue_handler
+
+    stop_file_logging()
+
+    log_dir = log_dir or default_log_dir
+    try:
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+    except OSError:
+        logger.warning("Failed to create the log directory " + log_dir)
+        return
+
+    file_handler = RotatingLogFileHandler(os.path.join(log_dir, "Debug.log"),
+                                          max_bytes,
+                                          backup_count,
+                                          rotate_interval,
+                                          compress)
+    file_handler.setLevel(level)
+    file_handler.setFormatter(formatter)
+
+    _file_queue_handler = DeferredQueueHandler(queue.Queue())
+    _file_queue_handler.setLevel(level)
+
+    _file_listener = logging.handlers.QueueListener(_file_queue_handler.queue, file_handler)
+    _file_listener.start()
+
+    logger.addHandler(_file_queue_handler)
+
+
+def stop_file_logging():
+    """
+    Flush the queued records and stop the listener thread
+    """
+    global _file_listener, _file_queue_handler
 
-            self.setFormatter(logging.Formatter('%(asctime)-15s - %(levelname)s - %(message)s'))
-            self.setLevel(logging.DEBUG)
-            self.widget = label
-            self.lock = False
+    if _file_listener is None:
+        return
 
-        def emit(self, record):
-            msg = self.format(record)
+    logger.removeHandler(_file_queue_handler)
+    _file_listener.stop()
+    for handler in _file_listener.handlers:
+        handler.close()
 
-            if record.levelno == logging.ERROR or record.levelno == logging.CRITICAL:
-                html_msg = "<span style=\" font-size:10pt; font-weight:600; color:#ff0000;\" >"
-            elif record.levelno == logging.WARNING:
-                html_msg = "<span style=\" font-size:10pt; font-weight:600; color:#ff9900;\" >"
-            else:
-                html_msg = "<span style=\" font-size:10pt; font-weight:600; color:#000000;\" >"
-            html_msg += msg
-            html_msg += "</span>"
+    _file_listener = None
+    _file_queue_handler = None
 
-            self.widget.moveCursor(QTextCursor.EndOfLine)
-            self.widget.appendHtml(html_msg)
 
-        def write(self, m):
-            pass
+# the entry points configure the file logging, the records still queued are written at exit
+atexit.register(stop_file_logging)
@@ -0,0 +1,294 @@
+# std lib
+import os
+import json
+import time
+import bisect
+import tempfile
+import functools
+import threading
+
+# the metrics are collected only if the RCM_METRICS environment variable
+# is set when the modules are imported: disabled, the decorated functions
+# are left untouched and the timers do nothing
+enabled = os.environ.get('RCM_METRICS', '') not in ('', '0')
+
+# upper bounds in seconds of the histogram buckets, the last one is +Inf
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram(object):
+    """
+    Distribution of the durations of an operation, in seconds
+    """
+
+    def __init__(self, name, buckets=BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.buckets) + 1)
+            self.count = 0
+            self.sum = 0.0
+            self.max = 0.0
+
+    def quantile(self, q):
+        """
+        :return: the upper bound of the bucket holding the quantile q,
+                 the maximum for the last bucket, 0 if nothing was observed
+        """
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            maximum = self.max
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        for bucket, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                return min(self.buckets[bucket], maximum) if bucket < len(self.buckets) else maximum
+        return maximum
+
+    def to_dict(self):
+        with self._lock:
+            return {'count': self.count,
+                    'sum': self.sum,
+                    'max': self.max,
+                    'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'],
+                                        self.counts))}
+
+
+class Counter(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, value=1):
+        with self._lock:
+            self.value += value
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+
+class _Timer(object):
+    """
+    Context manager observing the time spent in its block
+    """
+
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer(object):
+    """
+    Shared timer of the disabled metrics
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class Registry(object):
+    """
+    The histograms, counters and gauges of the process, by name
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram(name))
+        return histogram
+
+    def counter(self, name):
+        counter = self.counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self.counters.setdefault(name, Counter(name))
+        return counter
+
+    def gauge(self, name, function):
+        """
+        Register a function returning the current value of the gauge,
+        called only when the metrics are read
+        """
+        with self._lock:
+            self.gauges[name] = function
+
+    def reset(self):
+        # the metrics are zeroed in place, the decorated functions keep
+        # a reference to their histogram
+        with self._lock:
+            metrics = list(self.histograms.values()) + list(self.counters.values())
+            self.start_time = time.time()
+        for metric in metrics:
+            metric.reset()
+
+    def snapshot(self):
+        """
+        :return: dictionary with all the metrics, ready to be dumped as json
+        """
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        gauge_values = {}
+        for name, function in sorted(gauges.items()):
+            try:
+                gauge_values[name] = function()
+            except Exception:
+                gauge_values[name] = None
+
+        return {'time': time.time(),
+                'uptime': time.time() - self.start_time,
+                'histograms': dict((name, histograms[name].to_dict())
+                                   for name in sorted(histograms)),
+                'counters': dict((name, counters[name].value) for name in sorted(counters)),
+                'gauges': gauge_values}
+
+    def to_prometheus(self):
+        """
+        :return: the metrics in the prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, histogram in snapshot['histograms'].items():
+            metric = _metric_name(name) + "_seconds"
+            lines.append("# TYPE " + metric + " histogram")
+            cumulative = 0
+            for bound, count in histogram['buckets'].items():
+                cumulative += count
+                lines.append(metric + '_bucket{le="' + bound + '"} ' + str(cumulative))
+            lines.append(metric + "_sum " + repr(histogram['sum']))
+            lines.append(metric + "_count " + str(histogram['count']))
+        for name, value in snapshot['counters'].items():
+            metric = _metric_name(name) + "_total"
+            lines.append("# TYPE " + metric + " counter")
+            lines.append(metric + " " + str(value))
+        for name, value in snapshot['gauges'].items():
+            if value is None:
+                continue
+            metric = _metric_name(name)
+            lines.append("# TYPE " + metric + " gauge")
+            lines.append(metric + " " + str(value))
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name):
+    return "rcm_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+registry = Registry()
+
+
+def timed(name):
+    """
+    Decorator observing the duration of each call in the histogram name.
+    With the metrics disabled the function is returned as it is.
+    Put it below pyqtSlot, so that the slot keeps its signature.
+    """
+    def decorator(function):
+        if not enabled:
+            return function
+
+        histogram = registry.histogram(name)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def timer(name):
+    """
+    :return: a context manager observing the duration of its block
+    """
+    if not enabled:
+        return _null_timer
+    return _Timer(registry.histogram(name))
+
+
+def observe(name, value):
+    if enabled:
+        registry.histogram(name).observe(value)
+
+
+def count(name, value=1):
+    if enabled:
+        registry.counter(name).add(value)
+
+
+def gauge(name, function):
+    if enabled:
+        registry.gauge(name, function)
+
+
+def write(file_name):
+    """
+    Export the metrics, as json if the file name ends with .json,
+    otherwise in the prometheus text format
+    """
+    if file_name.endswith('.json'):
+        content = json.dumps(registry.snapshot(), indent=1)
+    else:
+        content = registry.to_prometheus()
+
+    # the file may be read by a node exporter, it is replaced atomically
+    fd, tmp_file_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)),
+                                         prefix='.' + os.path.basename(file_name) + '.')
+    with os.fdopen(fd, 'w') as metrics_file:
+        metrics_file.write(content)
+    os.replace(tmp_file_name, file_name)
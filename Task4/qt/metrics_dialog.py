@@ -0,0 +1,158 @@
+# std lib
+import time
+
+# pyqt5
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSlot
+from PyQt5.QtWidgets import QDialog, QTableWidget, QTableWidgetItem, QHeaderView, \
+    QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QFileDialog
+
+# local includes
+import metrics
+from logger import logger
+
+
+class EventLoopLagMonitor(QObject):
+    """
+    Measure how late the gui event loop runs a periodic timer: the delay
+    is the time the loop was busy with something else, like a slow slot
+    """
+
+    def __init__(self, interval=100, parent=None):
+        """
+        :param interval: ms between two measures
+        """
+        super(EventLoopLagMonitor, self).__init__(parent)
+
+        self.interval = interval
+        self._expected = None
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.on_timeout)
+
+    def start(self):
+        self._expected = time.perf_counter() + self.interval / 1000.0
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    @pyqtSlot()
+    def on_timeout(self):
+        now = time.perf_counter()
+        metrics.observe('qt.event_loop_lag', max(0.0, now - self._expected))
+        self._expected = now + self.interval / 1000.0
+
+
+class QMetricsDialog(QDialog):
+    """
+    Debug panel showing the metrics collected so far, refreshed every second
+    """
+
+    columns = ['Metric', 'Count', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'Max (ms)', 'Value']
+
+    def __init__(self, parent=None):
+        QDialog.__init__(self, parent)
+
+        self.setWindowTitle("Metrics")
+        self.resize(700, 400)
+
+        self.status_label = QLabel(self)
+        self.table = QTableWidget(0, len(self.columns), self)
+
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(1000)
+        self._refresh_timer.timeout.connect(self.refresh)
+
+        self.init_ui()
+
+    def init_ui(self):
+        """
+        Initialize the interface
+        :return:
+        """
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+
+        hor_layout = QHBoxLayout()
+        reset_button = QPushButton('Reset', self)
+        reset_button.clicked.connect(self.on_reset)
+        export_button = QPushButton('Export...', self)
+        export_button.clicked.connect(self.on_export)
+        close_button = QPushButton('Close', self)
+        close_button.clicked.connect(self.close)
+        hor_layout.addWidget(self.status_label)
+        hor_layout.addStretch(1)
+        hor_layout.addWidget(reset_button)
+        hor_layout.addWidget(export_button)
+        hor_layout.addWidget(close_button)
+
+        ver_layout = QVBoxLayout()
+        ver_layout.addWidget(self.table)
+        ver_layout.addLayout(hor_layout)
+        self.setLayout(ver_layout)
+
+    def showEvent(self, event):
+        self.refresh()
+        self._refresh_timer.start()
+        QDialog.showEvent(self, event)
+
+    def hideEvent(self, event):
+        self._refresh_timer.stop()
+        QDialog.hideEvent(self, event)
+
+    @pyqtSlot()
+    def refresh(self):
+        if not metrics.enabled:
+            self.status_label.setText("Metrics disabled, start RCM with RCM_METRICS=1")
+            return
+
+        snapshot = metrics.registry.snapshot()
+        self.status_label.setText("Collected in the last %.0f s" % snapshot['uptime'])
+
+        rows = []
+        for name in snapshot['histograms']:
+            histogram = metrics.registry.histogram(name)
+            rows.append([name, str(histogram.count)] +
+                        ["%.1f" % (1000 * histogram.quantile(q)) for q in (0.5, 0.95, 0.99)] +
+                        ["%.1f" % (1000 * histogram.max), ""])
+        for name, value in snapshot['counters'].items():
+            rows.append([name, "", "", "", "", "", str(value)])
+        for name, value in snapshot['gauges'].items():
+            rows.append([name, "", "", "", "", "", str(value)])
+
+        self.table.setRowCount(len(rows))
+        for row, texts in enumerate(rows):
+            for column, text in enumerate(texts):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(row, column, item)
+                if item.text() != text:
+                    item.setText(text)
+
+    @pyqtSlot()
+    def on_reset(self):
+        metrics.registry.reset()
+        self.refresh()
+
+    @pyqtSlot()
+    def on_export(self):
+        options = QFileDialog.Options()
+        options |= QFileDialog.DontUseNativeDialog
+        file_name, file_filter = QFileDialog.getSaveFileName(self,
+                                                             "Export metrics...",
+                                                             "rcm_metrics.json",
+                                                             "JSON Files (*.json);;"
+                                                             "Prometheus Files (*.prom)",
+                                                             options=options)
+        if not file_name:
+            return
+        try:
+            metrics.write(file_name)
+            logger.info("Exported the metrics in " + file_name)
+        except (IOError, OSError) as e:
+            logger.error("Failed to export the metrics: " + str(e))
@@ -2,13 +2,72 @@
 import sys
 import os
 
+# pyqt5
+from PyQt5.QtCore import QFile
+from PyQt5.QtGui import QIcon, QImage, QPixmap
+
+# the icons compiled in a Qt resource with: pyrcc5 icons.qrc -o icons_rc.py
+try:
+    import icons_rc
+except ImportError:
+    icons_rc = None
+
+# PyInstaller creates a temp folder and stores path in _MEIPASS
+_base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
+
+# icons loaded once and shared by all the widgets, keyed by relative path
+_icons = {}
+
+icon_names = ['icons/connect.png', 'icons/exit.png', 'icons/kill.png',
+              'icons/login.png', 'icons/new.png', 'icons/open.png',
+              'icons/plus.png', 'icons/share.png']
+
 
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
-    try:
-        # PyInstaller creates a temp folder and stores path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
+    if icons_rc is not None and QFile.exists(':/' + relative_path):
+        return ':/' + relative_path
+
+    return os.path.join(_base_path, relative_path)
+
+
+def get_icon(relative_path):
+    """
+    :return: the shared QIcon of the resource, loaded at the first request
+    """
+    icon = _icons.get(relative_path)
+    if icon is None:
+        icon = QIcon(resource_path(relative_path))
+        _icons[relative_path] = icon
+    return icon
+
+
+def _decode_icons(relative_paths):
+    """
+    Decode the images, runs on a worker thread: QImage, unlike QPixmap
+    and QIcon, can be used outside the gui thread
+    """
+    images = {}
+    for relative_path in relative_paths:
+        image = QImage(resource_path(relative_path))
+        if not image.isNull():
+            images[relative_path] = image
+    return images
+
+
+def _store_icons(images):
+    for relative_path, image in images.items():
+        if relative_path not in _icons:
+            _icons[relative_path] = QIcon(QPixmap.fromImage(image))
+
+
+def preload_icons():
+    """
+    Decode all the icons in background and fill the cache on the gui thread
+    """
+    # imported here, the worker pool is not needed to resolve the paths
+    from worker import Worker, start_worker
 
-    return os.path.join(base_path, relative_path)
\ No newline at end of file
+    worker = Worker(_decode_icons, [name for name in icon_names if name not in _icons])
+    worker.signals.result.connect(_store_icons)
+    return start_worker(worker)
@@ -0,0 +1,131 @@
+# std lib
+import html
+import logging
+import collections
+
+# pyqt5
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QTextCursor
+
+
+class QLabelLoggerHandler(logging.Handler):
+    """
+    We redirect the log info messages to the log label of the main window
+    """
+
+    def __init__(self, label):
+        super(logging.Handler, self).__init__()
+
+        self.setFormatter(logging.Formatter('%(message)s'))
+        self.setLevel(logging.DEBUG)
+        self.widget = label
+        self.lock = False
+
+    def emit(self, record):
+        if record.levelno == logging.INFO:
+            msg = self.format(record)
+            self.widget.setText(msg)
+
+    def write(self, m):
+        pass
+
+
+class QTextEditLoggerHandler(logging.Handler):
+    """
+    We redirect the log messages to the log text edit of the main window.
+    The records are queued from any thread and a timer on the gui thread
+    appends them in batches, keeping at most max_blocks lines.
+    """
+
+    def __init__(self, text_edit, max_blocks=1000, max_queued=10000, interval=50):
+        """
+        :param text_edit: the QPlainTextEdit showing the log
+        :param max_blocks: maximum number of lines kept in the text edit
+        :param max_queued: maximum number of records waiting for the timer,
+                           the exceeding ones are dropped
+        :param interval: ms between two appends
+        """
+        logging.Handler.__init__(self)
+
+        self.setFormatter(logging.Formatter('%(asctime)-15s - %(levelname)s - %(message)s'))
+        self.setLevel(logging.DEBUG)
+        self.widget = text_edit
+        self.widget.setMaximumBlockCount(max_blocks)
+        self.max_blocks = max_blocks
+        self.max_queued = max_queued
+
+        # number of records dropped because the queue was full
+        self.dropped = 0
+        self._reported_dropped = 0
+
+        self.records = collections.deque()
+
+        # the timer lives in the gui thread together with the text edit
+        self.timer = QTimer(self.widget)
+        self.timer.timeout.connect(self.flush_records)
+        self.timer.start(interval)
+
+    def emit(self, record):
+        if len(self.records) >= self.max_queued:
+            self.dropped += 1
+            return
+        self.records.append(record)
+
+    def flush_records(self):
+        """
+        Append the queued records to the text edit with a single edit block
+        """
+        count = len(self.records)
+        if count == 0 and self.dropped == self._reported_dropped:
+            return
+
+        # the lines beyond max_blocks would be discarded right away
+        skipped = max(0, count - self.max_blocks)
+        for _ in range(skipped):
+            self.records.popleft()
+
+        html_msgs = []
+        for _ in range(count - skipped):
+            record = self.records.popleft()
+            html_msgs.append(self.to_html(record.levelno, self.format(record)))
+
+        if self.dropped != self._reported_dropped:
+            html_msgs.append(self.to_html(logging.WARNING,
+                                          str(self.dropped - self._reported_dropped) +
+                                          " log records dropped"))
+            self._reported_dropped = self.dropped
+
+        # one paragraph per record in a single insert: every call into Qt
+        # releases the gil, which a logging thread then holds for a while
+        cursor = QTextCursor(self.widget.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        if not self.widget.document().isEmpty():
+            cursor.insertBlock()
+        cursor.insertHtml("".join("<p>" + html_msg + "</p>" for html_msg in html_msgs))
+        cursor.endEditBlock()
+
+        scroll_bar = self.widget.verticalScrollBar()
+        scroll_bar.setValue(scroll_bar.maximum())
+
+    @staticmethod
+    def to_html(levelno, msg):
+        if levelno == logging.ERROR or levelno == logging.CRITICAL:
+            html_msg = "<span style=\" font-size:10pt; font-weight:600; color:#ff0000;\" >"
+        elif levelno == logging.WARNING:
+            html_msg = "<span style=\" font-size:10pt; font-weight:600; color:#ff9900;\" >"
+        else:
+            html_msg = "<span style=\" font-size:10pt; font-weight:600; color:#000000;\" >"
+        html_msg += html.escape(msg)
+        html_msg += "</span>"
+        return html_msg
+
+    def close(self):
+        # called again by logging.shutdown at exit, after Qt deleted the timer
+        if self.timer is not None:
+            self.timer.stop()
+            self.timer = None
+        logging.Handler.close(self)
+
+    def write(self, m):
+        pass
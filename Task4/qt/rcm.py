@@ -1,23 +1,43 @@
 # std lib
+import os
 import sys
-import collections
+import logging
+import argparse
+
+# first local include, to time the rest of the startup
+import startup_timer
 
 # pyqt5
-from PyQt5.QtCore import pyqtSlot
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import QMainWindow, QApplication, \
-    QWidget, QTabWidget, QVBoxLayout, QPushButton, \
+    QWidget, QVBoxLayout, QPushButton, \
     QDesktopWidget, QAction, QFileDialog, \
     QTabBar, QStyle, QPlainTextEdit
 
 # local includes
-from session_widget import QSessionWidget
-from pyinstaller_utils import resource_path
-from logger import QTextEditLoggerHandler, logger
+from session_widget import QSessionWidgetPool
+from session_tabs import QSessionTabWidget
+from session_history import get_session_history
+from ssh import ssh_pool, ssh_warm_up
+from tunnel import tunnel_manager
+from remote_engine import event_loop
+from worker import stop_workers
+from job_submission import flush_jobs
+from metrics_dialog import QMetricsDialog, EventLoopLagMonitor
+from watchdog import StallWatchdog
+import metrics
+from pyinstaller_utils import get_icon, preload_icons
+from qt_logger import QTextEditLoggerHandler
+from logger import logger, formatter, configure_file_logging
+
+startup_timer.mark("modules imported")
 
 
 class RCMMainWindow(QMainWindow):
 
+    # emitted once, when the event loop is back after the first paint
+    first_painted = pyqtSignal()
+
     def __init__(self):
         super().__init__()
 
@@ -29,27 +49,27 @@ class RCMMainWindow(QMainWindow):
         screen_width = QDesktopWidget().width()
         screen_height = QDesktopWidget().height()
 
-        self.setGeometry((screen_width / 2) - (width / 2),
-                         (screen_height / 2) - (height / 2),
+        self.setGeometry((screen_width // 2) - (width // 2),
+                         (screen_height // 2) - (height // 2),
                          width, height)
 
         self.setFixedHeight(height)
         self.setFixedWidth(width)
 
         # Create new action
-        new_action = QAction(QIcon(resource_path('icons/new.png')), '&New', self)
+        new_action = QAction(get_icon('icons/new.png'), '&New', self)
         new_action.setShortcut('Ctrl+N')
         new_action.setStatusTip('New VNC session')
         new_action.triggered.connect(self.new_vnc_session)
 
         # Create new action
-        open_action = QAction(QIcon(resource_path('icons/open.png')), '&Open', self)
+        open_action = QAction(get_icon('icons/open.png'), '&Open', self)
         open_action.setShortcut('Ctrl+O')
         open_action.setStatusTip('Open VNC session')
         open_action.triggered.connect(self.open_vnc_session)
 
         # Create exit action
-        exit_action = QAction(QIcon(resource_path('icons/exit.png')), '&Exit', self)
+        exit_action = QAction(get_icon('icons/exit.png'), '&Exit', self)
         exit_action.setShortcut('Ctrl+Q')
         exit_action.setStatusTip('Exit application')
         exit_action.triggered.connect(self.exit)
@@ -82,25 +102,20 @@ class RCMMainWindow(QMainWindow):
         help_menu = menu_bar.addMenu('&Help')
         help_menu.addAction(about_action)
 
+        # Hidden action opening the metrics debug panel
+        metrics_action = QAction('&Metrics', self)
+        metrics_action.setShortcut('Ctrl+Shift+M')
+        metrics_action.triggered.connect(self.show_metrics)
+        self.addAction(metrics_action)
+        self.metrics_dialog = None
+
         self.main_widget = MainWidget(self)
         self.setCentralWidget(self.main_widget)
 
         logger.info("Welcome in RCM!")
 
     def new_vnc_session(self):
-        last_tab_id = self.main_widget.tabs.count() - 1
-        last_tab_uuid = self.main_widget.tabs.widget(last_tab_id).uuid
-
-        kill_btn = QPushButton()
-        kill_btn.setIcon(self.style().standardIcon(QStyle.SP_DialogCloseButton))
-        kill_btn.clicked.connect(lambda: self.on_close(last_tab_uuid))
-        kill_btn.setToolTip('Close session')
-
-        self.main_widget.tabs.setTabText(last_tab_id, "Login...")
-        self.main_widget.tabs.tabBar().setTabButton(last_tab_id,
-                                                    QTabBar.RightSide,
-                                                    kill_btn)
-        self.main_widget.add_new_tab("", False)
+        self.main_widget.on_new()
 
     def open_vnc_session(self):
 
@@ -115,22 +130,34 @@ class RCMMainWindow(QMainWindow):
     def exit(self):
         self.close()
 
+    def paintEvent(self, event):
+        QMainWindow.paintEvent(self, event)
+        if startup_timer.elapsed("first paint") is None:
+            startup_timer.mark("first paint")
+            QTimer.singleShot(0, self.first_painted.emit)
+
+    def closeEvent(self, event):
+        # release the connections and the pollers of all the sessions
+        for widget in self.main_widget.session_widgets():
+            widget.close_session()
+        get_session_history().flush()
+        QMainWindow.closeEvent(self, event)
+
     def edit_settings(self):
         return
 
     def about(self):
         return
 
+    def show_metrics(self):
+        if self.metrics_dialog is None:
+            self.metrics_dialog = QMetricsDialog(self)
+        self.metrics_dialog.show()
+        self.metrics_dialog.raise_()
+
     @pyqtSlot()
     def on_close(self, uuid):
-        # loop over the tabs and found the tab with the right uuid
-        for tab_id in range(0, self.main_widget.tabs.count()):
-            widget = self.main_widget.tabs.widget(tab_id)
-            if widget.uuid == uuid:
-                if self.main_widget.tabs.currentIndex() == self.main_widget.tabs.count() - 2:
-                    self.main_widget.tabs.setCurrentIndex(tab_id - 1)
-                self.main_widget.tabs.removeTab(tab_id)
-                return
+        self.main_widget.on_close(uuid)
 
 
 class MainWidget(QWidget):
@@ -139,7 +166,14 @@ class MainWidget(QWidget):
         super(QWidget, self).__init__(parent)
 
         self.main_layout = QVBoxLayout(self)
-        self.tabs = QTabWidget()
+        self.tabs = QSessionTabWidget()
+
+        # lightweight widget of the "+" tab, the session widget is
+        # built only when the tab is activated
+        self.plus_tab = QWidget()
+
+        # session widgets built in advance
+        self.widget_pool = QSessionWidgetPool()
 
         self.init_ui()
 
@@ -153,8 +187,9 @@ class MainWidget(QWidget):
         logger.debug("Initialized tab screen")
 
     # Add tabs
-        self.add_new_tab("Login...")
         self.add_new_tab("", False)
+        self.add_new_tab("Login...")
+        self.tabs.setCurrentIndex(0)
         self.tabs.currentChanged.connect(self.on_change)
         logger.debug("Created tabs")
 
@@ -168,112 +203,194 @@ class MainWidget(QWidget):
         self.main_layout.addWidget(text_log_frame)
 
     # configure logging
-        text_log_handler = QTextEditLoggerHandler(text_log_frame)
-        logger.addHandler(text_log_handler)
+        self.text_log_handler = QTextEditLoggerHandler(text_log_frame)
+        logger.addHandler(self.text_log_handler)
 
     # Set main layout
         self.setLayout(self.main_layout)
 
+    # Prepare the widgets of the next tabs when the event loop is idle
+        self.widget_pool.fill()
+
+    def session_widgets(self):
+        """
+        :return: the session widgets of the tabs, without the "+" placeholder
+        """
+        return self.tabs.session_widgets()
+
     @pyqtSlot()
+    @metrics.timed('slot.MainWidget.on_change')
     def on_change(self):
         """
-        Add a new "+" tab and substitute "+2" with "login" in the previous tab
-        if the last tab is selected
+        Add a new session tab if the "+" tab is selected
         :return:
         """
-        if self.tabs.currentIndex() == self.tabs.count() - 1:
-            self.tabs.setTabText(self.tabs.currentIndex(), "Login...")
-
-            uuid = self.tabs.currentWidget().uuid
-
-            kill_btn = QPushButton()
-            kill_btn.setIcon(self.style().standardIcon(QStyle.SP_DialogCloseButton))
-            kill_btn.setToolTip('Close session')
-            kill_btn.clicked.connect(lambda: self.on_close(uuid))
-            self.tabs.tabBar().setTabButton(self.tabs.currentIndex(),
-                                            QTabBar.RightSide,
-                                            kill_btn)
-            self.add_new_tab("", False)
+        if self.tabs.currentWidget() is self.plus_tab:
+            self.on_new()
 
     @pyqtSlot()
+    @metrics.timed('slot.MainWidget.on_new')
     def on_new(self):
         """
-        Add a new "+" tab and substitute "+2" with "login" in the previous tab
-        if the last tab button is pressed
+        Add a new session tab before the "+" tab and select it
         :return:
         """
-        last_tab = self.tabs.count() - 1
-        self.tabs.setTabText(last_tab, "Login...")
-
-        kill_btn = QPushButton()
-        kill_btn.setIcon(self.style().standardIcon(QStyle.SP_DialogCloseButton))
-        kill_btn.setToolTip('Close session')
-        uuid = self.tabs.widget(last_tab).uuid
-        kill_btn.clicked.connect(lambda: self.on_close(uuid))
-        self.tabs.tabBar().setTabButton(last_tab,
-                                        QTabBar.RightSide,
-                                        kill_btn)
-        self.add_new_tab("", False)
+        self.add_new_tab("Login...")
+        self.tabs.setCurrentIndex(self.tabs.indexOf(self.plus_tab) - 1)
 
     def add_new_tab(self, session_name, show_close_btn=True):
         """
         Add a new tab in the tab widget
         :param session_name: name to be displayed
-        :param show_close_btn: if true we add the close button
+        :param show_close_btn: if true we add a session tab with the close button,
+                               otherwise the "+" placeholder tab
         :return:
         """
-        new_tab = QSessionWidget(self.tabs)
-        uuid = new_tab.uuid
-        self.tabs.addTab(new_tab, session_name)
-
-        if show_close_btn:
-            kill_btn = QPushButton()
-            kill_btn.setIcon(self.style().standardIcon(QStyle.SP_DialogCloseButton))
-            kill_btn.clicked.connect(lambda: self.on_close(uuid))
-            kill_btn.setToolTip('Close session')
-            self.tabs.tabBar().setTabButton(self.tabs.count() - 1,
-                                            QTabBar.RightSide,
-                                            kill_btn)
-        else:
-            kill_btn = QPushButton()
-            ico = QIcon()
-            ico.addFile(resource_path('icons/plus.png'))
-            kill_btn.setIcon(ico)
-            kill_btn.clicked.connect(self.on_new)
-            kill_btn.setToolTip('New session')
-            self.tabs.tabBar().setTabButton(self.tabs.count() - 1,
+        if not show_close_btn:
+            self.tabs.addTab(self.plus_tab, session_name)
+
+            plus_btn = QPushButton()
+            plus_btn.setIcon(get_icon('icons/plus.png'))
+            plus_btn.clicked.connect(self.on_new)
+            plus_btn.setToolTip('New session')
+            self.tabs.tabBar().setTabButton(self.tabs.indexOf(self.plus_tab),
                                             QTabBar.RightSide,
-                                            kill_btn)
+                                            plus_btn)
+            return
+
+        new_tab = self.widget_pool.take()
+        uuid = new_tab.uuid
+        tab_id = self.tabs.insertTab(self.tabs.indexOf(self.plus_tab), new_tab, session_name)
+
+        kill_btn = QPushButton()
+        kill_btn.setIcon(self.style().standardIcon(QStyle.SP_DialogCloseButton))
+        kill_btn.clicked.connect(lambda: self.on_close(uuid))
+        kill_btn.setToolTip('Close session')
+        self.tabs.tabBar().setTabButton(tab_id,
+                                        QTabBar.RightSide,
+                                        kill_btn)
 
         new_tab.logged_in.connect(self.on_login)
-        new_tab.sessions_changed.connect(self.on_sessions_changed)
+        new_tab.health_changed.connect(self.on_health_changed)
         logger.debug("Added new tab " + str(uuid))
 
     @pyqtSlot(str)
+    @metrics.timed('slot.MainWidget.on_login')
     def on_login(self, session_name):
-        self.tabs.setTabText(self.tabs.currentIndex(), session_name)
+        # the login runs in background, so the sender may not be the current tab
+        widget = self.sender()
+        tab_id = self.tabs.indexOf(widget)
+        if tab_id != -1:
+            self.tabs.setTabText(tab_id, session_name)
+
+    @pyqtSlot(str)
+    @metrics.timed('slot.MainWidget.on_health_changed')
+    def on_health_changed(self, health):
+        """
+        Show in the tab title that the session is reconnecting
+        """
+        widget = self.sender()
+        tab_id = self.tabs.indexOf(widget)
+        if tab_id == -1:
+            return
+        session_name = widget.user + "@" + widget.host
+        if health != "connected":
+            session_name += " (" + health + ")"
+        self.tabs.setTabText(tab_id, session_name)
 
     @pyqtSlot()
+    @metrics.timed('slot.MainWidget.on_close')
     def on_close(self, uuid):
-        # loop over the tabs and found the tab with the right uuid
-        for tab_id in range(0, self.tabs.count()):
-            widget = self.tabs.widget(tab_id)
-            if widget.uuid == uuid:
-                if self.tabs.currentIndex() == self.tabs.count() - 2:
-                    self.tabs.setCurrentIndex(tab_id - 1)
-                self.tabs.removeTab(tab_id)
-                return
-
-    @pyqtSlot(collections.deque)
-    def on_sessions_changed(self, sessions_list):
-        for tab_id in range(0, self.tabs.count()):
-            widget = self.tabs.widget(tab_id)
-            widget.session_combo.clear()
-            widget.session_combo.addItems(sessions_list)
+        widget = self.tabs.session_widget(uuid)
+        if widget is None:
+            return
+
+        widget.close_session()
+        tab_id = self.tabs.indexOf(widget)
+        # select the previous tab instead of the "+" one
+        if tab_id == self.tabs.currentIndex() == self.tabs.count() - 2:
+            self.tabs.setCurrentIndex(tab_id - 1)
+        self.tabs.removeTab(tab_id)
+
+        # destroy the widget now instead of waiting for the main window
+        widget.deleteLater()
+        logger.debug("Closed tab " + str(uuid))
+
+
+def on_startup_done(app, startup_budget, warm_up=False):
+    """
+    Called by the event loop once the main window is painted
+    :param startup_budget: if not None, quit reporting a failure when the
+                           startup took more than these seconds
+    :param warm_up: connect in background to the hosts of the session history
+    """
+    time_to_interactive = startup_timer.mark("interactive")
+    startup_timer.report(logger)
+
+    # the icons of the session widgets are decoded in background, after
+    # the measure so that the budget covers the startup the users get
+    preload_icons()
+
+    history = get_session_history()
+    if warm_up or history.get('Settings', 'warm_up', 'false').lower() in ('true', 'yes', '1'):
+        ssh_warm_up(list(history.sessions))
+
+    if startup_budget is not None:
+        exit_code = 0 if time_to_interactive <= startup_budget else 1
+        message = "Time to interactive: %.3fs, budget: %.3fs" % (time_to_interactive,
+                                                                   startup_budget)
+        if exit_code:
+            logger.warning(message)
+        else:
+            logger.info(message)
+        app.exit(exit_code)
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    arg_parser = argparse.ArgumentParser(description="Remote Connection Manager")
+    arg_parser.add_argument('--startup-budget', type=float, default=None,
+                            help="measure the startup and exit, with status 1 "
+                                 "if it takes more than these seconds")
+    arg_parser.add_argument('--warm-up', action='store_true',
+                            help="connect in background to the recent hosts")
+    args, qt_args = arg_parser.parse_known_args()
+
+    configure_file_logging()
+    if args.startup_budget is not None:
+        # the startup report and the result on the console
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    startup_timer.mark("application created")
     rcm_win = RCMMainWindow()
+    startup_timer.mark("main window built")
     rcm_win.show()
-    sys.exit(app.exec_())
+    if metrics.enabled:
+        lag_monitor = EventLoopLagMonitor()
+        lag_monitor.start()
+    # report the slots blocking the gui for more than stall_threshold ms, 0 disables it
+    stall_threshold = get_session_history().get_int('Settings', 'stall_threshold', 1000)
+    watchdog = StallWatchdog(stall_threshold) if stall_threshold > 0 else None
+    if watchdog is not None:
+        watchdog.start()
+    rcm_win.first_painted.connect(lambda: on_startup_done(app, args.startup_budget, args.warm_up))
+    exit_code = app.exec_()
+    # the log pane and its timer are destroyed with the window
+    logger.removeHandler(rcm_win.main_widget.text_log_handler)
+    rcm_win.main_widget.text_log_handler.close()
+    if watchdog is not None:
+        watchdog.stop()
+        watchdog.report(logger)
+    event_loop.stop()
+    tunnel_manager.stop()
+    ssh_pool.close_all()
+    # after closing the connections, which unblocks the workers using them
+    if not stop_workers():
+        logger.warning("Exiting with workers still running")
+    if not flush_jobs(30):
+        logger.warning("Exiting with job updates not saved yet")
+    if metrics.enabled and os.environ.get('RCM_METRICS_FILE'):
+        metrics.write(os.environ['RCM_METRICS_FILE'])
+    sys.exit(exit_code)
@@ -1,29 +1,89 @@
 # -*- mode: python -*-
 
+# Build profile, selected through the environment:
+#   RCM_BUILD=onefile    single executable, unpacked in a temp dir at every launch (default)
+#   RCM_BUILD=onefolder  directory with the binaries and the precompiled modules
+#                        already unpacked, faster to launch
+#   RCM_UPX=0            do not compress the binaries with upx
+# The icons are embedded as a Qt resource if icons_rc.py has been
+# generated with: pyrcc5 icons.qrc -o icons_rc.py
+
+import os
+
+build_profile = os.environ.get('RCM_BUILD', 'onefile')
+use_upx = os.environ.get('RCM_UPX', '1') == '1'
+use_qrc = os.path.exists(os.path.join(SPECPATH, 'icons_rc.py'))
+
 block_cipher = None
 
+# python modules of PyQt5 not used by RCM
+qt_excludes = ['PyQt5.QtBluetooth', 'PyQt5.QtDesigner', 'PyQt5.QtHelp',
+               'PyQt5.QtLocation', 'PyQt5.QtMultimedia', 'PyQt5.QtMultimediaWidgets',
+               'PyQt5.QtNetwork', 'PyQt5.QtNfc', 'PyQt5.QtOpenGL',
+               'PyQt5.QtPositioning', 'PyQt5.QtQml', 'PyQt5.QtQuick',
+               'PyQt5.QtQuickWidgets', 'PyQt5.QtSensors', 'PyQt5.QtSerialPort',
+               'PyQt5.QtSql', 'PyQt5.QtSvg', 'PyQt5.QtTest',
+               'PyQt5.QtWebChannel', 'PyQt5.QtWebEngine', 'PyQt5.QtWebEngineCore',
+               'PyQt5.QtWebEngineWidgets', 'PyQt5.QtWebSockets', 'PyQt5.QtXml',
+               'PyQt5.QtXmlPatterns', 'tkinter']
+
+# Qt plugin directories not used by RCM, the png images are decoded by QtGui
+qt_plugin_excludes = ['audio', 'bearer', 'generic', 'geoservices', 'iconengines',
+                      'imageformats', 'mediaservice', 'playlistformats',
+                      'position', 'printsupport', 'sceneparser', 'sensors',
+                      'sqldrivers', 'webview']
+
+
+def is_unused_qt_file(dest_name):
+    parts = dest_name.replace('\\', '/').split('/')
+    if 'translations' in parts:
+        return True
+    return 'plugins' in parts and parts[parts.index('plugins') + 1:][:1] and \
+        parts[parts.index('plugins') + 1] in qt_plugin_excludes
+
 
 a = Analysis(['rcm.py'],
-             pathex=['/home/pini/alternanza_scuola_lavoro2018-master/Task4/qt'],
+             pathex=[SPECPATH],
              binaries=[],
-             datas=[('icons/*.png','icons')],
+             datas=[] if use_qrc else [('icons/*.png', 'icons')],
              hiddenimports=[],
              hookspath=[],
              runtime_hooks=[],
-             excludes=[],
+             excludes=qt_excludes,
              win_no_prefer_redirects=False,
              win_private_assemblies=False,
-             cipher=block_cipher)
+             cipher=block_cipher,
+             noarchive=build_profile == 'onefolder')
+a.binaries = TOC([entry for entry in a.binaries if not is_unused_qt_file(entry[0])])
+a.datas = TOC([entry for entry in a.datas if not is_unused_qt_file(entry[0])])
 pyz = PYZ(a.pure, a.zipped_data,
              cipher=block_cipher)
-exe = EXE(pyz,
-          a.scripts,
-          a.binaries,
-          a.zipfiles,
-          a.datas,
-          name='rcm',
-          debug=False,
-          strip=False,
-          upx=True,
-          runtime_tmpdir=None,
-          console=True )
+
+if build_profile == 'onefolder':
+    exe = EXE(pyz,
+              a.scripts,
+              exclude_binaries=True,
+              name='rcm',
+              debug=False,
+              strip=False,
+              upx=use_upx,
+              console=True )
+    coll = COLLECT(exe,
+                   a.binaries,
+                   a.zipfiles,
+                   a.datas,
+                   strip=False,
+                   upx=use_upx,
+                   name='rcm')
+else:
+    exe = EXE(pyz,
+              a.scripts,
+              a.binaries,
+              a.zipfiles,
+              a.datas,
+              name='rcm',
+              debug=False,
+              strip=False,
+              upx=use_upx,
+              runtime_tmpdir=None,
+              console=True )
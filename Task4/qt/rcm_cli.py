@@ -0,0 +1,265 @@
+# std lib
+import sys
+import json
+import time
+import signal
+import asyncio
+import getpass
+import logging
+import itertools
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Command line client of RCM, for the bulk operations on many hosts.
+# It uses only rcm_core, PyQt5 is not needed.
+#
+# Usage: python rcm_cli.py list user@host1 user@host2:2222
+#        python rcm_cli.py submit user@host1 user@host2 --name viz --queue 4core_18gb_1h_slurm
+#        python rcm_cli.py kill user@host1/viz 'user@host2/*'
+#        python rcm_cli.py tunnel user@host1/viz
+#
+# The sessions are handled --parallel at a time. The ssh agent and the
+# key files are tried first, --ask-password prompts once for a password
+# used for all the hosts. The exit status is 1 if an operation failed.
+
+# local includes
+from rcm_core import Session, RCMError, DEFAULT_CATALOG, parse_session_name
+from ssh import ssh_pool, is_authentication_error
+from tunnel import tunnel_manager
+from logger import logger, formatter, configure_file_logging
+
+
+def parse_targets(targets, with_display):
+    """
+    :param targets: list of user@host[:port] or user@host[:port]/display
+    :param with_display: if true the display names are required
+    :return: dictionary (host, port, user) -> list of the display names,
+             in the order of the targets
+    """
+    sessions = {}
+    for target in targets:
+        session_name, _, name = target.partition('/')
+        if with_display and not name:
+            raise ValueError("Missing the display name in " + target)
+        names = sessions.setdefault(parse_session_name(session_name), [])
+        if name and name not in names:
+            names.append(name)
+    return sessions
+
+
+class BulkRunner(object):
+    """
+    Run an operation on many sessions, at most parallel sessions at a time.
+    Each operation gets a logged in Session and returns a list of result
+    dictionaries, a failure is reported as a result with an error.
+    """
+
+    def __init__(self, parallel=8, password=None):
+        self.parallel = parallel
+        self.password = password
+
+        # the sessions run, logged out by close
+        self.sessions = []
+
+        # the logins block, they run on their own threads
+        self._executor = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="rcm-login")
+        self._semaphore = None
+
+    async def run(self, sessions, operation):
+        """
+        :param sessions: dictionary (host, port, user) -> display names
+        :param operation: coroutine function (session, names) -> list of results
+        :return: the results of all the sessions, in the order of the sessions
+        """
+        self._semaphore = asyncio.Semaphore(self.parallel)
+        self.sessions = [Session(*key) for key in sessions]
+        results = await asyncio.gather(*[self._run_one(session, names, operation)
+                                         for session, names in zip(self.sessions,
+                                                                   sessions.values())])
+        return [result for session_results in results for result in session_results]
+
+    async def _run_one(self, session, names, operation):
+        loop = asyncio.get_event_loop()
+        async with self._semaphore:
+            start = time.time()
+            try:
+                await loop.run_in_executor(self._executor, session.login, self.password)
+            except Exception as e:
+                if is_authentication_error(e):
+                    message = "invalid credentials"
+                else:
+                    message = str(e) or e.__class__.__name__
+                return [{'session': session.key, 'error': "Failed to login: " + message}]
+            logger.debug("Logged in " + session.name + " in %.2fs" % (time.time() - start))
+
+            try:
+                return await operation(session, names)
+            except Exception as e:
+                return [{'session': session.key, 'error': str(e) or e.__class__.__name__}]
+
+    def close(self):
+        """
+        Close the tunnels and the connections of the sessions
+        """
+        for session in self.sessions:
+            session.logout()
+        self._executor.shutdown(wait=False)
+
+
+async def list_displays(session, names):
+    displays = await session.list_displays()
+    return [dict(display, session=session.key) for display in displays
+            if not names or display['name'] in names]
+
+
+def submit_operation(name, queue, vnc, size):
+    async def submit(session, names):
+        try:
+            job = await session.submit_display(name, queue, vnc, size)
+        except RCMError as e:
+            return [{'session': session.key, 'name': name, 'error': str(e)}]
+        return [{'session': session.key, 'name': name, 'job_id': job.job_id,
+                 'status': job.state}]
+    return submit
+
+
+async def kill_displays(session, names):
+    if '*' in names:
+        names = [display['name'] for display in await session.list_displays()]
+
+    async def kill(name):
+        try:
+            await session.kill_display(name)
+        except RCMError as e:
+            return {'session': session.key, 'name': name, 'error': str(e)}
+        return {'session': session.key, 'name': name, 'status': "Killed"}
+    return list(await asyncio.gather(*[kill(name) for name in names]))
+
+
+def tunnel_operation(local_port):
+    # the local ports are given in the order the tunnels are opened
+    local_ports = itertools.count(local_port) if local_port else itertools.repeat(0)
+
+    async def open_tunnels(session, names):
+        endpoints = dict((display['name'], display['endpoint'])
+                         for display in await session.list_displays())
+        results = []
+        for name in names:
+            endpoint = endpoints.get(name)
+            if endpoint is None:
+                message = "unknown display" if name not in endpoints else "vnc server not running yet"
+                results.append({'session': session.key, 'name': name, 'error': message})
+                continue
+            tunnel = session.open_tunnel(name, endpoint[0], endpoint[1], next(local_ports))
+            results.append({'session': session.key, 'name': name,
+                            'endpoint': "%s:%d" % endpoint,
+                            'local_port': tunnel.local_port})
+        return results
+    return open_tunnels
+
+
+def print_results(results, columns, as_json):
+    if as_json:
+        print(json.dumps(results, indent=1))
+        return
+
+    for result in results:
+        if 'error' in result:
+            target = result['session'] + ("/" + result['name'] if 'name' in result else "")
+            sys.stderr.write(target + ": " + result['error'] + "\n")
+            continue
+        fields = []
+        for column in columns:
+            value = result.get(column)
+            if isinstance(value, (list, tuple)):
+                value = "%s:%d" % tuple(value)
+            fields.append("" if value is None else str(value))
+        print("  ".join(fields))
+
+
+def wait_for_interrupt():
+    """
+    Keep the tunnels open until Ctrl+C or SIGTERM
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Remote Connection Manager command line")
+    arg_parser.add_argument('--parallel', type=int, default=8,
+                            help="sessions handled at the same time")
+    arg_parser.add_argument('--ask-password', action='store_true',
+                            help="prompt once for the password of all the hosts")
+    arg_parser.add_argument('--json', action='store_true', help="print the results as json")
+    arg_parser.add_argument('--verbose', action='store_true', help="log to stderr")
+    commands = arg_parser.add_subparsers(dest='command')
+    commands.required = True
+
+    list_parser = commands.add_parser('list', help="list the displays")
+    list_parser.add_argument('targets', nargs='+', metavar='user@host[:port][/display]')
+
+    submit_parser = commands.add_parser('submit', help="submit a display on each host")
+    submit_parser.add_argument('targets', nargs='+', metavar='user@host[:port]')
+    submit_parser.add_argument('--name', required=True, help="display name")
+    submit_parser.add_argument('--queue', default=DEFAULT_CATALOG['queues'][0])
+    submit_parser.add_argument('--vnc', default=DEFAULT_CATALOG['vnc'][0])
+    submit_parser.add_argument('--size', default="1920x1080")
+
+    kill_parser = commands.add_parser('kill', help="kill the displays, * for all")
+    kill_parser.add_argument('targets', nargs='+', metavar='user@host[:port]/display')
+
+    tunnel_parser = commands.add_parser('tunnel',
+                                        help="forward local ports to the displays until Ctrl+C")
+    tunnel_parser.add_argument('targets', nargs='+', metavar='user@host[:port]/display')
+    tunnel_parser.add_argument('--local-port', type=int, default=0,
+                               help="first local port, by default free ones are picked")
+    args = arg_parser.parse_args()
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(formatter)
+    handler.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    logger.addHandler(handler)
+    configure_file_logging()
+
+    try:
+        sessions = parse_targets(args.targets, args.command in ('kill', 'tunnel'))
+    except ValueError as e:
+        arg_parser.error(str(e))
+
+    password = getpass.getpass("Password: ") if args.ask_password else None
+    runner = BulkRunner(max(1, args.parallel), password)
+
+    if args.command == 'list':
+        operation = list_displays
+        columns = ('session', 'name', 'status', 'time', 'resources', 'endpoint')
+    elif args.command == 'submit':
+        operation = submit_operation(args.name, args.queue, args.vnc, args.size)
+        columns = ('session', 'name', 'job_id', 'status')
+    elif args.command == 'kill':
+        operation = kill_displays
+        columns = ('session', 'name', 'status')
+    else:
+        operation = tunnel_operation(args.local_port)
+        columns = ('session', 'name', 'endpoint', 'local_port')
+
+    results = asyncio.run(runner.run(sessions, operation))
+    print_results(results, columns, args.json)
+    sys.stdout.flush()
+
+    failed = any('error' in result for result in results)
+    if args.command == 'tunnel' and any('local_port' in result for result in results):
+        wait_for_interrupt()
+
+    runner.close()
+    tunnel_manager.stop()
+    ssh_pool.close_all()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,556 @@
+# std lib
+import os
+import re
+import json
+import time
+import shlex
+import getpass
+import tempfile
+import contextlib
+
+# local includes
+import metrics
+from ssh import ssh_pool, ssh_login, ssh_logout
+from remote_engine import RemoteCommandEngine
+from tunnel import tunnel_manager
+from logger import logger
+
+# The session logic of RCM without Qt: the remote commands and their
+# parsers, the display jobs and the Session API used both by the tabs of
+# the gui and by the command line, see rcm_cli.py.
+# This module and its imports must not import PyQt5.
+
+
+class RCMError(Exception):
+    """
+    A remote operation failed on the cluster side
+    """
+
+
+# ---------------------------------------------------------------- displays
+
+# comment given to the display jobs at submission, the other jobs of the
+# user are neither listed nor cancelled
+JOB_COMMENT = "rcm"
+
+# one line per job of the user: name|state|time left|nodes|comment,
+# followed by the markers written by the jobs once their vnc server is up
+STATUS_COMMAND = "squeue -h -u {user} -o '%j|%T|%L|%D|%k' && " \
+                 "{{ cat ~/.rcm/displays/*.vnc 2>/dev/null; true; }}"
+
+# job states that make the poller refresh at the fastest rate
+BUSY_STATES = ("PENDING", "CONFIGURING")
+
+
+def parse_status(output):
+    """
+    Parse the output of STATUS_COMMAND, keeping only the display jobs
+    :return: dictionary display name -> dictionary of the label texts
+    """
+    statuses = {}
+    for line in output.splitlines():
+        fields = line.strip().split('|')
+        if len(fields) != 5 or fields[4] != JOB_COMMENT:
+            continue
+        name, state, time_left, nodes, _ = fields
+        statuses[name] = {'status': state.capitalize(),
+                          'time': time_left,
+                          'resources': nodes + (" Node" if nodes == "1" else " Nodes")}
+    return statuses
+
+
+def parse_endpoints(output):
+    """
+    Parse the vnc markers in the output of STATUS_COMMAND, one line per
+    running vnc server: vnc|name|node|port
+    :return: dictionary display name -> (node, port)
+    """
+    endpoints = {}
+    for line in output.splitlines():
+        fields = line.strip().split('|')
+        if len(fields) != 4 or fields[0] != 'vnc':
+            continue
+        try:
+            endpoints[fields[1]] = (fields[2], int(fields[3]))
+        except ValueError:
+            continue
+    return endpoints
+
+
+# ---------------------------------------------------------------- catalog
+
+# the queues and the wm+vnc flavours offered by the cluster, listed with
+# a single remote command, one section per list
+CATALOG_COMMAND = "echo '[queues]'; ls -1 ${RCM_CONFIG_DIR:-/etc/rcm}/queues; " \
+                  "echo '[vnc]'; ls -1 ${RCM_CONFIG_DIR:-/etc/rcm}/vnc"
+
+# used until the first answer of a host arrives
+DEFAULT_CATALOG = {'queues': ["12core_40gb_3h_slurm",
+                              "4core_18gb_1h_slurm",
+                              "4core_18gb_3h_slurm"],
+                   'vnc': ["fluxbox_turbovnc",
+                           "xfce_singularity_turbovnc"]}
+
+
+def parse_catalog(output):
+    """
+    Parse the output of CATALOG_COMMAND
+    :return: dictionary list name -> entries, without the empty lists
+    """
+    catalog = {}
+    section = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith('[') and line.endswith(']'):
+            section = line[1:-1]
+        elif line and section is not None:
+            catalog.setdefault(section, []).append(line)
+    return catalog
+
+
+# ---------------------------------------------------------------- jobs
+
+# states of a display job, the texts are shown in the status column
+SUBMITTING = "Submitting"
+PENDING = "Pending"
+RUNNING = "Running"
+VNC_READY = "VNC ready"
+FAILED = "Failed"
+FINISHED = "Finished"
+
+# allowed transitions, the terminal states have none
+TRANSITIONS = {SUBMITTING: (PENDING, RUNNING, VNC_READY, FAILED),
+               PENDING: (RUNNING, VNC_READY, FAILED, FINISHED),
+               RUNNING: (VNC_READY, FAILED, FINISHED),
+               VNC_READY: (FAILED, FINISHED)}
+
+# scheduler states reported by the poller
+SCHEDULER_STATES = {"Pending": PENDING,
+                    "Configuring": PENDING,
+                    "Running": RUNNING}
+
+# scheduler states of the jobs that ended, "Finished" is reported by the
+# poller when the job left the queue. The other states, like Completing
+# or Suspended, are transient and leave the job state unchanged.
+END_STATES = ("Boot_fail", "Cancelled", "Completed", "Deadline", "Failed", "Node_fail",
+              "Out_of_memory", "Preempted", "Timeout", "Finished")
+
+# window manager started by each wm+vnc flavour
+WINDOW_MANAGERS = {'fluxbox': "fluxbox",
+                   'xfce': "startxfce4"}
+
+# the batch job starts a vnc server on the first free display and writes
+# the marker read by the display poller, which is removed when the job ends
+JOB_SCRIPT = """#!/bin/bash
+#SBATCH --job-name={name}
+#SBATCH --comment={comment}
+#SBATCH --nodes=1
+#SBATCH --cpus-per-task={cpus}
+#SBATCH --mem={memory}
+#SBATCH --time={time}
+#SBATCH --output=.rcm/displays/{name}.log
+marker=~/.rcm/displays/{name}.vnc
+for display in $(seq 1 99); do
+    vncserver :$display {vnc_options} > /dev/null 2>&1 || continue
+    trap "vncserver -kill :$display; rm -f $marker" EXIT
+    echo "vnc|{name}|$(hostname)|$((5900 + display))" > $marker
+    while [ -e /tmp/.X11-unix/X$display ]; do sleep 30; done
+    exit 0
+done
+exit 1
+"""
+
+# the ids of the display jobs with the given name
+JOB_IDS_COMMAND = "squeue -h -u {user} -n {name} -o '%i|%k' | sed -n 's/|" + JOB_COMMENT + "$//p'"
+
+# submit the job unless one with the same name is already queued, so that
+# a submission interrupted by a client restart can be safely repeated
+SUBMIT_COMMAND = "id=$(" + JOB_IDS_COMMAND + " | head -n 1)" + """
+if [ -n "$id" ]; then echo "$id"; exit 0; fi
+mkdir -p ~/.rcm/displays
+sbatch --parsable <<'RCM_JOB_SCRIPT'
+{script}RCM_JOB_SCRIPT
+"""
+
+CANCEL_COMMAND = "for id in $(" + JOB_IDS_COMMAND + "); do scancel $id; done; " \
+                 "rm -f ~/.rcm/displays/{name}.vnc"
+
+
+def parse_queue(queue):
+    """
+    Read the resources from a queue name like 12core_40gb_3h_slurm
+    :return: cpus, memory and time limit in the sbatch format
+    """
+    match = re.match(r'(\d+)core_(\d+)gb_(\d+)h', queue)
+    if match is None:
+        raise ValueError("Unknown queue " + queue)
+    cpus, memory, hours = match.groups()
+    return int(cpus), memory + "G", hours + ":00:00"
+
+
+def vnc_options(vnc, size):
+    """
+    :param vnc: wm+vnc flavour like fluxbox_turbovnc
+    :param size: display size like 1920x1080 or full_screen
+    :return: options of the vncserver command
+    """
+    window_manager = WINDOW_MANAGERS.get(vnc.split('_')[0], vnc.split('_')[0])
+    options = "-wm " + window_manager
+    if re.match(r'^\d+x\d+$', size):
+        options += " -geometry " + size
+    return options
+
+
+def submit_command(user, name, queue, vnc, size):
+    # the name is used as job name and in the marker file name
+    if not re.match(r'^[\w.-]+$', name):
+        raise ValueError("Invalid display name " + name)
+    cpus, memory, time = parse_queue(queue)
+    script = JOB_SCRIPT.format(name=name, comment=JOB_COMMENT, cpus=cpus, memory=memory, time=time,
+                               vnc_options=vnc_options(vnc, size))
+    return SUBMIT_COMMAND.format(user=shlex.quote(user), name=shlex.quote(name), script=script)
+
+
+class Job(object):
+    """
+    A display job and the choices it was submitted with
+    """
+
+    def __init__(self, name, queue, vnc, size, state=SUBMITTING, job_id=None, endpoint=None):
+        self.name = name
+        self.queue = queue
+        self.vnc = vnc
+        self.size = size
+        self.state = state
+        self.job_id = job_id
+        self.endpoint = endpoint
+
+    def is_active(self):
+        return self.state in TRANSITIONS
+
+    def to_dict(self):
+        return {'name': self.name,
+                'queue': self.queue,
+                'vnc': self.vnc,
+                'size': self.size,
+                'state': self.state,
+                'job_id': self.job_id,
+                'endpoint': self.endpoint}
+
+    @staticmethod
+    def from_dict(data):
+        endpoint = data.get('endpoint')
+        return Job(data['name'], data['queue'], data['vnc'], data['size'],
+                   data.get('state', SUBMITTING), data.get('job_id'),
+                   tuple(endpoint) if endpoint else None)
+
+
+class JobStore(object):
+    """
+    The active jobs of all the sessions, saved in ~/.rcm/jobs.json so that
+    a restarted client reattaches to them instead of submitting them again.
+    The gui and the command line can run at the same time: every update
+    re-reads the file and changes only its job, under a lock file.
+    """
+
+    def __init__(self, file_name=None, lock_timeout=10):
+        """
+        :param lock_timeout: seconds waited for the lock file, an older
+                             one was left by a client that crashed
+        """
+        self.file_name = file_name or \
+            os.path.join(os.path.expanduser('~'), '.rcm', 'jobs.json')
+        self.lock_file_name = self.file_name + '.lock'
+        self.lock_timeout = lock_timeout
+        self.jobs = {}
+
+    def load(self, session):
+        """
+        :param session: user@host:port
+        :return: dictionary name -> Job of the active jobs of the session
+        """
+        self.jobs = self._read()
+        return dict((name, Job.from_dict(data))
+                    for name, data in self.jobs.get(session, {}).items())
+
+    def update(self, session, job):
+        """
+        Save the job, or forget it if it is not active anymore
+        """
+        with self._locked():
+            self.jobs = self._read()
+            jobs = self.jobs.get(session, {})
+            if job.is_active():
+                jobs[job.name] = job.to_dict()
+            elif jobs.pop(job.name, None) is None:
+                return
+            if jobs:
+                self.jobs[session] = jobs
+            else:
+                self.jobs.pop(session, None)
+            self.save()
+
+    @metrics.timed('io.jobs.save')
+    def save(self):
+        jobs_dir = os.path.dirname(self.file_name)
+        try:
+            if not os.path.exists(jobs_dir):
+                os.makedirs(jobs_dir)
+            fd, tmp_file_name = tempfile.mkstemp(dir=jobs_dir, prefix='.jobs.json.')
+            with os.fdopen(fd, 'w') as jobs_file:
+                json.dump(self.jobs, jobs_file, indent=1)
+            os.replace(tmp_file_name, self.file_name)
+        except (IOError, OSError):
+            logger.error("Failed to save the jobs in " + self.file_name)
+
+    def _read(self):
+        """
+        :return: the jobs of all the sessions in the file, the file is
+                 replaced atomically so no lock is needed to read it
+        """
+        try:
+            with metrics.timer('io.jobs.load'), open(self.file_name, 'r') as jobs_file:
+                return json.load(jobs_file)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            logger.error("Failed to load the jobs from " + self.file_name)
+            return {}
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        Hold the lock file, created exclusively so that it works on every
+        platform and file system
+        """
+        deadline = time.time() + self.lock_timeout
+        locked = False
+        while True:
+            try:
+                os.makedirs(os.path.dirname(self.lock_file_name), exist_ok=True)
+                os.close(os.open(self.lock_file_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                locked = True
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_file_name) > self.lock_timeout:
+                        logger.warning("Removing the stale lock " + self.lock_file_name)
+                        os.remove(self.lock_file_name)
+                        continue
+                except OSError:
+                    continue
+            except OSError:
+                logger.error("Failed to create the lock " + self.lock_file_name)
+                break
+            if time.time() > deadline:
+                logger.error("Timed out waiting for the lock " + self.lock_file_name)
+                break
+            time.sleep(0.01)
+
+        try:
+            yield
+        finally:
+            if locked:
+                try:
+                    os.remove(self.lock_file_name)
+                except OSError:
+                    pass
+
+
+job_store = JobStore()
+
+
+# ---------------------------------------------------------------- sessions
+
+
+def parse_session_name(session_name, default_port=22):
+    """
+    :param session_name: [user@]host[:port]
+    :return: hostname, port and username, the local user if it is missing
+    """
+    username, _, address = session_name.rpartition('@')
+    hostname, _, port = address.partition(':')
+    if not hostname:
+        raise ValueError("Invalid session " + session_name)
+    return hostname, int(port) if port else default_port, username or getpass.getuser()
+
+
+class Session(object):
+    """
+    A connection to a cluster and the displays of the user on it.
+    login and logout block, the remote operations are coroutines run by
+    the RemoteCommandEngine of the session.
+    """
+
+    def __init__(self, hostname, port=22, username=None):
+        self.hostname = hostname
+        self.port = port
+        self.username = username or getpass.getuser()
+
+        # runs the remote commands, once logged in
+        self.engine = None
+
+        # display name -> open Tunnel to its vnc server
+        self.tunnels = {}
+
+    @property
+    def name(self):
+        return self.username + "@" + self.hostname
+
+    @property
+    def key(self):
+        """
+        :return: user@host:port, the key of the session jobs in the job store
+        """
+        return self.name + ":" + str(self.port)
+
+    def login(self, password=None, command=None, progress=None):
+        """
+        Authenticate with the agent, the key files or the password.
+        Without a password the one cached by the pool is tried.
+        :param command: optional command run once logged in, its output goes to the log
+        :return: the session itself
+        """
+        if self.engine is not None:
+            return self
+        # ssh_login releases the connection itself if the command fails
+        if command is None:
+            ssh_pool.acquire(self.hostname, self.port, self.username, password, progress)
+        else:
+            ssh_login(self.hostname, self.port, self.username, password, command, progress)
+        try:
+            self.engine = RemoteCommandEngine(self.hostname, self.port, self.username)
+        except Exception:
+            ssh_logout(self.hostname, self.port, self.username)
+            raise
+        return self
+
+    def logout(self):
+        """
+        Close the tunnels and release the connection, the displays keep running
+        """
+        for name in list(self.tunnels):
+            self.close_tunnel(name)
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+            ssh_logout(self.hostname, self.port, self.username)
+            logger.debug("Closed session " + self.name)
+
+    def transport(self):
+        return ssh_pool.get_transport(self.hostname, self.port, self.username)
+
+    async def run(self, command, timeout=None):
+        """
+        :return: the CommandResult of the command
+        """
+        return await self.engine.run(command, timeout)
+
+    async def list_displays(self):
+        """
+        :return: list of dictionaries with name, status, time, resources and
+                 endpoint of the display jobs of the user, the endpoint is
+                 None until the vnc server is up
+        """
+        result = await self.run(STATUS_COMMAND.format(user=shlex.quote(self.username)),
+                                timeout=60)
+        if not result.ok():
+            raise RCMError("Failed to list the displays of " + self.name + ": " +
+                           result.stderr.strip())
+
+        endpoints = parse_endpoints(result.stdout)
+        displays = []
+        for name, status in sorted(parse_status(result.stdout).items()):
+            display = dict(status, name=name, endpoint=endpoints.get(name))
+            displays.append(display)
+        return displays
+
+    async def catalog(self):
+        """
+        :return: the queues and wm+vnc flavours of the cluster, empty if it has none
+        """
+        result = await self.run(CATALOG_COMMAND, timeout=60)
+        catalog = parse_catalog(result.stdout)
+        if not any(catalog.get(key) for key in DEFAULT_CATALOG):
+            logger.debug("No catalog on " + self.hostname + ": " + result.stderr.strip())
+            return {}
+        return catalog
+
+    async def submit(self, job):
+        """
+        Submit the job, or find it if it is already queued
+        :return: the scheduler id of the job
+        """
+        try:
+            command = submit_command(self.username, job.name, job.queue, job.vnc, job.size)
+        except ValueError as e:
+            raise RCMError(str(e))
+
+        logger.debug("Submitting display " + job.name + " on " + job.queue)
+        result = await self.run(command, timeout=120)
+        job_id = result.stdout.strip().split(';')[0]
+        if not result.ok() or not job_id.isdigit():
+            raise RCMError("Failed to submit display " + job.name + ": " + result.stderr.strip())
+        logger.info("Submitted display " + job.name + " as job " + job_id)
+        return int(job_id)
+
+    async def submit_display(self, name, queue, vnc, size):
+        """
+        Submit a new display and record it in the job store, so that the
+        gui picks it up at the next login
+        :return: the Job
+        """
+        job = Job(name, queue, vnc, size)
+        job_store.update(self.key, job)
+        try:
+            job.job_id = await self.submit(job)
+        except RCMError:
+            job.state = FAILED
+            job_store.update(self.key, job)
+            raise
+        job.state = PENDING
+        job_store.update(self.key, job)
+        return job
+
+    async def cancel(self, name):
+        """
+        Cancel the job of the display, its tunnel is closed by the caller
+        """
+        result = await self.run(CANCEL_COMMAND.format(user=shlex.quote(self.username),
+                                                      name=shlex.quote(name)),
+                                timeout=60)
+        if not result.ok():
+            raise RCMError("Failed to cancel display " + name + ": " + result.stderr.strip())
+        logger.info("Cancelled display " + name)
+
+    async def kill_display(self, name):
+        """
+        Cancel the display and forget it in the job store
+        """
+        await self.cancel(name)
+        job_store.update(self.key, Job(name, "", "", "", FINISHED))
+
+    def open_tunnel(self, name, node, port, local_port=0):
+        """
+        Forward a local port to the vnc server of the display
+        :return: the Tunnel, the one already open if any
+        """
+        tunnel = self.tunnels.get(name)
+        if tunnel is None:
+            tunnel = tunnel_manager.open_tunnel(self.transport(), node, port, local_port)
+            self.tunnels[name] = tunnel
+        return tunnel
+
+    def close_tunnel(self, name):
+        tunnel = self.tunnels.pop(name, None)
+        if tunnel is not None:
+            tunnel_manager.close_tunnel(tunnel)
+
+    def move_tunnels(self):
+        """
+        Open the next connections of the tunnels on the current transport,
+        called after a reconnection
+        """
+        transport = self.transport()
+        for tunnel in self.tunnels.values():
+            tunnel_manager.set_transport(tunnel, transport)
@@ -0,0 +1,210 @@
+# std lib
+import asyncio
+import threading
+import concurrent.futures
+
+# local includes
+import metrics
+from ssh import ssh_pool, RemoteCommandTimeout
+from logger import logger
+
+
+class CommandResult(object):
+    """
+    Outcome of a remote command run by the engine
+    """
+
+    def __init__(self, command, exit_status, stdout, stderr):
+        self.command = command
+        self.exit_status = exit_status
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def ok(self):
+        return self.exit_status == 0
+
+
+class AsyncLoopThread(object):
+    """
+    Run an asyncio event loop on a daemon thread, so that the gui thread
+    and the worker threads can schedule coroutines on it
+    """
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._run,
+                                            name="rcm-asyncio",
+                                            daemon=True)
+            self._thread.start()
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the loop
+        :return: a concurrent.futures.Future with the coroutine result
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        with self._lock:
+            if self.loop is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            # the coroutines still pending are cancelled and run to their
+            # end here, as asyncio.run does, instead of being destroyed pending
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks, timeout=5))
+            self.loop.close()
+            self.loop = None
+            self._thread = None
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+event_loop = AsyncLoopThread()
+
+
+class RemoteCommandEngine(object):
+    """
+    Run many remote commands concurrently on one authenticated connection.
+    Every command gets its own channel of the pooled transport, the blocking
+    paramiko calls are driven by a bounded executor and the output is
+    streamed to the coroutines as it arrives.
+    """
+
+    def __init__(self, hostname, port, username,
+                 max_concurrency=8, chunk_size=32768, queue_size=16):
+        """
+        :param max_concurrency: maximum number of commands running at the same time
+        :param chunk_size: maximum size of the streamed output chunks
+        :param queue_size: number of chunks buffered before the reader waits for the consumer
+        """
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+
+        self._semaphore = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency,
+                                                               thread_name_prefix="rcm-channel")
+
+    async def stream(self, command, timeout=None):
+        """
+        Run a command and yield its output as soon as it arrives.
+        The items are ('stdout', bytes) and ('stderr', bytes) tuples,
+        the last one is ('exit', exit_status).
+        :param timeout: seconds allowed for the whole command, None to wait forever
+        """
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            deadline = None if timeout is None else loop.time() + timeout
+            stream = await loop.run_in_executor(self._executor, ssh_pool.exec_stream,
+                                                self.hostname, self.port, self.username,
+                                                command, None, self.chunk_size)
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            stop = threading.Event()
+
+            try:
+                reader = loop.run_in_executor(self._executor, self._read_stream,
+                                              stream, queue, loop, stop)
+                while True:
+                    remaining = None if deadline is None else deadline - loop.time()
+                    if remaining is not None and remaining <= 0:
+                        raise RemoteCommandTimeout(command)
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        raise RemoteCommandTimeout(command)
+
+                    yield item
+                    if item[0] == 'exit':
+                        break
+                await reader
+            finally:
+                # unblock the reader if it is waiting for room in the queue
+                stop.set()
+                stream.close()
+                while not queue.empty():
+                    queue.get_nowait()
+
+    async def run(self, command, timeout=None):
+        """
+        Run a command and collect its whole output
+        :return: a CommandResult
+        """
+        stdout = []
+        stderr = []
+        exit_status = None
+        with metrics.timer('remote.command'):
+            async for name, data in self.stream(command, timeout):
+                if name == 'stdout':
+                    stdout.append(data)
+                elif name == 'stderr':
+                    stderr.append(data)
+                else:
+                    exit_status = data
+
+        logger.debug("Remote command '" + command + "' exited with " + str(exit_status))
+        return CommandResult(command,
+                             exit_status,
+                             b''.join(stdout).decode('utf-8', 'replace'),
+                             b''.join(stderr).decode('utf-8', 'replace'))
+
+    async def run_many(self, commands, timeout=None):
+        """
+        Run the commands concurrently, within the concurrency limit
+        :return: the list of the CommandResult, in the same order of the commands
+        """
+        return await asyncio.gather(*[self.run(command, timeout) for command in commands])
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _read_stream(self, stream, queue, loop, stop):
+        """
+        Move the command output to the queue, runs on the executor.
+        Waiting for room in the queue throttles the remote side through the
+        ssh window, so a slow consumer does not buffer the output in memory.
+        """
+        def put(item):
+            """
+            :return: False if the consumer is gone or the loop was stopped
+            """
+            try:
+                future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            except RuntimeError:
+                # the loop is closed
+                return False
+            # the loop may stop before running the put, it is checked every 0.5s
+            while not stop.is_set() and loop.is_running():
+                try:
+                    future.result(0.5)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+            return False
+
+        for item in stream.chunks():
+            if stop.is_set() or not put(item):
+                return
+        put(('exit', stream.exit_status))
@@ -0,0 +1,196 @@
+# std lib
+import io
+import os
+import json
+import tempfile
+import collections
+from configparser import RawConfigParser
+
+# pyqt5
+from PyQt5.QtCore import QObject, QTimer, QFileSystemWatcher, QStringListModel, \
+    Qt, pyqtSlot
+
+# local includes
+import metrics
+from logger import logger
+
+
+class SessionHistory(QObject):
+    """
+    Most recent sessions shared by all the tabs.
+    The config file is parsed once, the changes are written back after a
+    short delay with an atomic rename, and the file is watched to pick up
+    the sessions added by other RCM instances.
+    """
+
+    def __init__(self, config_file_name=None, max_sessions=5, save_delay=500):
+        """
+        :param config_file_name: by default ~/.rcm/RCM2.cfg
+        :param max_sessions: number of sessions remembered
+        :param save_delay: ms waited before writing the changes to the file
+        """
+        super(SessionHistory, self).__init__()
+
+        self.config_file_name = config_file_name or \
+            os.path.join(os.path.expanduser('~'), '.rcm', 'RCM2.cfg')
+        self.max_sessions = max_sessions
+        self.parser = RawConfigParser()
+        self.sessions = collections.deque(maxlen=max_sessions)
+
+        # model shared by the session combos of all the tabs
+        self.model = QStringListModel()
+
+        self._last_written = None
+
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(save_delay)
+        self._save_timer.timeout.connect(self.save)
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self.on_file_changed)
+        self._watcher.directoryChanged.connect(self.on_file_changed)
+
+        self.load()
+        self._watch()
+
+    @metrics.timed('io.session_history.load')
+    def load(self):
+        """
+        Parse the config file to load the most recent sessions
+        """
+        if not os.path.exists(self.config_file_name):
+            return
+
+        try:
+            with open(self.config_file_name, 'r') as config_file:
+                content = config_file.read()
+        except IOError:
+            logger.error("Failed to load the sessions list from the config file")
+            return
+
+        if content == self._last_written:
+            return
+
+        parser = RawConfigParser()
+        try:
+            parser.read_string(content, source=self.config_file_name)
+            sessions = json.loads(parser.get('LoginFields', 'hostList')) \
+                if parser.has_option('LoginFields', 'hostList') else []
+        except Exception:
+            logger.error("Failed to load the sessions list from the config file")
+            return
+
+        if self._save_timer.isActive():
+            # keep the local changes not written yet at the top
+            sessions = list(self.sessions) + [session for session in sessions
+                                              if session not in self.sessions]
+
+        self.parser = parser
+        self.sessions = collections.deque(sessions, maxlen=self.max_sessions)
+        self.model.setStringList(list(self.sessions))
+
+    def add(self, session_name):
+        """
+        Move the session at the top of the list and schedule the file update
+        """
+        if session_name in self.sessions:
+            row = list(self.sessions).index(session_name)
+            if row == 0:
+                return
+            self.sessions.remove(session_name)
+            self.model.removeRows(row, 1)
+        self.sessions.appendleft(session_name)
+
+        self.model.insertRows(0, 1)
+        self.model.setData(self.model.index(0), session_name, Qt.EditRole)
+        if self.model.rowCount() > self.max_sessions:
+            self.model.removeRows(self.max_sessions, self.model.rowCount() - self.max_sessions)
+
+        self._save_timer.start()
+
+    def get(self, section, option, fallback=None):
+        """
+        Read another option of the config file
+        """
+        return self.parser.get(section, option, fallback=fallback)
+
+    def get_int(self, section, option, fallback):
+        """
+        Read an integer option, the fallback is used if the value is not a number
+        """
+        value = self.parser.get(section, option, fallback=fallback)
+        try:
+            return int(value)
+        except ValueError:
+            logger.warning("Invalid " + option + " '" + str(value) +
+                           "' in the config file, using " + str(fallback))
+            return fallback
+
+    @pyqtSlot()
+    @metrics.timed('io.session_history.save')
+    def save(self):
+        """
+        Write the config file to a temporary file and rename it over the old one
+        """
+        self._save_timer.stop()
+
+        if not self.parser.has_section('LoginFields'):
+            self.parser.add_section('LoginFields')
+        self.parser.set('LoginFields', 'hostList', json.dumps(list(self.sessions)))
+
+        config_file_dir = os.path.dirname(self.config_file_name)
+        try:
+            if not os.path.exists(config_file_dir):
+                os.makedirs(config_file_dir)
+
+            content = io.StringIO()
+            self.parser.write(content)
+            content = content.getvalue()
+
+            fd, tmp_file_name = tempfile.mkstemp(dir=config_file_dir, prefix='.RCM2.cfg.')
+            with os.fdopen(fd, 'w') as config_file:
+                config_file.write(content)
+            os.replace(tmp_file_name, self.config_file_name)
+            self._last_written = content
+        except (IOError, OSError):
+            logger.error("failed to dump the session list in the configuration file")
+            return
+
+        # the rename replaced the watched file
+        self._watch()
+
+    def flush(self):
+        """
+        Write the pending changes now, called when the application exits
+        """
+        if self._save_timer.isActive():
+            self.save()
+
+    @pyqtSlot(str)
+    def on_file_changed(self, path):
+        self.load()
+        self._watch()
+
+    def _watch(self):
+        config_file_dir = os.path.dirname(self.config_file_name)
+        if os.path.exists(self.config_file_name) and \
+                self.config_file_name not in self._watcher.files():
+            self._watcher.addPath(self.config_file_name)
+        elif os.path.isdir(config_file_dir) and \
+                config_file_dir not in self._watcher.directories():
+            # wait for the file to be created
+            self._watcher.addPath(config_file_dir)
+
+
+_session_history = None
+
+
+def get_session_history():
+    """
+    :return: the process wide session history
+    """
+    global _session_history
+    if _session_history is None:
+        _session_history = SessionHistory()
+    return _session_history
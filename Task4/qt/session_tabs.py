@@ -0,0 +1,48 @@
+# pyqt5
+from PyQt5.QtWidgets import QTabWidget
+
+
+class QSessionTabWidget(QTabWidget):
+    """
+    Tab widget indexing its session tabs by uuid.
+    The index is updated when a tab is inserted or removed, also when Qt
+    removes the tab of a deleted widget, so finding or closing a session
+    does not scan the tabs. It does not store the tab positions, so moving
+    the tabs cannot make it stale.
+    """
+
+    def __init__(self, parent=None):
+        super(QSessionTabWidget, self).__init__(parent)
+
+        # uuid -> session widget
+        self._widgets = {}
+
+    def session_widget(self, uuid):
+        """
+        :return: the session widget with the uuid, None if it has no tab
+        """
+        return self._widgets.get(uuid)
+
+    def session_widgets(self):
+        """
+        :return: the session widgets of the tabs, in the order they were added
+        """
+        return list(self._widgets.values())
+
+    def tabInserted(self, index):
+        widget = self.widget(index)
+        uuid = getattr(widget, 'uuid', None)
+        if uuid is not None and uuid not in self._widgets:
+            self._widgets[uuid] = widget
+            widget.destroyed.connect(lambda obj=None, uuid=uuid: self._unregister(uuid))
+        QTabWidget.tabInserted(self, index)
+
+    def removeTab(self, index):
+        widget = self.widget(index)
+        QTabWidget.removeTab(self, index)
+        uuid = getattr(widget, 'uuid', None)
+        if uuid is not None and self.indexOf(widget) == -1:
+            self._unregister(uuid)
+
+    def _unregister(self, uuid):
+        self._widgets.pop(uuid, None)
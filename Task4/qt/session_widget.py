@@ -1,23 +1,24 @@
 # python import
-import json
 import uuid
-import os.path
-import collections
-from configparser import RawConfigParser
 
 # pyqt5
-from PyQt5.QtCore import QSize, pyqtSignal
-from PyQt5.QtGui import QIcon, QFont
-from PyQt5.QtWidgets import QWidget, QFrame, QLabel, QComboBox, \
-    QGridLayout, QVBoxLayout, QLineEdit, QHBoxLayout, QPushButton
-
-# paramiko
-from paramiko.ssh_exception import AuthenticationException
+from PyQt5.QtCore import Qt, QModelIndex, QTimer, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QWidget, QLabel, QComboBox, QGridLayout, QVBoxLayout, \
+    QLineEdit, QHBoxLayout, QPushButton, QTableView, QHeaderView, QAbstractItemView
 
 # local includes
-from ssh import ssh_login
+from rcm_core import Session, SUBMITTING, VNC_READY
+from ssh import is_authentication_error
+from worker import Worker, AsyncTask, start_worker, cancel_worker
+from display_poller import get_poller, release_poller
+from job_submission import JobSubmitter
+from catalog import get_catalog
+from connection_supervisor import ConnectionSupervisor
 from display_dialog import QDisplayDialog
-from pyinstaller_utils import resource_path
+from display_model import DisplayTableModel, DisplayButtonDelegate
+import metrics
+from pyinstaller_utils import get_icon
+from session_history import get_session_history
 from logger import logger
 
 
@@ -30,23 +31,54 @@ class QSessionWidget(QWidget):
     # define a signal when the user successful log in
     logged_in = pyqtSignal(str)
 
-    sessions_changed = pyqtSignal(collections.deque)
+    # define a signal when the login fails, with the error message
+    login_failed = pyqtSignal(str)
+
+    # define a signal reporting the progress of the remote operations
+    progress = pyqtSignal(str)
+
+    # define a signal with the health of the connection, see connection_supervisor
+    health_changed = pyqtSignal(str)
 
     def __init__(self, parent):
         super(QWidget, self).__init__(parent)
 
         self.user = ""
-        self.displays = {}
+        self.host = ""
+        self.port = 22
+
+        # rows of the displays, painted by the view
+        self.display_model = DisplayTableModel(self)
+        self.display_view = QTableView(self)
+        self.display_delegate = DisplayButtonDelegate(self.display_view)
+
+        # policy, set by max_displays in the [Settings] section of RCM2.cfg
+        self.max_displays = get_session_history().get_int('Settings', 'max_displays', 5)
 
-        self.config_file_name = os.path.join(os.path.expanduser('~'), '.rcm', 'RCM2.cfg')
-        self.sessions_list = None
-        self.parser = RawConfigParser()
+        # compute node and vnc port of the displays
+        self.display_endpoints = {}
 
         # widgets
         self.session_combo = QComboBox(self)
         self.host_line = QLineEdit(self)
         self.user_line = QLineEdit(self)
         self.pssw_line = QLineEdit(self)
+        self.login_button = QPushButton('Login', self)
+
+        # worker running the login off the gui thread
+        self.login_worker = None
+
+        # the rcm_core.Session running the remote operations once logged in
+        self.session = None
+
+        # shared poller refreshing the display rows
+        self.poller = None
+
+        # submitter of the display jobs
+        self.submitter = None
+
+        # reconnects the session after a network drop
+        self.supervisor = None
 
         # containers
         self.containerLoginWidget = QWidget()
@@ -54,12 +86,6 @@ class QSessionWidget(QWidget):
 
         # layouts
         self.session_ver_layout = QVBoxLayout()
-        self.rows_ver_layout = QVBoxLayout()
-
-        # icons
-        self.connect_ico = QIcon()
-        self.kill_ico = QIcon()
-        self.share_ico = QIcon()
 
         self.init_ui()
 
@@ -74,23 +100,13 @@ class QSessionWidget(QWidget):
     # grid login layout
         grid_login_layout = QGridLayout()
 
-        # parse config file to load the most recent sessions
-        if os.path.exists(self.config_file_name):
-            try:
-                with open(self.config_file_name, 'r') as config_file:
-                    self.parser.read_file(config_file, source=self.config_file_name)
-                    sessions_list = self.parser.get('LoginFields', 'hostList')
-                    self.sessions_list = collections.deque(json.loads(sessions_list), maxlen=5)
-            except:
-                logger.error("Failed to load the sessions list from the config file")
-
+        # the most recent sessions come from the shared history model
         session_label = QLabel(self)
         session_label.setText('Sessions:')
-        self.session_combo.clear()
-        self.session_combo.addItems(self.sessions_list)
+        self.session_combo.setModel(get_session_history().model)
 
         self.session_combo.activated.connect(self.on_session_change)
-        if self.sessions_list:
+        if self.session_combo.count():
             self.session_combo.activated.emit(0)
 
         grid_login_layout.addWidget(session_label, 0, 0)
@@ -116,13 +132,12 @@ class QSessionWidget(QWidget):
         grid_login_layout.addWidget(self.pssw_line, 3, 1)
 
     # hor login layout
-        pybutton = QPushButton('Login', self)
-        pybutton.clicked.connect(self.login)
-        pybutton.setShortcut("Return")
+        self.login_button.clicked.connect(self.login)
+        self.login_button.setShortcut("Return")
 
         login_hor_layout = QHBoxLayout()
         login_hor_layout.addStretch(1)
-        login_hor_layout.addWidget(pybutton)
+        login_hor_layout.addWidget(self.login_button)
         login_hor_layout.addStretch(1)
 
     # login layout
@@ -138,59 +153,36 @@ class QSessionWidget(QWidget):
         new_tab_main_layout.addWidget(self.containerLoginWidget)
 
     # Session Layout
-        plusbutton_layout = QGridLayout()
-        self.rows_ver_layout.setContentsMargins(0, 0, 0, 0)
-        self.rows_ver_layout.setSpacing(0)
-
-        self.session_ver_layout.addLayout(plusbutton_layout)
-        self.session_ver_layout.addLayout(self.rows_ver_layout)
-        self.session_ver_layout.addStretch(1)
-
-        self.connect_ico.addFile(resource_path('icons/connect.png'))
-        self.kill_ico.addFile(resource_path('icons/kill.png'))
-        self.share_ico.addFile(resource_path('icons/share.png'))
-
-        font = QFont()
-        font.setBold(True)
-
-        name = QLabel()
-        name.setText("Name")
-        name.setFont(font)
-        plusbutton_layout.addWidget(name, 0, 0)
-
-        status = QLabel()
-        status.setText("Status")
-        status.setFont(font)
-        plusbutton_layout.addWidget(status, 0, 1)
-
-        time = QLabel()
-        time.setText("Time")
-        time.setFont(font)
-        plusbutton_layout.addWidget(time, 0, 2)
-
-        resources = QLabel()
-        resources.setText("Resources")
-        resources.setFont(font)
-        plusbutton_layout.addWidget(resources, 0, 3)
-
-        x = QLabel()
-        x.setText("")
-        plusbutton_layout.addWidget(x, 0, 4)
-        plusbutton_layout.addWidget(x, 0, 5)
-
-        new_display_ico = QIcon()
-        new_display_ico.addFile(resource_path('icons/plus.png'), QSize(16, 16))
-
         new_display_btn = QPushButton()
-        new_display_btn.setIcon(new_display_ico)
+        new_display_btn.setIcon(get_icon('icons/plus.png'))
         new_display_btn.setToolTip('Create a new display session')
         new_display_btn.clicked.connect(self.add_new_display)
 
         new_display_layout = QHBoxLayout()
-        new_display_layout.addSpacing(100)
+        new_display_layout.addStretch(1)
         new_display_layout.addWidget(new_display_btn)
 
-        plusbutton_layout.addLayout(new_display_layout, 0, 6)
+        # one row per display, only the visible rows are painted
+        self.display_view.setModel(self.display_model)
+        self.display_view.setShowGrid(False)
+        self.display_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.display_view.setFocusPolicy(Qt.NoFocus)
+        self.display_view.verticalHeader().hide()
+        self.display_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.display_view.verticalHeader().setDefaultSectionSize(30)
+
+        header = self.display_view.horizontalHeader()
+        header.setHighlightSections(False)
+        header.setSectionResizeMode(QHeaderView.Stretch)
+        for action in DisplayTableModel.actions:
+            column = DisplayTableModel.actions.index(action) + len(DisplayTableModel.fields)
+            header.setSectionResizeMode(column, QHeaderView.Fixed)
+            header.resizeSection(column, 40)
+            self.display_view.setItemDelegateForColumn(column, self.display_delegate)
+        self.display_delegate.clicked.connect(self.on_display_action)
+
+        self.session_ver_layout.addLayout(new_display_layout)
+        self.session_ver_layout.addWidget(self.display_view)
 
         self.containerSessionWidget.setLayout(self.session_ver_layout)
         new_tab_main_layout.addWidget(self.containerSessionWidget)
@@ -210,32 +202,90 @@ class QSessionWidget(QWidget):
         except ValueError:
             pass
 
+    @pyqtSlot()
+    @metrics.timed('slot.QSessionWidget.login')
     def login(self):
-        session_name = str(self.user_line.text()) + "@" + str(self.host_line.text())
-
-        try:
-            logger.info("Logging into " + session_name)
-            ssh_login(self.host_line.text(),
-                      22,
-                      self.user_line.text(),
-                      self.pssw_line.text(),
-                      'ls')
-        except AuthenticationException:
-            logger.error("Failed to login: invalid credentials")
+        """
+        Start the login on the worker thread pool, the result comes back
+        through on_login_succeeded or on_login_error
+        """
+        if self.login_worker is not None:
             return
 
+        host = str(self.host_line.text())
+        port = self.port
+        user = str(self.user_line.text())
+        session_name = user + "@" + host
+
+        logger.info("Logging into " + session_name)
+        self.login_button.setEnabled(False)
+
+        session = Session(host, port, user)
+        self.login_worker = Worker(session.login,
+                                   str(self.pssw_line.text()),
+                                   'ls',
+                                   with_progress=True)
+        # if the tab is closed during the login we release the connection
+        self.login_worker.on_cancelled = lambda result: session.logout()
+        self.login_worker.signals.progress.connect(self.on_login_progress)
+        self.login_worker.signals.result.connect(self.on_login_succeeded)
+        self.login_worker.signals.error.connect(self.on_login_error)
+        start_worker(self.login_worker)
+
+    @pyqtSlot(str)
+    def on_login_progress(self, message):
+        logger.debug(message)
+        self.progress.emit(message)
+
+    @pyqtSlot(object)
+    @metrics.timed('slot.QSessionWidget.on_login_error')
+    def on_login_error(self, error):
+        self.login_worker = None
+        self.login_button.setEnabled(True)
+
+        if is_authentication_error(error):
+            message = "Failed to login: invalid credentials"
+        else:
+            message = "Failed to login: " + str(error)
+        logger.error(message)
+        self.login_failed.emit(message)
+
+    @pyqtSlot(object)
+    @metrics.timed('slot.QSessionWidget.on_login_succeeded')
+    def on_login_succeeded(self, session):
+        self.login_worker = None
+        self.login_button.setEnabled(True)
+
+        self.session = session
+        self.host, self.port, self.user = session.hostname, session.port, session.username
+
+        # the pool keeps the password in memory for the reconnects
+        self.pssw_line.clear()
+        session_name = self.user + "@" + self.host
         logger.info("Logged in " + session_name)
-        self.user = self.user_line.text()
 
-        # update sessions list
-        if session_name in list(self.sessions_list):
-            self.sessions_list.remove(session_name)
-        self.sessions_list.appendleft(session_name)
+        self.poller = get_poller(self.host, self.port, self.user)
+        self.poller.subscribe(self.uuid, self.session)
+        self.poller.status_changed.connect(self.on_display_status)
+        self.poller.set_visible(self.uuid, self.isVisible())
+
+        # the queues and flavours offered in the display dialog
+        get_catalog().refresh(self.session)
+
+        self.submitter = JobSubmitter(self.session, self.poller, self.uuid)
+        self.submitter.job_changed.connect(self.on_job_changed)
+        for job in self.submitter.reattach():
+            self.add_display_row(job.name, job.state)
+            if job.endpoint is not None:
+                self.set_display_endpoint(job.name, job.endpoint[0], job.endpoint[1])
 
-        self.sessions_changed.emit(self.sessions_list)
+        self.supervisor = ConnectionSupervisor(self.host, self.port, self.user)
+        self.supervisor.health_changed.connect(self.health_changed)
+        self.supervisor.reconnected.connect(self.on_reconnected)
+        self.supervisor.start()
 
-        # update config file
-        self.update_config_file(session_name)
+        # update sessions list, the config file is updated by the history
+        get_session_history().add(session_name)
 
         # Hide the login view and show the session one
         self.containerLoginWidget.hide()
@@ -244,114 +294,197 @@ class QSessionWidget(QWidget):
         # Emit the logged_in signal.
         self.logged_in.emit(session_name)
 
+    @pyqtSlot()
+    @metrics.timed('slot.QSessionWidget.on_reconnected')
+    def on_reconnected(self):
+        """
+        Move the tunnels to the new connection and catch up with the jobs
+        """
+        self.session.move_tunnels()
+
+        self.submitter.reconcile()
+        self.poller.poll()
+
+    def showEvent(self, event):
+        if self.poller is not None:
+            self.poller.set_visible(self.uuid, True)
+        QWidget.showEvent(self, event)
+
+    def hideEvent(self, event):
+        if self.poller is not None:
+            self.poller.set_visible(self.uuid, False)
+        QWidget.hideEvent(self, event)
+
+    def run_remote(self, command, timeout=None, on_result=None, on_error=None):
+        """
+        Run a command on the session connection without blocking the gui
+        :param on_result: slot receiving the CommandResult
+        :param on_error: slot receiving the exception
+        :return: the AsyncTask
+        """
+        return AsyncTask(self.session.run(command, timeout), on_result, on_error)
+
+    @pyqtSlot()
+    @metrics.timed('slot.QSessionWidget.add_new_display')
     def add_new_display(self):
-        # cannot have more than 5 sessions
-        if len(self.displays) >= 5:
-            logger.warning("You have already 5 displays")
+        if self.display_model.rowCount() >= self.max_displays:
+            logger.warning("You have already " + str(self.max_displays) + " displays")
             return
 
-        display_win = QDisplayDialog(list(self.displays.keys()))
+        display_win = QDisplayDialog(self.display_model.names(), self.host)
         display_win.setModal(True)
 
         if display_win.exec() != 1:
             return
 
-        display_hor_layout = QHBoxLayout()
-        display_hor_layout.setContentsMargins(0, 2, 0, 2)
-        display_hor_layout.setSpacing(2)
-
-        display_ver_layout = QVBoxLayout()
-        display_ver_layout.setContentsMargins(0, 0, 0, 0)
-        display_ver_layout.setSpacing(0)
-
-        display_ver_layout.addLayout(display_hor_layout)
-
-        display_widget = QWidget()
-        display_widget.setLayout(display_ver_layout)
-
         id = display_win.display_name
-        print(id)
-
-        name = QLabel()
-        name.setText(str(id)[:16])
-        display_hor_layout.addWidget(name)
-
-        status = QLabel()
-        status.setText("Pending...")
-        display_hor_layout.addWidget(status)
-
-        time = QLabel()
-        time.setText("24H")
-        display_hor_layout.addWidget(time)
-
-        resources = QLabel()
-        resources.setText("1 Node")
-        display_hor_layout.addWidget(resources)
-
-        connect_btn = QPushButton()
-        connect_btn.setIcon(self.connect_ico)
-        connect_btn.setToolTip('Connect to the remote display')
-        connect_btn.clicked.connect(lambda: self.connect_display(id))
-        display_hor_layout.addWidget(connect_btn)
-
-        share_btn = QPushButton()
-        share_btn.setIcon(self.share_ico)
-        share_btn.setToolTip('Share the remote display via file')
-        share_btn.clicked.connect(lambda: self.share_display(id))
-        display_hor_layout.addWidget(share_btn)
-
-        kill_btn = QPushButton()
-        kill_btn.setIcon(self.kill_ico)
-        kill_btn.setToolTip('Kill the remote display')
-        kill_btn.clicked.connect(lambda: self.kill_display(id))
-        display_hor_layout.addWidget(kill_btn)
-
-        separator = QFrame()
-        separator.setFrameShape(QFrame.HLine)
-        separator.setFrameShadow(QFrame.Sunken)
-        display_ver_layout.addWidget(separator)
-
-        self.rows_ver_layout.addWidget(display_widget)
-
-        self.displays[id] = display_widget
+        self.add_display_row(id)
+
+        # the dialog is closed, the submission runs in background
+        self.submitter.submit(id,
+                              display_win.display_queue,
+                              display_win.display_vnc,
+                              display_win.display_size)
         logger.info("Added new display")
 
-    def update_config_file(self, session_name):
+    def add_display_row(self, id, state=SUBMITTING):
         """
-        Update the config file with the new session name
-        :param session_name: name of the last session inserted by the user
-        :return:
+        Add the row showing a display and its buttons
         """
-        if not self.parser.has_section('LoginFields'):
-            self.parser.add_section('LoginFields')
-
-        self.parser.set('LoginFields', 'hostList', json.dumps(list(self.sessions_list)))
+        self.display_model.add_display(id, state)
 
-        try:
-            config_file_dir = os.path.dirname(self.config_file_name)
-            if not os.path.exists(config_file_dir):
-                os.makedirs(config_file_dir)
+    @pyqtSlot(QModelIndex)
+    @metrics.timed('slot.QSessionWidget.on_display_action')
+    def on_display_action(self, index):
+        """
+        Run the action of the button clicked in a display row
+        """
+        id = self.display_model.name(index.row())
+        action = self.display_model.action(index.column())
+        if action == 'connect':
+            self.connect_display(id)
+        elif action == 'share':
+            self.share_display(id)
+        elif action == 'kill':
+            self.kill_display(id)
+
+    @pyqtSlot(str, dict)
+    @metrics.timed('slot.QSessionWidget.on_display_status')
+    def on_display_status(self, id, changes):
+        """
+        Update only the cells of the display that changed
+        """
+        # the status of the submitted jobs comes from on_job_changed
+        if self.submitter is not None and id in self.submitter.jobs:
+            changes = dict((key, text) for key, text in changes.items() if key != 'status')
+        self.display_model.set_fields(id, changes)
+
+    @pyqtSlot(str, str)
+    @metrics.timed('slot.QSessionWidget.on_job_changed')
+    def on_job_changed(self, id, state):
+        if id not in self.display_model:
+            return
+        self.display_model.set_fields(id, {'status': state})
+        if state == VNC_READY:
+            job = self.submitter.jobs[id]
+            self.set_display_endpoint(id, job.endpoint[0], job.endpoint[1])
 
-            with open(os.path.join(os.path.expanduser('~'), '.rcm', 'RCM2.cfg'), 'w') as config_file:
-                self.parser.write(config_file)
-        except:
-            logger.error("failed to dump the session list in the configuration file")
+    def set_display_endpoint(self, id, node, vnc_port):
+        """
+        Record where the vnc server of the display listens, once it is running
+        """
+        self.display_endpoints[id] = (node, vnc_port)
 
     def connect_display(self, id):
-        print(self.displays[id])
-        logger.info("Connected to remote display " + str(id))
+        """
+        Forward a local port to the vnc server of the display through the
+        session connection
+        :return: the local port, None if the display is not running yet
+        """
+        endpoint = self.display_endpoints.get(id)
+        if endpoint is None:
+            logger.warning("The display " + str(id) + " is not running yet")
+            return None
+
+        tunnel = self.session.open_tunnel(id, endpoint[0], endpoint[1])
+
+        logger.info("Connected to remote display " + str(id) +
+                    " on localhost:" + str(tunnel.local_port))
+        return tunnel.local_port
 
     def share_display(self, id):
-        print(self.displays[id])
         logger.info("Shared display " + str(id))
 
     def kill_display(self, id):
-        # first we hide the display
-        logger.debug("Hiding display " + str(id))
-        self.displays[id].hide()
+        self.display_model.remove_display(id)
+        self.display_endpoints.pop(id, None)
+        self.close_tunnel(id)
+        self.submitter.cancel(id)
 
-        # then we remove it from the layout and the dictionary
-        self.rows_ver_layout.removeWidget(self.displays[id])
-        del self.displays[id]
+        logger.info("Killed display " + str(id))
 
-        logger.info("Killed display " + str(id))
\ No newline at end of file
+    def close_tunnel(self, id):
+        if self.session is not None:
+            self.session.close_tunnel(id)
+
+    def close_session(self):
+        """
+        Release the ssh connection of the session, called when the tab is closed
+        """
+        if self.login_worker is not None:
+            cancel_worker(self.login_worker)
+            self.login_worker = None
+
+        if self.supervisor is not None:
+            self.supervisor.stop()
+            self.supervisor = None
+
+        if self.submitter is not None:
+            # the jobs keep running, the next login reattaches them
+            self.submitter.close()
+            self.submitter = None
+
+        if self.poller is not None:
+            # the displays shown by the other tabs of the user stay polled
+            release_poller(self.host, self.port, self.user, self.uuid)
+            self.poller = None
+
+        if self.session is not None:
+            # closes the tunnels and releases the connection
+            self.session.logout()
+            self.session = None
+            self.user = ""
+
+
+class QSessionWidgetPool(object):
+    """
+    Keep a few session widgets built in advance, so that opening a new tab
+    does not wait for the config parsing and the layouts
+    """
+
+    def __init__(self, size=2):
+        self.size = size
+        self.widgets = []
+
+    def fill(self):
+        """
+        Build the missing widgets one at a time when the event loop is idle
+        """
+        if len(self.widgets) < self.size:
+            QTimer.singleShot(0, self._build_one)
+
+    def take(self):
+        """
+        :return: a ready session widget, built now if the pool is empty
+        """
+        if self.widgets:
+            widget = self.widgets.pop(0)
+        else:
+            widget = QSessionWidget(None)
+        self.fill()
+        return widget
+
+    def _build_one(self):
+        if len(self.widgets) < self.size:
+            self.widgets.append(QSessionWidget(None))
+            self.fill()
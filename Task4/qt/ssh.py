@@ -1,11 +1,779 @@
-import paramiko
+# std lib
+import os
+import hmac
+import time
+import hashlib
+import select
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+# local includes
+import metrics
+from logger import logger
 
-def ssh_login(hostname, port, username, password, command):
-    ssh_client = paramiko.SSHClient()
-    ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh_client.load_system_host_keys()
-    ssh_client.connect(hostname, port, username, password)
-    stdin, stdout, stderr = ssh_client.exec_command(command)
-    print(stdout.read())
+# paramiko and its cryptography stack are slow to import: they are
+# imported at the first connection, see _paramiko
+paramiko = None
 
+
+def _paramiko():
+    global paramiko
+    if paramiko is None:
+        import paramiko as paramiko_module
+        paramiko = paramiko_module
+    return paramiko
+
+
+def is_authentication_error(error):
+    """
+    :return: True if the error is a failed ssh authentication
+    """
+    return paramiko is not None and isinstance(error, paramiko.AuthenticationException)
+
+
+class RemoteCommandTimeout(Exception):
+    pass
+
+
+class CommandStream(object):
+    """
+    Output of a remote command, read while the command runs.
+    The data is received only when the consumer asks for it: a slow
+    consumer fills the ssh window and the remote command waits, so the
+    memory used does not depend on the size of the output.
+    """
+
+    def __init__(self, channel, command, timeout=None, chunk_size=32768):
+        """
+        :param timeout: seconds allowed for the whole command, None to wait forever
+        :param chunk_size: maximum size of the chunks
+        """
+        self.channel = channel
+        self.command = command
+        self.chunk_size = chunk_size
+        self.deadline = None if timeout is None else time.time() + timeout
+
+        # set when the output is over, -1 if the server did not send it
+        self.exit_status = None
+
+    def chunks(self):
+        """
+        Yield the output as soon as it arrives, as ('stdout', bytes) and
+        ('stderr', bytes) tuples. The exit_status is set at the end.
+        """
+        channel = self.channel
+        while True:
+            got_data = False
+            if channel.recv_ready():
+                yield 'stdout', channel.recv(self.chunk_size)
+                got_data = True
+            if channel.recv_stderr_ready():
+                yield 'stderr', channel.recv_stderr(self.chunk_size)
+                got_data = True
+            if got_data:
+                continue
+
+            if channel.exit_status_ready() or channel.closed:
+                # the last output may have arrived after the checks above,
+                # the server sends it before the exit status
+                if channel.recv_ready() or channel.recv_stderr_ready():
+                    continue
+
+            if channel.exit_status_ready():
+                self.exit_status = channel.recv_exit_status()
+                return
+            if channel.closed:
+                # closed by the server without an exit status
+                self.exit_status = -1
+                return
+
+            wait = 1.0
+            if self.deadline is not None:
+                wait = min(wait, self.deadline - time.time())
+                if wait <= 0:
+                    self.close()
+                    raise RemoteCommandTimeout(self.command)
+            select.select([channel], [], [], wait)
+
+    def lines(self):
+        """
+        Yield the output one line at a time, as ('stdout', str) and
+        ('stderr', str) tuples without the line ends
+        """
+        partial = {'stdout': b'', 'stderr': b''}
+        for name, data in self.chunks():
+            lines = (partial[name] + data).split(b'\n')
+            partial[name] = lines.pop()
+            for line in lines:
+                yield name, line.decode('utf-8', 'replace')
+
+        for name, data in partial.items():
+            if data:
+                yield name, data.decode('utf-8', 'replace')
+
+    def read(self):
+        """
+        Wait for the end of the command
+        :return: exit status, whole stdout and stderr
+        """
+        output = {'stdout': [], 'stderr': []}
+        for name, data in self.chunks():
+            output[name].append(data)
+        return (self.exit_status,
+                b''.join(output['stdout']).decode('utf-8', 'replace'),
+                b''.join(output['stderr']).decode('utf-8', 'replace'))
+
+    def close(self):
+        self.channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _PooledConnection(object):
+    """
+    An authenticated transport kept alive by the pool
+    """
+
+    def __init__(self, transport, password=None):
+        """
+        :param password: the password that authenticated the user, None for a key
+        """
+        self.transport = transport
+        self.users = 0
+        self.last_used = time.time()
+
+        # only a salted digest of the password is kept, to check the next logins
+        self._salt = os.urandom(16)
+        self._password_digest = self._digest(password) if password else None
+
+    def accepts(self, password):
+        """
+        :return: True if a login with the password may share the connection:
+                 always for the users authenticated with a key, only with
+                 the same password otherwise
+        """
+        if self._password_digest is None:
+            return True
+        return bool(password) and hmac.compare_digest(self._digest(password),
+                                                      self._password_digest)
+
+    def _digest(self, password):
+        return hmac.new(self._salt, password.encode('utf-8'), hashlib.sha256).digest()
+
+    def is_alive(self):
+        return self.transport is not None and self.transport.is_active()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+
+class CredentialCache(object):
+    """
+    Passwords kept in memory only, for a limited time, so that reconnects
+    and new sessions do not ask them again. They are stored in bytearrays
+    overwritten when they expire or are forgotten.
+    """
+
+    def __init__(self, ttl=8 * 3600):
+        """
+        :param ttl: seconds a password is remembered, 0 to disable the cache
+        """
+        self.ttl = ttl
+        self._secrets = {}
+        self._lock = threading.Lock()
+
+    def put(self, key, secret):
+        if not self.ttl or not secret:
+            return
+        with self._lock:
+            self._wipe(key)
+            self._secrets[key] = (bytearray(secret.encode('utf-8')), time.time() + self.ttl)
+
+    def get(self, key):
+        """
+        :return: the password, None if it is unknown or expired
+        """
+        with self._lock:
+            secret, expiry = self._secrets.get(key, (None, 0))
+            if secret is None:
+                return None
+            if time.time() > expiry:
+                self._wipe(key)
+                return None
+            return secret.decode('utf-8')
+
+    def forget(self, key):
+        with self._lock:
+            self._wipe(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._secrets):
+                self._wipe(key)
+
+    def _wipe(self, key):
+        secret, expiry = self._secrets.pop(key, (None, 0))
+        if secret is not None:
+            secret[:] = bytes(len(secret))
+
+
+class SSHConnectionPool(object):
+    """
+    Keep the authenticated ssh transports alive and share them between
+    the sessions. The connections are keyed by (host, port, user): every
+    remote command opens a new channel on the pooled transport instead of
+    paying a new key exchange and authentication, as an OpenSSH
+    ControlMaster with ControlPersist does.
+    The users are authenticated with the ssh agent, then with the key
+    files, then with the given or the cached password.
+    """
+
+    def __init__(self, keepalive=30, idle_timeout=300, timeout=15, max_warm_ups=4,
+                 key_files=None, credential_ttl=8 * 3600, known_hosts_file=None):
+        """
+        :param keepalive: seconds between the keepalive packets, 0 to disable
+        :param idle_timeout: seconds after which an unused connection is closed
+        :param timeout: tcp connect and key exchange timeout in seconds
+        :param max_warm_ups: number of hosts warmed up in parallel
+        :param key_files: private keys tried before the password, by default
+                          the OpenSSH default identities in ~/.ssh
+        :param credential_ttl: seconds the passwords are kept in memory
+        :param known_hosts_file: the host keys checked and saved on first
+                                 use, by default ~/.ssh/known_hosts
+        """
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_warm_ups = max_warm_ups
+        self.key_files = key_files if key_files is not None else \
+            [os.path.join(os.path.expanduser('~'), '.ssh', name)
+             for name in ('id_ed25519', 'id_ecdsa', 'id_rsa')]
+        self.credentials = CredentialCache(credential_ttl)
+        self.known_hosts_file = known_hosts_file or \
+            os.path.join(os.path.expanduser('~'), '.ssh', 'known_hosts')
+        self._known_hosts_lock = threading.Lock()
+
+        # number of full handshakes (tcp + kex + auth) done by the pool
+        self.handshakes = 0
+
+        self._connections = {}
+        self._key_locks = {}
+        self._lock = threading.RLock()
+
+        # (host, port) -> (future of the warmed up transport, start time)
+        self._warm = {}
+        self._warm_up_executor = None
+
+        # closes the idle connections also when the pool is not used,
+        # runs only while there are connections
+        self._sweeper = None
+        self._stop_sweep = None
+
+    def acquire(self, hostname, port, username, password=None, progress=None):
+        """
+        Get an authenticated transport and register a new user of it.
+        Every acquire must be balanced by a release.
+        :param password: None or empty to use the keys or the cached password
+        :param progress: optional callback receiving the progress messages
+        :return: the paramiko transport
+        """
+        # the handshake is done holding only the lock of this key, so that
+        # slow logins do not block the other hosts
+        with self._key_lock((hostname, port, username)):
+            connection = self._get_connection(hostname, port, username, password, progress)
+            with self._lock:
+                connection.users += 1
+            return connection.transport
+
+    def release(self, hostname, port, username):
+        """
+        Unregister a user of the connection. The transport is kept alive
+        for idle_timeout seconds, so that a new session can reuse it.
+        """
+        with self._lock:
+            connection = self._connections.get((hostname, port, username))
+            if connection is None:
+                return
+            connection.users = max(0, connection.users - 1)
+            connection.last_used = time.time()
+            self.evict_idle()
+
+    def get_transport(self, hostname, port, username):
+        """
+        :return: the pooled transport, to open new channels on it
+        """
+        with self._lock:
+            connection = self._connections.get((hostname, port, username))
+            if connection is None or not connection.is_alive():
+                raise _paramiko().SSHException("No active connection to " +
+                                            username + "@" + hostname)
+            connection.last_used = time.time()
+            return connection.transport
+
+    def stats(self):
+        """
+        :return: dictionary with the number of pooled connections, of their
+                 users, of the hosts being warmed up and of the handshakes
+        """
+        with self._lock:
+            return {'connections': len(self._connections),
+                    'users': sum(connection.users for connection in self._connections.values()),
+                    'warm_ups': len(self._warm),
+                    'handshakes': self.handshakes}
+
+    def probe(self, hostname, port, username, timeout=10):
+        """
+        Check that the server still answers: a dropped network is noticed
+        by the transport only when the tcp retransmissions give up.
+        The connection is closed if no reply arrives within the timeout.
+        :return: True if the connection is alive
+        """
+        try:
+            transport = self.get_transport(hostname, port, username)
+        except _paramiko().SSHException:
+            return False
+
+        # any reply, also a failure, proves that the server is there
+        replied = threading.Event()
+
+        def request():
+            transport.global_request('keepalive@openssh.com', wait=True)
+            replied.set()
+
+        threading.Thread(target=request, name="rcm-probe", daemon=True).start()
+        if replied.wait(timeout) and transport.is_active():
+            return True
+
+        logger.debug("No answer from " + username + "@" + hostname + ", closing the connection")
+        self.close(hostname, port, username)
+        return False
+
+    def exec_stream(self, hostname, port, username, command, timeout=None, chunk_size=32768):
+        """
+        Run a command on a new channel of a pooled transport
+        :param timeout: seconds allowed for the whole command, None to wait forever
+        :return: a CommandStream reading the output of the command
+        """
+        transport = self.get_transport(hostname, port, username)
+
+        with metrics.timer('ssh.exec'):
+            channel = transport.open_session(timeout=self.timeout)
+            try:
+                channel.exec_command(command)
+            except Exception:
+                channel.close()
+                raise
+        return CommandStream(channel, command, timeout, chunk_size)
+
+    def warm_up(self, hostname, port, username=None):
+        """
+        Resolve the host, open the tcp connection and do the key exchange in
+        background, so that the next login on the host only authenticates.
+        With an ssh agent the user is also authenticated in advance.
+        :return: immediately, the handshake runs on the warm up threads
+        """
+        key = (hostname, port)
+        with self._lock:
+            if key in self._warm or any(connection_key[:2] == key and connection.is_alive()
+                                        for connection_key, connection in self._connections.items()):
+                return
+            if self._warm_up_executor is None:
+                self._warm_up_executor = ThreadPoolExecutor(max_workers=self.max_warm_ups,
+                                                            thread_name_prefix="rcm-warm-up")
+            future = self._warm_up_executor.submit(self._warm_up, hostname, port, username)
+            self._warm[key] = (future, time.time())
+            self._start_sweeper()
+
+    def evict_idle(self):
+        """
+        Close the dead connections and the ones unused for more than idle_timeout
+        """
+        now = time.time()
+        with self._lock:
+            for key, connection in list(self._connections.items()):
+                idle = connection.users == 0 and now - connection.last_used > self.idle_timeout
+                if idle or not connection.is_alive():
+                    logger.debug("Closing ssh connection to " + key[2] + "@" + key[0])
+                    connection.close()
+                    del self._connections[key]
+
+            for key, (future, started) in list(self._warm.items()):
+                if future.done() and now - started > self.idle_timeout:
+                    del self._warm[key]
+                    self._close_warm(future)
+
+    def close(self, hostname, port, username):
+        """
+        Close the connection regardless of its users
+        """
+        with self._lock:
+            connection = self._connections.pop((hostname, port, username), None)
+        if connection is not None:
+            connection.close()
+
+    def close_all(self):
+        with self._lock:
+            if self._sweeper is not None:
+                self._stop_sweep.set()
+                self._sweeper = None
+            connections = list(self._connections.values())
+            self._connections.clear()
+            warm = [future for future, started in self._warm.values()]
+            self._warm.clear()
+        for connection in connections:
+            connection.close()
+        for future in warm:
+            future.cancel()
+            if future.done():
+                self._close_warm(future)
+
+    def _start_sweeper(self):
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._stop_sweep = threading.Event()
+            self._sweeper = threading.Thread(target=self._sweep, args=(self._stop_sweep,),
+                                             name="rcm-ssh-sweep", daemon=True)
+            self._sweeper.start()
+
+    def _sweep(self, stop):
+        """
+        Evict the idle connections every quarter of idle_timeout, at most every minute
+        """
+        interval = min(max(self.idle_timeout / 4.0, 0.1), 60)
+        while not stop.wait(interval):
+            self.evict_idle()
+            with self._lock:
+                if stop.is_set():
+                    return
+                if not self._connections and not self._warm:
+                    self._sweeper = None
+                    return
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _get_connection(self, hostname, port, username, password, progress=None):
+        key = (hostname, port, username)
+
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is not None:
+                if connection.is_alive():
+                    self._check_password(connection, key, password)
+                    connection.last_used = time.time()
+                    return connection
+                logger.debug("Dropping dead ssh connection to " + username + "@" + hostname)
+                connection.close()
+                del self._connections[key]
+
+        self.evict_idle()
+
+        transport = self._take_warm(hostname, port, progress)
+        with self._lock:
+            # the warm up may have authenticated the user with the agent
+            connection = self._connections.get(key)
+            if connection is not None and connection.is_alive():
+                if transport is not None:
+                    transport.close()
+                self._check_password(connection, key, password)
+                connection.last_used = time.time()
+                return connection
+
+        if transport is None:
+            if progress is not None:
+                progress("Connecting to " + hostname)
+            transport = self._connect(hostname, port)
+        try:
+            if progress is not None:
+                progress("Authenticating " + username + "@" + hostname)
+            with metrics.timer('ssh.auth'):
+                password = self._authenticate(transport, key, password)
+        except Exception:
+            metrics.count('ssh.login_failures')
+            transport.close()
+            raise
+
+        connection = _PooledConnection(transport, password)
+        with self._lock:
+            self._connections[key] = connection
+        self._start_sweeper()
+        return connection
+
+    def _warm_up(self, hostname, port, username):
+        """
+        :return: the transport ready for the authentication, None if the
+                 agent already authenticated the user
+        """
+        logger.debug("Warming up the connection to " + hostname)
+        transport = self._connect(hostname, port)
+        if username is None or not self._auth_keys(transport, username):
+            return transport
+
+        logger.debug("Authenticated " + username + "@" + hostname + " in advance")
+        with self._lock:
+            self._connections[(hostname, port, username)] = _PooledConnection(transport)
+        return None
+
+    def _take_warm(self, hostname, port, progress=None):
+        """
+        :return: the warmed up transport of the host, waiting for the
+                 handshake in progress, None if there is none
+        """
+        with self._lock:
+            future, started = self._warm.pop((hostname, port), (None, None))
+        if future is None:
+            return None
+
+        if progress is not None and not future.done():
+            progress("Connecting to " + hostname)
+        try:
+            transport = future.result(self.timeout)
+        except Exception as e:
+            logger.debug("Warm up of " + hostname + " failed: " + str(e))
+            return None
+        if transport is not None and not transport.is_active():
+            transport.close()
+            return None
+        return transport
+
+    def _check_password(self, connection, key, password):
+        """
+        A connection opened with a password is shared only by the logins
+        giving the same password, or none while the password is cached
+        """
+        if not password:
+            password = self.credentials.get(key)
+        if not connection.accepts(password):
+            metrics.count('ssh.login_failures')
+            raise _paramiko().AuthenticationException("Authentication failed.")
+
+    def _authenticate(self, transport, key, password):
+        """
+        Try the agent and the key files, then the password
+        :return: the password that authenticated the user, None for a key
+        """
+        username = key[2]
+        if self._auth_keys(transport, username):
+            return None
+
+        cached = password is None or password == ""
+        if cached:
+            password = self.credentials.get(key)
+            if password is None:
+                raise _paramiko().AuthenticationException("No key accepted and no password")
+        try:
+            transport.auth_password(username, password)
+        except _paramiko().AuthenticationException:
+            self.credentials.forget(key)
+            raise
+        if not cached:
+            self.credentials.put(key, password)
+        return password
+
+    def _auth_keys(self, transport, username):
+        """
+        Authenticate without user interaction, with the ssh agent or the
+        key files not protected by a passphrase
+        :return: True if the user is authenticated
+        """
+        try:
+            if _auth_agent(transport, username):
+                return True
+
+            for key_file in self.key_files:
+                key = _load_key(key_file)
+                if key is None:
+                    continue
+                try:
+                    transport.auth_publickey(username, key)
+                except _paramiko().BadAuthenticationType:
+                    raise
+                except _paramiko().SSHException:
+                    continue
+                if transport.is_authenticated():
+                    logger.debug("Authenticated " + username + " with " + key_file)
+                    return True
+        except _paramiko().BadAuthenticationType:
+            # the server does not accept public keys
+            pass
+        return False
+
+    @staticmethod
+    def _close_warm(future):
+        try:
+            transport = future.result(0)
+        except Exception:
+            return
+        if transport is not None:
+            transport.close()
+
+    def _connect(self, hostname, port):
+        """
+        Open the tcp socket and negotiate the ssh transport
+        """
+        with metrics.timer('ssh.connect'):
+            sock = socket.create_connection((hostname, port), self.timeout)
+        # the requests of the commands are small packets waiting for an answer,
+        # with Nagle each one may wait for the delayed ack of the previous one
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = _paramiko().Transport(sock)
+        try:
+            with metrics.timer('ssh.kex'):
+                transport.start_client(timeout=self.timeout)
+                self._check_host_key(transport, hostname, port)
+        except Exception:
+            transport.close()
+            raise
+
+        if self.keepalive:
+            transport.set_keepalive(self.keepalive)
+
+        with self._lock:
+            self.handshakes += 1
+        return transport
+
+    def _check_host_key(self, transport, hostname, port):
+        """
+        Verify the server key against the known hosts. The key of an unknown
+        host is saved on first use, as ssh does with StrictHostKeyChecking
+        accept-new, a host known with other keys is rejected.
+        """
+        paramiko = _paramiko()
+        server_key = transport.get_remote_server_key()
+        server_name = hostname if port == 22 else "[%s]:%d" % (hostname, port)
+
+        # the check and the save are atomic, the hosts are warmed up in parallel
+        with self._known_hosts_lock:
+            host_keys = paramiko.HostKeys()
+            try:
+                host_keys.load(self.known_hosts_file)
+            except IOError:
+                pass
+            known_keys = host_keys.lookup(server_name)
+            if known_keys is None:
+                self._save_host_key(server_name, server_key)
+                return
+
+        known_key = known_keys.get(server_key.get_name())
+        if known_key != server_key:
+            logger.error("The host key of " + server_name + " changed")
+            raise paramiko.BadHostKeyException(hostname, server_key,
+                                               known_key or list(known_keys.values())[0])
+
+    def _save_host_key(self, server_name, server_key):
+        logger.info("Saving the host key of " + server_name + " in " + self.known_hosts_file)
+        line = _paramiko().hostkeys.HostKeyEntry([server_name], server_key).to_line()
+        try:
+            known_hosts_dir = os.path.dirname(self.known_hosts_file)
+            if not os.path.exists(known_hosts_dir):
+                os.makedirs(known_hosts_dir, mode=0o700)
+            fd = os.open(self.known_hosts_file, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, 'rb+') as known_hosts:
+                # the last line of the file may lack its newline
+                if known_hosts.seek(0, os.SEEK_END) > 0:
+                    known_hosts.seek(-1, os.SEEK_END)
+                    if known_hosts.read(1) != b'\n':
+                        line = "\n" + line
+                known_hosts.write(line.encode('utf-8'))
+        except (IOError, OSError):
+            logger.error("Failed to save the host key of " + server_name + " in " +
+                         self.known_hosts_file)
+
+
+def _auth_agent(transport, username):
+    """
+    Try the keys of the ssh agent, if one is running
+    :return: True if the user is authenticated
+    """
+    if not os.environ.get('SSH_AUTH_SOCK'):
+        return False
+
+    agent = _paramiko().Agent()
+    try:
+        for key in agent.get_keys():
+            try:
+                transport.auth_publickey(username, key)
+            except _paramiko().BadAuthenticationType:
+                raise
+            except _paramiko().SSHException:
+                continue
+            if transport.is_authenticated():
+                logger.debug("Authenticated " + username + " with the ssh agent")
+                return True
+    finally:
+        agent.close()
+    return False
+
+
+def _load_key(key_file):
+    """
+    :return: the private key of the file, None if it is missing or encrypted
+    """
+    if not os.path.exists(key_file):
+        return None
+
+    paramiko = _paramiko()
+    for key_class in (paramiko.Ed25519Key, paramiko.ECDSAKey, paramiko.RSAKey):
+        try:
+            return key_class.from_private_key_file(key_file)
+        except paramiko.PasswordRequiredException:
+            logger.debug("Skipping the encrypted key " + key_file + ", load it in the ssh agent")
+            return None
+        except (paramiko.SSHException, IOError, ValueError):
+            continue
+    return None
+
+
+ssh_pool = SSHConnectionPool()
+metrics.gauge('ssh.connections', lambda: ssh_pool.stats()['connections'])
+metrics.gauge('ssh.users', lambda: ssh_pool.stats()['users'])
+metrics.gauge('ssh.warm_ups', lambda: ssh_pool.stats()['warm_ups'])
+metrics.gauge('ssh.handshakes', lambda: ssh_pool.stats()['handshakes'])
+
+
+@metrics.timed('ssh.login')
+def ssh_login(hostname, port, username, password, command, progress=None):
+    ssh_pool.acquire(hostname, port, username, password, progress)
+    try:
+        if progress is not None:
+            progress("Running " + command)
+        # the output goes to the log one line at a time, as it arrives
+        with ssh_pool.exec_stream(hostname, port, username, command, timeout=60) as stream:
+            for name, line in stream.lines():
+                if name == 'stdout':
+                    logger.debug(hostname + ": " + line)
+                else:
+                    logger.warning(hostname + ": " + line)
+    except Exception:
+        # the login failed, the connection is not used by this session
+        ssh_pool.release(hostname, port, username)
+        raise
+    return stream.exit_status
+
+
+def ssh_logout(hostname, port, username):
+    ssh_pool.release(hostname, port, username)
+
+
+def ssh_warm_up(session_names, port=22):
+    """
+    Warm up the connections of the sessions of the history
+    :param session_names: list of [user@]host[:port]
+    :param port: the port of the sessions without one
+    """
+    for session_name in session_names:
+        username, _, address = session_name.rpartition('@')
+        hostname, _, session_port = address.partition(':')
+        if not hostname or not (session_port or str(port)).isdigit():
+            logger.debug("Not warming up the invalid session " + session_name)
+            continue
+        ssh_pool.warm_up(hostname, int(session_port or port), username or None)
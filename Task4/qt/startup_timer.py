@@ -0,0 +1,60 @@
+# std lib
+import os
+import time
+
+# imported first by rcm.py: the marks are relative to this moment
+# unless the process start time is known
+_import_time = time.time()
+_marks = []
+
+
+def _process_start_time():
+    """
+    :return: the epoch time of the process start on linux, otherwise
+             the import time of this module. For a one-file PyInstaller
+             executable the process start includes the archive unpacking.
+    """
+    try:
+        with open('/proc/self/stat', 'r') as stat_file:
+            # the command name may contain spaces, the fields follow the last ')'
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        start_ticks = float(fields[19])
+        with open('/proc/uptime', 'r') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        boot_time = time.time() - uptime
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, IndexError, ValueError, AttributeError):
+        return _import_time
+
+
+start_time = _process_start_time()
+
+
+def mark(name):
+    """
+    Record the time elapsed since the process start
+    :return: the elapsed seconds
+    """
+    elapsed = time.time() - start_time
+    _marks.append((name, elapsed))
+    return elapsed
+
+
+def elapsed(name):
+    """
+    :return: the seconds recorded by the mark, None if it is not recorded yet
+    """
+    for mark_name, mark_elapsed in _marks:
+        if mark_name == name:
+            return mark_elapsed
+    return None
+
+
+def report(logger):
+    """
+    Write the marks to the log, with the time spent since the previous one
+    """
+    previous = 0.0
+    for name, mark_elapsed in _marks:
+        logger.debug("startup: %-24s %7.3fs (+%.3fs)" % (name, mark_elapsed, mark_elapsed - previous))
+        previous = mark_elapsed
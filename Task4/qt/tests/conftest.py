@@ -0,0 +1,39 @@
+# std lib
+import os
+import sys
+import tempfile
+
+# the modules are imported by name, as rcm.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# before the rcm modules are imported: no display, no ssh agent, and a
+# home of their own for the config, the logs, the jobs and the ssh keys
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+os.environ['HOME'] = tempfile.mkdtemp(prefix='rcm-tests-')
+os.environ.pop('SSH_AUTH_SOCK', None)
+
+import pytest
+
+# local includes
+from ssh_stub import SSHStub
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    yield app
+
+
+@pytest.fixture
+def ssh_server():
+    """
+    A started SSHStub, the shared pool is emptied after the test
+    """
+    from ssh import ssh_pool
+    stub = SSHStub()
+    stub.start()
+    yield stub
+    ssh_pool.close_all()
+    ssh_pool.credentials.clear()
+    stub.close()
@@ -0,0 +1,129 @@
+# std lib
+import os
+import socket
+import struct
+import threading
+
+# The fake cluster shared by the ssh stub of the tests and by load_test.py:
+# a fake slurm and the vnc servers the display jobs start.
+
+# greeting sent by the fake vnc servers, as a real one does
+RFB_VERSION = b"RFB 003.008\n"
+
+# the fake slurm commands, run by the server with the environment of the user
+SBATCH = """#!/bin/sh
+script=$(cat)
+name=$(printf '%s\\n' "$script" | sed -n 's/^#SBATCH --job-name=//p')
+comment=$(printf '%s\\n' "$script" | sed -n 's/^#SBATCH --comment=//p')
+mkdir -p "$RCM_FAKE_JOBS" "$HOME/.rcm/displays"
+echo "$$|$name|$comment" > "$RCM_FAKE_JOBS/$name"
+marker="$HOME/.rcm/displays/$name.vnc"
+( sleep "$RCM_FAKE_PENDING"; echo "vnc|$name|127.0.0.1|$RCM_FAKE_VNC_PORT" > "$marker" ) \\
+    > /dev/null 2>&1 &
+echo "$$"
+"""
+
+# the jobs are files id|name|comment, the running ones have a vnc marker
+SQUEUE = """#!/bin/sh
+name=""
+format="%i"
+while [ $# -gt 0 ]; do
+    case $1 in -n) name=$2; shift;; -o) format=$2; shift;; esac
+    shift
+done
+for job in "$RCM_FAKE_JOBS"/*; do
+    [ -f "$job" ] || continue
+    IFS='|' read id job_name comment < "$job"
+    [ -z "$name" ] || [ "$job_name" = "$name" ] || continue
+    if [ -e "$HOME/.rcm/displays/$job_name.vnc" ]; then
+        state=RUNNING; time_left=59:00
+    else
+        state=PENDING; time_left=1:00:00
+    fi
+    printf '%s\\n' "$format" | sed -e "s/%i/$id/" -e "s/%j/$job_name/" -e "s/%T/$state/" \\
+        -e "s/%L/$time_left/" -e "s/%D/1/" -e "s/%k/$comment/"
+done
+"""
+
+# cancels by name with -n, or by job id
+SCANCEL = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    case $1 in
+        -n) rm -f "$RCM_FAKE_JOBS/$2"; shift;;
+        -u) shift;;
+        *) for job in "$RCM_FAKE_JOBS"/*; do
+               [ -f "$job" ] || continue
+               IFS='|' read id job_name comment < "$job"
+               [ "$id" = "$1" ] && rm -f "$job"
+           done;;
+    esac
+    shift
+done
+"""
+
+
+def pump(source, destination):
+    try:
+        while True:
+            data = source.recv(65536)
+            if not data:
+                break
+            destination.sendall(data)
+    except (OSError, EOFError):
+        pass
+    finally:
+        for end in (source, destination):
+            try:
+                end.close()
+            except (OSError, EOFError):
+                pass
+
+
+def serve_vnc():
+    """
+    Start the fake vnc server: after the greeting it sends the number of
+    bytes asked with a 8 bytes big endian integer, until the client leaves
+    :return: the listening port
+    """
+    listen_socket = socket.socket()
+    listen_socket.bind(('127.0.0.1', 0))
+    listen_socket.listen(128)
+    payload = bytes(1024 * 1024)
+
+    def handle(sock):
+        try:
+            sock.sendall(RFB_VERSION)
+            while True:
+                request = b''
+                while len(request) < 8:
+                    data = sock.recv(8 - len(request))
+                    if not data:
+                        return
+                    request += data
+                remaining = struct.unpack('>Q', request)[0]
+                while remaining:
+                    sent = sock.send(payload[:min(remaining, len(payload))])
+                    remaining -= sent
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+    def accept():
+        while True:
+            sock, _ = listen_socket.accept()
+            threading.Thread(target=handle, args=(sock,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listen_socket.getsockname()[1]
+
+
+def install_slurm(bin_dir):
+    """
+    Write the fake slurm commands in bin_dir, to put in the PATH of the commands
+    """
+    for name, script in (('sbatch', SBATCH), ('squeue', SQUEUE), ('scancel', SCANCEL)):
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as script_file:
+            script_file.write(script)
+        os.chmod(path, 0o755)
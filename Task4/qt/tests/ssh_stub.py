@@ -0,0 +1,229 @@
+# std lib
+import os
+import socket
+import shutil
+import tempfile
+import threading
+import subprocess
+
+import paramiko
+
+# local includes
+from fake_cluster import install_slurm, serve_vnc, pump
+
+# generated once, the key exchange of each test connection is the slow part
+HOST_KEY = paramiko.ECDSAKey.generate()
+
+
+class SSHStub(object):
+    """
+    A local ssh server standing in for a cluster login node: password and
+    public key authentication, commands run by the local shell with a fake slurm in
+    the PATH, and local port forwarding. It counts the handshakes and the
+    commands, and can be stopped and restarted on the same port to
+    simulate a network drop.
+    """
+
+    def __init__(self, password="secret", auth_delay=0, pending=0.2, refuse_exec=False,
+                 host_key=None, authorized_keys=()):
+        """
+        :param auth_delay: seconds each password check takes
+        :param pending: seconds a fake job waits before its vnc server is up
+        :param refuse_exec: if true the exec requests are refused
+        :param host_key: the key of the server, by default the one shared by the stubs
+        :param authorized_keys: public keys accepted besides the password
+        """
+        self.password = password
+        self.host_key = host_key or HOST_KEY
+        self.authorized_keys = list(authorized_keys)
+        self.auth_delay = auth_delay
+        self.pending = pending
+        self.refuse_exec = refuse_exec
+
+        self.root = tempfile.mkdtemp(prefix='rcm-ssh-stub-')
+        self.bin_dir = os.path.join(self.root, 'bin')
+        os.makedirs(self.bin_dir)
+        install_slurm(self.bin_dir)
+        self.vnc_port = serve_vnc()
+
+        self.port = 0
+        self.handshakes = 0
+        self.password_checks = 0
+        self.commands = []
+        self.transports = []
+        self._listen_socket = None
+        self._lock = threading.Lock()
+
+    def start(self, port=0):
+        """
+        :param port: 0 for a free port, or the port of the previous start
+        :return: the listening port
+        """
+        self._listen_socket = socket.socket()
+        self._listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listen_socket.bind(('127.0.0.1', port))
+        self._listen_socket.listen(128)
+        self.port = self._listen_socket.getsockname()[1]
+        threading.Thread(target=self._accept, args=(self._listen_socket,), daemon=True).start()
+        return self.port
+
+    def stop(self):
+        """
+        Stop listening and drop the open connections
+        """
+        if self._listen_socket is not None:
+            # wakes up the accept thread, closing alone does not
+            try:
+                self._listen_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listen_socket.close()
+            self._listen_socket = None
+        with self._lock:
+            transports = list(self.transports)
+            self.transports = []
+        for transport in transports:
+            transport.close()
+
+    def restart(self):
+        self.stop()
+        return self.start(self.port)
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def home(self, username):
+        return os.path.join(self.root, 'home', username)
+
+    def jobs(self, username):
+        return os.path.join(self.root, 'jobs', username)
+
+    def _accept(self, listen_socket):
+        while True:
+            try:
+                sock, _ = listen_socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        server = _Server(self)
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+        with self._lock:
+            self.handshakes += 1
+            self.transports.append(transport)
+
+        # paramiko closes the channels that are garbage collected, so the
+        # session channels are kept until their command closes them
+        sessions = []
+        while transport.is_active():
+            channel = transport.accept(0.5)
+            sessions = [session for session in sessions if not session.closed]
+            if channel is None:
+                continue
+            destination = server.destinations.pop(channel.get_id(), None)
+            if destination is None:
+                sessions.append(channel)
+                continue
+            try:
+                forward = socket.create_connection(destination)
+            except OSError:
+                channel.close()
+                continue
+            threading.Thread(target=pump, args=(channel, forward), daemon=True).start()
+            threading.Thread(target=pump, args=(forward, channel), daemon=True).start()
+
+    def _execute(self, username, channel, command):
+        home = self.home(username)
+        os.makedirs(home, exist_ok=True)
+        env = dict(os.environ,
+                   HOME=home,
+                   PATH=self.bin_dir + os.pathsep + os.environ.get('PATH', ''),
+                   RCM_FAKE_JOBS=self.jobs(username),
+                   RCM_FAKE_PENDING=str(self.pending),
+                   RCM_FAKE_VNC_PORT=str(self.vnc_port))
+        try:
+            process = subprocess.Popen(command, shell=True, cwd=home, env=env,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            # the output is sent as it is produced: sendall waits for the
+            # client window, so a slow client slows the command down
+            stderr = threading.Thread(target=self._send, args=(process.stderr,
+                                                               channel.sendall_stderr))
+            stderr.start()
+            self._send(process.stdout, channel.sendall)
+            stderr.join()
+            # as a shell reports a command killed by a signal
+            exit_status = process.wait()
+            channel.send_exit_status(exit_status if exit_status >= 0 else 128 - exit_status)
+            # closing here could overtake the reply to the exec request
+            channel.shutdown_write()
+        except (OSError, EOFError, paramiko.SSHException):
+            channel.close()
+
+    @staticmethod
+    def _send(pipe, send):
+        try:
+            while True:
+                data = pipe.read1(65536)
+                if not data:
+                    break
+                send(data)
+        except (OSError, EOFError):
+            # the client closed the channel
+            pass
+        finally:
+            pipe.close()
+
+
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, stub):
+        self.stub = stub
+        self.username = None
+        self.destinations = {}
+
+    def get_allowed_auths(self, username):
+        return 'publickey,password' if self.stub.authorized_keys else 'password'
+
+    def check_auth_publickey(self, username, key):
+        # paramiko verifies the signature, this only checks the key is authorized
+        if not any(key == authorized for authorized in self.stub.authorized_keys):
+            return paramiko.AUTH_FAILED
+        self.username = username
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        self.stub.password_checks += 1
+        if self.stub.auth_delay:
+            threading.Event().wait(self.stub.auth_delay)
+        if password != self.stub.password:
+            return paramiko.AUTH_FAILED
+        self.username = username
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_global_request(self, kind, msg):
+        # answer the keepalive probes
+        return True
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.destinations[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        if self.stub.refuse_exec:
+            return False
+        command = command.decode()
+        self.stub.commands.append(command)
+        threading.Thread(target=self.stub._execute, args=(self.username, channel, command),
+                         daemon=True).start()
+        return True
@@ -0,0 +1,26 @@
+# std lib
+import time
+
+
+def wait_until(predicate, timeout=10, app=None):
+    """
+    Wait for the predicate, processing the Qt events if app is given
+    :return: the last value of the predicate
+    """
+    deadline = time.time() + timeout
+    while True:
+        if app is not None:
+            app.processEvents()
+        value = predicate()
+        if value or time.time() > deadline:
+            return value
+        time.sleep(0.005)
+
+
+def report(name, **values):
+    """
+    Print the figures of a measure, shown with pytest -s
+    """
+    print("\n" + name + ": " + ", ".join("%s=%s" % (key, value if not isinstance(value, float)
+                                                    else "%.3f" % value)
+                                         for key, value in values.items()))
@@ -0,0 +1,157 @@
+# std lib
+import os
+import time
+import subprocess
+
+import pytest
+import paramiko
+
+# local includes
+from ssh import SSHConnectionPool, CredentialCache, is_authentication_error
+from ssh_stub import SSHStub
+
+HOST = '127.0.0.1'
+USER = 'alice'
+
+
+@pytest.fixture
+def user_key(tmp_path):
+    """
+    A key pair of the user, the private key in an unencrypted file
+    :return: the key and its file
+    """
+    key = paramiko.ECDSAKey.generate()
+    key_file = str(tmp_path / 'id_ecdsa')
+    key.write_private_key_file(key_file)
+    return key, key_file
+
+
+@pytest.fixture
+def key_server(user_key):
+    stub = SSHStub(authorized_keys=[user_key[0]])
+    stub.start()
+    yield stub
+    stub.close()
+
+
+def acquire(pool, stub, password=None):
+    return pool.acquire(HOST, stub.port, USER, password)
+
+
+def test_key_is_tried_before_the_password(key_server, user_key):
+    pool = SSHConnectionPool(key_files=[user_key[1]])
+    try:
+        start = time.perf_counter()
+        acquire(pool, key_server)
+        assert key_server.password_checks == 0
+
+        # the next sessions of the user share the connection without a password
+        acquire(pool, key_server)
+        assert pool.handshakes == 1
+        assert not pool.credentials.get((HOST, key_server.port, USER))
+    finally:
+        pool.close_all()
+
+
+def test_encrypted_key_falls_back_to_the_password(key_server, user_key, tmp_path):
+    encrypted_file = str(tmp_path / 'id_encrypted')
+    user_key[0].write_private_key_file(encrypted_file, password="passphrase")
+    pool = SSHConnectionPool(key_files=[encrypted_file])
+    try:
+        acquire(pool, key_server, key_server.password)
+        assert key_server.password_checks == 1
+        assert pool.credentials.get((HOST, key_server.port, USER)) == key_server.password
+    finally:
+        pool.close_all()
+
+
+def test_unknown_key_falls_back_to_the_password(ssh_server, user_key):
+    pool = SSHConnectionPool(key_files=[user_key[1]])
+    try:
+        acquire(pool, ssh_server, ssh_server.password)
+        assert ssh_server.password_checks == 1
+
+        with pytest.raises(Exception) as error:
+            acquire(pool, ssh_server, "WRONG")
+        assert is_authentication_error(error.value)
+        assert pool.handshakes == 1
+    finally:
+        pool.close_all()
+
+
+@pytest.fixture
+def agent(user_key, monkeypatch):
+    """
+    An ssh agent holding the key of the user
+    """
+    try:
+        output = subprocess.run(['ssh-agent', '-s'], capture_output=True, text=True,
+                                timeout=10).stdout
+    except OSError:
+        pytest.skip("ssh-agent is not installed")
+    env = dict(line.split(';')[0].split('=', 1) for line in output.splitlines()
+               if line.startswith(('SSH_AUTH_SOCK=', 'SSH_AGENT_PID=')))
+    monkeypatch.setenv('SSH_AUTH_SOCK', env['SSH_AUTH_SOCK'])
+    try:
+        subprocess.run(['ssh-add', user_key[1]], env=dict(os.environ, **env),
+                       capture_output=True, check=True, timeout=10)
+        yield env
+    finally:
+        subprocess.run(['kill', env['SSH_AGENT_PID']])
+
+
+def test_agent_authenticates_without_key_files(key_server, agent):
+    pool = SSHConnectionPool(key_files=[])
+    try:
+        acquire(pool, key_server)
+        assert key_server.password_checks == 0
+    finally:
+        pool.close_all()
+
+
+def test_expired_password_is_not_reused(ssh_server):
+    pool = SSHConnectionPool(key_files=[], credential_ttl=0.3)
+    try:
+        acquire(pool, ssh_server, ssh_server.password)
+        # a new tab while the password is cached
+        acquire(pool, ssh_server)
+
+        time.sleep(0.4)
+        with pytest.raises(Exception) as error:
+            acquire(pool, ssh_server)
+        assert is_authentication_error(error.value)
+        # the open connection is shared again once the password is given
+        acquire(pool, ssh_server, ssh_server.password)
+        assert pool.handshakes == 1
+
+        # a reconnection needs the password too after the expiry
+        pool.close(HOST, ssh_server.port, USER)
+        time.sleep(0.4)
+        with pytest.raises(Exception) as error:
+            acquire(pool, ssh_server)
+        assert is_authentication_error(error.value)
+    finally:
+        pool.close_all()
+
+
+def test_credential_cache_expiry_wipes_the_password():
+    cache = CredentialCache(ttl=0.2)
+    cache.put('key', "secret")
+    secret, _ = cache._secrets['key']
+    assert cache.get('key') == "secret"
+
+    time.sleep(0.3)
+    assert cache.get('key') is None
+    assert secret == bytearray(len("secret"))
+    assert not cache._secrets
+
+
+def test_credential_cache_forget_and_disabled():
+    cache = CredentialCache()
+    cache.put('key', "secret")
+    cache.forget('key')
+    assert cache.get('key') is None
+
+    disabled = CredentialCache(ttl=0)
+    disabled.put('key', "secret")
+    assert disabled.get('key') is None
@@ -0,0 +1,119 @@
+# std lib
+import json
+import time
+import asyncio
+
+# local includes
+from catalog import Catalog
+from rcm_core import DEFAULT_CATALOG
+from support import wait_until
+
+HOST = 'login.cluster'
+QUEUES = ["1core_1gb_1h_slurm"]
+
+
+class FakeSession(object):
+    """
+    Answers the catalog of the host after a delay, or fails
+    """
+
+    def __init__(self, catalog=None, delay=0.0, error=None):
+        self.hostname = HOST
+        self.answer = catalog if catalog is not None else {'queues': QUEUES}
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def catalog(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+def stale_catalog(tmp_path, age):
+    """
+    :return: a catalog file holding the queues of the host, fetched age seconds ago
+    """
+    file_name = str(tmp_path / 'catalog.json')
+    with open(file_name, 'w') as catalog_file:
+        json.dump({HOST: {'queues': ["old_queue"], 'time': time.time() - age}}, catalog_file)
+    return file_name
+
+
+def test_unknown_host_gets_the_default_catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / 'catalog.json'))
+
+    assert catalog.get(HOST) == DEFAULT_CATALOG
+    assert catalog.is_stale(HOST)
+
+
+def test_refresh_saves_the_catalog_and_signals_the_change(qapp, tmp_path):
+    file_name = str(tmp_path / 'rcm' / 'catalog.json')
+    catalog = Catalog(file_name)
+    changes = []
+    catalog.catalog_changed.connect(lambda host, value: changes.append((host, value)))
+
+    catalog.refresh(FakeSession())
+    assert wait_until(lambda: changes, timeout=5, app=qapp)
+
+    expected = {'queues': QUEUES, 'vnc': DEFAULT_CATALOG['vnc']}
+    assert changes == [(HOST, expected)]
+    # the next start reads it from the disk, fresh
+    cached = Catalog(file_name)
+    assert cached.get(HOST) == expected
+    assert not cached.is_stale(HOST)
+
+
+def test_stale_catalog_is_served_while_it_is_refreshed(qapp, tmp_path):
+    catalog = Catalog(stale_catalog(tmp_path, 100), ttl=10)
+    changes = []
+    catalog.catalog_changed.connect(lambda host, value: changes.append(value))
+    session = FakeSession(delay=0.2)
+
+    catalog.refresh(session)
+    # the old lists meanwhile, a second refresh does not fetch again
+    assert catalog.get(HOST)['queues'] == ["old_queue"]
+    catalog.refresh(session)
+
+    assert wait_until(lambda: changes, timeout=5, app=qapp)
+    assert catalog.get(HOST)['queues'] == QUEUES
+    assert session.calls == 1
+
+
+def test_fresh_catalog_is_refreshed_only_when_forced(qapp, tmp_path):
+    catalog = Catalog(stale_catalog(tmp_path, 1), ttl=10)
+    session = FakeSession()
+
+    catalog.refresh(session)
+    assert session.calls == 0
+
+    catalog.refresh(session, force=True)
+    assert wait_until(lambda: catalog.get(HOST)['queues'] == QUEUES, timeout=5, app=qapp)
+    assert session.calls == 1
+
+
+def test_failed_refresh_keeps_the_cached_catalog(qapp, tmp_path):
+    catalog = Catalog(stale_catalog(tmp_path, 100), ttl=10)
+    changes = []
+    catalog.catalog_changed.connect(lambda host, value: changes.append(value))
+
+    catalog.refresh(FakeSession(error=OSError("connection lost")))
+    assert wait_until(lambda: not catalog._tasks, timeout=5, app=qapp)
+
+    assert catalog.get(HOST)['queues'] == ["old_queue"]
+    assert catalog.is_stale(HOST)
+    assert not changes
+
+
+def test_unchanged_catalog_is_not_signalled(qapp, tmp_path):
+    catalog = Catalog(stale_catalog(tmp_path, 100), ttl=10)
+    changes = []
+    catalog.catalog_changed.connect(lambda host, value: changes.append(value))
+
+    catalog.refresh(FakeSession({'queues': ["old_queue"]}))
+    assert wait_until(lambda: not catalog.is_stale(HOST), timeout=5, app=qapp)
+    wait_until(lambda: False, timeout=0.1, app=qapp)
+
+    assert not changes
@@ -0,0 +1,104 @@
+# std lib
+import time
+import tracemalloc
+
+import pytest
+
+# pyqt5
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication, QTableView
+
+# local includes
+from display_model import DisplayTableModel
+from support import report
+
+ROWS = 1000
+
+
+class CountingModel(DisplayTableModel):
+    """
+    Record the rows whose texts the view asked for
+    """
+
+    def __init__(self, parent=None):
+        super(CountingModel, self).__init__(parent)
+        self.rows_read = set()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            self.rows_read.add(index.row())
+        return DisplayTableModel.data(self, index, role)
+
+
+@pytest.fixture
+def view(qapp):
+    view = QTableView()
+    view.verticalHeader().setDefaultSectionSize(30)
+    view.resize(600, 300)
+    model = CountingModel(view)
+    view.setModel(model)
+    view.show()
+    qapp.processEvents()
+    yield view, model
+    view.deleteLater()
+    qapp.processEvents()
+
+
+def test_thousand_rows(qapp, view):
+    view, model = view
+    widgets = len(QApplication.allWidgets())
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    for row in range(ROWS):
+        model.add_display("display-%04d" % row, "Pending")
+    qapp.processEvents()
+    duration = time.perf_counter() - start
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    model.rows_read.clear()
+    view.viewport().repaint()
+
+    report("1000 display rows", insert_ms=1000 * duration, per_row_us=1e6 * duration / ROWS,
+           bytes_per_row=(after - before) / ROWS, painted_rows=len(model.rows_read))
+    assert model.rowCount() == ROWS
+    # no widget per row, and only the visible rows are painted
+    assert len(QApplication.allWidgets()) == widgets
+    assert 0 < len(model.rows_read) < 20
+    assert (after - before) / ROWS < 2048
+
+
+def test_update_changes_a_single_cell(qapp, view):
+    view, model = view
+    for row in range(ROWS):
+        model.add_display("display-%04d" % row, "Pending")
+    changes = []
+    model.dataChanged.connect(lambda first, last, roles: changes.append(
+        (first.row(), first.column(), last.row(), last.column())))
+
+    start = time.perf_counter()
+    model.set_fields("display-0500", {'status': "Running", 'time': "59:00"})
+    duration = time.perf_counter() - start
+    model.set_fields("display-0501", {'status': "Pending"})
+
+    report("status update", update_us=1e6 * duration)
+    assert changes == [(500, 1, 500, 1), (500, 2, 500, 2)]
+
+
+def test_remove_keeps_the_rows_in_order(qapp, view):
+    view, model = view
+    for row in range(ROWS):
+        model.add_display("display-%04d" % row)
+
+    start = time.perf_counter()
+    for row in range(0, ROWS, 2):
+        model.remove_display("display-%04d" % row)
+    duration = time.perf_counter() - start
+
+    report("500 removals", remove_ms=1000 * duration)
+    assert model.names() == ["display-%04d" % row for row in range(1, ROWS, 2)]
+    assert all(model.name(row) == name for row, name in enumerate(model.names()))
+    model.set_fields("display-0999", {'status': "Running"})
+    assert model.index(ROWS // 2 - 1, 1).data() == "Running"
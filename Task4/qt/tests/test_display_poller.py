@@ -0,0 +1,142 @@
+# std lib
+import os
+import time
+
+import pytest
+
+# local includes
+from rcm_core import Session
+from display_poller import DisplayStatusPoller
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+DISPLAYS = 300
+
+
+def fake_jobs(stub, count, running):
+    """
+    Put count jobs in the fake queue, the first running ones with their vnc server up
+    :return: the display names
+    """
+    jobs = stub.jobs(USER)
+    markers = os.path.join(stub.home(USER), '.rcm', 'displays')
+    os.makedirs(jobs, exist_ok=True)
+    os.makedirs(markers, exist_ok=True)
+    names = []
+    for i in range(count):
+        name = "display-%03d" % i
+        with open(os.path.join(jobs, name), 'w') as job_file:
+            job_file.write("%d|%s|rcm\n" % (1000 + i, name))
+        if i < running:
+            with open(os.path.join(markers, name + '.vnc'), 'w') as marker:
+                marker.write("vnc|%s|127.0.0.1|%d\n" % (name, 5900 + i))
+        names.append(name)
+    return names
+
+
+@pytest.fixture
+def session(ssh_server):
+    session = Session(HOST, ssh_server.port, USER).login(ssh_server.password)
+    yield session
+    session.logout()
+
+
+@pytest.fixture
+def poller(qapp, session):
+    poller = DisplayStatusPoller(busy_interval=50, base_interval=100, max_interval=400)
+    poller.subscribe('tab', session)
+    poller.set_visible('tab', True)
+    yield poller
+    poller.stop()
+
+
+def status_commands(stub):
+    return [command for command in stub.commands if command.startswith("squeue")]
+
+
+def test_one_query_per_tick_for_hundreds_of_displays(qapp, poller, ssh_server):
+    names = fake_jobs(ssh_server, DISPLAYS, running=DISPLAYS // 2)
+    changes = {}
+    ready = {}
+    poller.status_changed.connect(lambda name, diff: changes.setdefault(name, []).append(diff))
+    poller.display_ready.connect(lambda name, node, port: ready.__setitem__(name, (node, port)))
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for name in names:
+        poller.add_display(name, 'tab')
+    assert wait_until(lambda: len(changes) == DISPLAYS, timeout=20, app=qapp)
+    duration = time.perf_counter() - start
+
+    # a few more ticks with nothing changing
+    ticks = len(status_commands(ssh_server))
+    assert wait_until(lambda: len(status_commands(ssh_server)) >= ticks + 3, timeout=20, app=qapp)
+    cpu = time.process_time() - cpu_start
+
+    report("poller", displays=DISPLAYS, first_refresh_s=duration,
+           queries=len(status_commands(ssh_server)), cpu_s=cpu)
+    # one query for all the displays, not one per display
+    assert len(status_commands(ssh_server)) < 20
+    assert len(ready) == DISPLAYS // 2
+    assert changes["display-000"][0]['status'] == "Running"
+    assert changes["display-%03d" % (DISPLAYS - 1)][0]['status'] == "Pending"
+    # the unchanged rows were not notified again
+    assert all(len(diffs) == 1 for diffs in changes.values())
+
+
+def test_only_the_changed_labels_are_notified(qapp, poller, ssh_server):
+    fake_jobs(ssh_server, 1, running=0)
+    changes = []
+    poller.status_changed.connect(lambda name, diff: changes.append(diff))
+    poller.add_display("display-000", 'tab')
+    assert wait_until(lambda: changes, timeout=10, app=qapp)
+
+    fake_jobs(ssh_server, 1, running=1)
+    assert wait_until(lambda: len(changes) == 2, timeout=10, app=qapp)
+    assert changes[1] == {'status': "Running", 'time': "59:00"}
+
+
+def test_back_off_while_nothing_changes(qapp, poller, ssh_server):
+    fake_jobs(ssh_server, 1, running=1)
+    poller.add_display("display-000", 'tab')
+    assert wait_until(lambda: poller.endpoints, timeout=10, app=qapp)
+
+    assert wait_until(lambda: poller.interval == poller.max_interval, timeout=10, app=qapp)
+
+
+def test_hidden_tabs_are_not_polled(qapp, poller, ssh_server):
+    fake_jobs(ssh_server, 1, running=1)
+    poller.set_visible('tab', False)
+    poller.add_display("display-000", 'tab')
+
+    wait_until(lambda: False, timeout=0.5, app=qapp)
+    assert not status_commands(ssh_server)
+
+    poller.set_visible('tab', True)
+    assert wait_until(lambda: status_commands(ssh_server), timeout=10, app=qapp)
+
+
+def test_displays_shown_by_two_tabs(qapp, session, ssh_server):
+    first = Session(HOST, ssh_server.port, USER).login(ssh_server.password)
+    poller = DisplayStatusPoller(busy_interval=50, base_interval=100, max_interval=400)
+    for uuid, tab_session in (('first', first), ('second', session)):
+        poller.subscribe(uuid, tab_session)
+        poller.set_visible(uuid, True)
+    fake_jobs(ssh_server, 2, running=0)
+    poller.add_display("display-000", 'first')
+    poller.add_display("display-000", 'second')
+    poller.add_display("display-001", 'first')
+    assert wait_until(lambda: len(poller.statuses) == 2, timeout=10, app=qapp)
+
+    # the first tab is closed, its session was running the queries
+    first.logout()
+    poller.unsubscribe('first')
+    assert list(poller.displays) == ["display-000"]
+
+    changes = []
+    poller.status_changed.connect(lambda name, diff: changes.append((name, diff)))
+    fake_jobs(ssh_server, 2, running=1)
+    assert wait_until(lambda: changes, timeout=10, app=qapp)
+    assert changes == [("display-000", {'status': "Running", 'time': "59:00"})]
+    poller.stop()
@@ -0,0 +1,50 @@
+# std lib
+import os
+import time
+
+import pytest
+
+# pyqt5
+from PyQt5.QtCore import QSize
+
+# local includes
+import pyinstaller_utils
+from pyinstaller_utils import get_icon, preload_icons, icon_names
+from support import wait_until, report
+
+QT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def icons(qapp, monkeypatch):
+    # the paths are resolved from the directory of the sources, not the current one
+    monkeypatch.setattr(pyinstaller_utils, '_base_path', QT_DIR)
+    monkeypatch.setattr(pyinstaller_utils, '_icons', {})
+    return pyinstaller_utils._icons
+
+
+def load_all():
+    """
+    Request all the icons and paint them, as the widgets do
+    :return: the elapsed seconds
+    """
+    start = time.perf_counter()
+    for name in icon_names:
+        get_icon(name).pixmap(QSize(16, 16))
+    return time.perf_counter() - start
+
+
+def test_icons_are_loaded_once(icons):
+    cold = load_all()
+    cached = [load_all() for _ in range(100)]
+
+    report("icons", cold_ms=1000 * cold, cached_ms=1000 * min(cached))
+    assert get_icon(icon_names[0]) is get_icon(icon_names[0])
+    assert not get_icon(icon_names[0]).isNull()
+    assert min(cached) < cold
+
+
+def test_preload_fills_the_cache(icons, qapp):
+    preload_icons()
+    assert wait_until(lambda: len(icons) == len(icon_names), timeout=5, app=qapp)
+    assert all(not icon.isNull() for icon in icons.values())
@@ -0,0 +1,229 @@
+# std lib
+import os
+import time
+import threading
+
+import pytest
+
+# pyqt5
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# local includes
+import rcm_core
+import job_submission
+from rcm_core import Job, JobStore, Session, SUBMITTING, PENDING, RUNNING, VNC_READY, FAILED, \
+    FINISHED
+from job_submission import JobSubmitter, flush_jobs
+from display_poller import DisplayStatusPoller
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+QUEUE = "4core_18gb_1h_slurm"
+VNC = "fluxbox_turbovnc"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / 'jobs.json'))
+    monkeypatch.setattr(rcm_core, 'job_store', store)
+    monkeypatch.setattr(job_submission, 'job_store', store)
+    return store
+
+
+@pytest.fixture
+def session(ssh_server):
+    session = Session(HOST, ssh_server.port, USER).login(ssh_server.password)
+    yield session
+    session.logout()
+
+
+class StatusSource(QObject):
+    """
+    Stands in for the poller, the test sends the status changes
+    """
+
+    status_changed = pyqtSignal(str, dict)
+    display_ready = pyqtSignal(str, str, int)
+
+    displays = {}
+
+    def add_display(self, name, uuid):
+        pass
+
+    def remove_display(self, name, uuid):
+        pass
+
+
+def new_submitter(session, poller=None, uuid='tab'):
+    if poller is None:
+        poller = DisplayStatusPoller(busy_interval=50)
+    poller.subscribe(uuid, session)
+    poller.set_visible(uuid, True)
+    submitter = JobSubmitter(session, poller, uuid)
+    states = {}
+    submitter.job_changed.connect(lambda name, state: states.setdefault(name, []).append(state))
+    return submitter, states
+
+
+def stop(submitter):
+    submitter.close()
+    submitter.poller.stop()
+    assert flush_jobs(10)
+
+
+def sbatch_count(stub):
+    return sum(1 for command in stub.commands if "sbatch" in command)
+
+
+def test_store_merges_the_updates_of_other_clients(store):
+    gui = store
+    cli = JobStore(store.file_name)
+
+    gui.update("alice@host:22", Job("viz-1", QUEUE, VNC, "full_screen"))
+    cli.update("alice@host:22", Job("viz-2", QUEUE, VNC, "full_screen"))
+    gui.update("alice@host:22", Job("viz-1", QUEUE, VNC, "full_screen", PENDING, 1))
+
+    assert sorted(JobStore(store.file_name).load("alice@host:22")) == ["viz-1", "viz-2"]
+    assert sorted(gui.load("alice@host:22")) == ["viz-1", "viz-2"]
+
+    cli.update("alice@host:22", Job("viz-1", "", "", "", FINISHED))
+    assert list(gui.load("alice@host:22")) == ["viz-2"]
+    assert not os.path.exists(store.lock_file_name)
+
+
+def test_concurrent_updates_are_not_lost(store):
+    def submit(client):
+        client_store = JobStore(store.file_name)
+        for index in range(25):
+            client_store.update("alice@host:22", Job("viz-%d-%d" % (client, index),
+                                                     QUEUE, VNC, "full_screen"))
+
+    clients = [threading.Thread(target=submit, args=(client,)) for client in range(4)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    report("100 concurrent job updates", duration_s=time.perf_counter() - start)
+    assert len(store.load("alice@host:22")) == 100
+
+
+def test_stale_lock_is_removed(store):
+    store.lock_timeout = 0.2
+    os.makedirs(os.path.dirname(store.lock_file_name), exist_ok=True)
+    open(store.lock_file_name, 'w').close()
+    os.utime(store.lock_file_name, (time.time() - 1, time.time() - 1))
+
+    store.update("alice@host:22", Job("viz", QUEUE, VNC, "full_screen"))
+    assert list(store.load("alice@host:22")) == ["viz"]
+
+
+def test_parallel_submissions_reach_vnc_ready(qapp, store, session, ssh_server):
+    submitter, states = new_submitter(session)
+    names = ["viz-%d" % index for index in range(4)]
+
+    start = time.perf_counter()
+    for name in names:
+        submitter.submit(name, QUEUE, VNC, "1920x1080")
+    # the submissions run in background
+    assert time.perf_counter() - start < 0.5
+    assert all(submitter.jobs[name].state == SUBMITTING for name in names)
+
+    assert wait_until(lambda: all(submitter.jobs[name].state == VNC_READY for name in names),
+                      timeout=20, app=qapp)
+    report("4 parallel submissions", vnc_ready_s=time.perf_counter() - start)
+    stop(submitter)
+
+    assert sbatch_count(ssh_server) == 4
+    assert all(states[name][0] == PENDING and states[name][-1] == VNC_READY for name in names)
+    saved = store.load(session.key)
+    assert sorted(saved) == names
+    assert saved["viz-0"].endpoint == ("127.0.0.1", ssh_server.vnc_port)
+
+
+def test_restart_reattaches_instead_of_resubmitting(qapp, store, session, ssh_server):
+    submitter, _ = new_submitter(session)
+    submitter.submit("viz", QUEUE, VNC, "full_screen")
+    assert wait_until(lambda: submitter.jobs["viz"].state == VNC_READY, timeout=20, app=qapp)
+    stop(submitter)
+
+    # a client restarted, and one that stopped before the submission ended
+    store.update(session.key, Job("interrupted", QUEUE, VNC, "full_screen"))
+    submitter, _ = new_submitter(session)
+    reattached = submitter.reattach()
+
+    assert sorted(job.name for job in reattached) == ["interrupted", "viz"]
+    assert wait_until(lambda: submitter.jobs["interrupted"].state == VNC_READY,
+                      timeout=20, app=qapp)
+    assert submitter.jobs["viz"].state == VNC_READY
+    stop(submitter)
+    # only the interrupted submission was repeated
+    assert sbatch_count(ssh_server) == 2
+
+
+def test_two_tabs_do_not_reattach_the_same_jobs(qapp, store, session, ssh_server):
+    store.update(session.key, Job("interrupted", QUEUE, VNC, "full_screen"))
+    first, _ = new_submitter(session)
+    second, _ = new_submitter(session, first.poller, 'second')
+
+    assert [job.name for job in first.reattach()] == ["interrupted"]
+    assert second.reattach() == []
+    assert wait_until(lambda: first.jobs["interrupted"].state == VNC_READY,
+                      timeout=20, app=qapp)
+    second.close()
+    stop(first)
+    assert sbatch_count(ssh_server) == 1
+
+
+def test_store_updates_do_not_block_the_gui(qapp, store, session, ssh_server):
+    # another client holds the lock of the store
+    os.makedirs(os.path.dirname(store.lock_file_name), exist_ok=True)
+    open(store.lock_file_name, 'w').close()
+    submitter, _ = new_submitter(session)
+
+    start = time.perf_counter()
+    submitter.submit("viz", QUEUE, VNC, "full_screen")
+    duration = time.perf_counter() - start
+    assert not store.load(session.key)
+    os.remove(store.lock_file_name)
+
+    report("submission with the store locked", submit_ms=1000 * duration)
+    assert duration < 0.5
+    assert wait_until(lambda: submitter.jobs["viz"].state == VNC_READY, timeout=20, app=qapp)
+    stop(submitter)
+    saved = store.load(session.key)
+    assert list(saved) == ["viz"] and saved["viz"].state == VNC_READY
+
+
+def test_cancel_stops_polling_the_display(qapp, store, session, ssh_server):
+    submitter, _ = new_submitter(session)
+    submitter.submit("viz", QUEUE, VNC, "full_screen")
+    assert wait_until(lambda: submitter.jobs["viz"].state == VNC_READY, timeout=20, app=qapp)
+
+    submitter.cancel("viz")
+    assert "viz" not in submitter.poller.displays
+    assert "viz" not in submitter.poller.statuses
+    # nothing left to poll
+    assert not submitter.poller._timer.isActive()
+    stop(submitter)
+
+
+def test_only_the_end_states_close_a_job(qapp, store):
+    source = StatusSource()
+    submitter = JobSubmitter(Session(HOST, 22, USER), source, 'tab')
+    for name, state in (("pending", PENDING), ("ready", VNC_READY)):
+        submitter.jobs[name] = Job(name, QUEUE, VNC, "full_screen", state)
+
+    for status, expected in (("Configuring", PENDING), ("Completing", PENDING),
+                             ("Running", RUNNING), ("Suspended", RUNNING),
+                             ("Completing", RUNNING), ("Timeout", FAILED)):
+        source.status_changed.emit("pending", {'status': status})
+        assert submitter.jobs["pending"].state == expected, status
+
+    source.status_changed.emit("ready", {'status': "Completing"})
+    assert submitter.jobs["ready"].state == VNC_READY
+    source.status_changed.emit("ready", {'status': "Completed"})
+    assert submitter.jobs["ready"].state == FINISHED
+    submitter.close()
@@ -0,0 +1,98 @@
+# std lib
+import os
+import sys
+import gzip
+import time
+import logging
+import subprocess
+
+import pytest
+
+# local includes
+import logger as rcm_logger
+from logger import RotatingLogFileHandler, configure_file_logging, stop_file_logging, logger
+
+QT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def record(message):
+    return logging.LogRecord("RCM", logging.DEBUG, __file__, 0, message, None, None)
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    return str(tmp_path / 'Debug.log')
+
+
+def test_size_rotation_keeps_backup_count_files(log_file, tmp_path):
+    handler = RotatingLogFileHandler(log_file, max_bytes=100, backup_count=2)
+    try:
+        for index in range(20):
+            handler.emit(record("line %02d " % index + "x" * 40))
+    finally:
+        handler.close()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['Debug.log', 'Debug.log.1', 'Debug.log.2']
+    with open(log_file) as current, open(log_file + '.1') as previous:
+        assert "line 19" in current.read()
+        assert "line 17" in previous.read()
+
+
+def test_rotated_files_are_compressed(log_file, tmp_path):
+    handler = RotatingLogFileHandler(log_file, max_bytes=100, backup_count=3, compress=True)
+    try:
+        for index in range(6):
+            handler.emit(record("line %02d " % index + "x" * 40))
+    finally:
+        handler.close()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['Debug.log', 'Debug.log.1.gz', 'Debug.log.2.gz']
+    with gzip.open(log_file + '.1.gz', 'rt') as previous:
+        assert "line 03" in previous.read()
+    with gzip.open(log_file + '.2.gz', 'rt') as oldest:
+        assert "line 01" in oldest.read()
+
+
+def test_old_file_is_rotated(log_file, tmp_path):
+    handler = RotatingLogFileHandler(log_file, max_bytes=0, backup_count=2, rotate_interval=0.2)
+    try:
+        handler.emit(record("yesterday"))
+        handler.emit(record("still yesterday"))
+        time.sleep(0.3)
+        handler.emit(record("today"))
+    finally:
+        handler.close()
+
+    with open(log_file) as current, open(log_file + '.1') as previous:
+        assert current.read().strip() == "today"
+        assert previous.read().split() == ["yesterday", "still", "yesterday"]
+
+
+def test_file_logging_writes_from_the_listener(tmp_path):
+    log_dir = str(tmp_path / 'logs')
+    configure_file_logging(log_dir, level=logging.INFO)
+    try:
+        logger.debug("filtered")
+        logger.info("written")
+    finally:
+        # flushes the queue
+        stop_file_logging()
+
+    with open(os.path.join(log_dir, 'Debug.log')) as log:
+        lines = log.read().splitlines()
+    assert len(lines) == 1
+    assert lines[0].endswith(" - RCM - INFO - written")
+    assert rcm_logger._file_listener is None
+    assert not [handler for handler in logger.handlers
+                if isinstance(handler, rcm_logger.DeferredQueueHandler)]
+
+
+def test_import_does_not_start_the_file_logging(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path))
+    output = subprocess.run([sys.executable, '-c',
+                             "import logger; logger.logger.warning('imported'); "
+                             "print(logger._file_listener)"],
+                            cwd=QT_DIR, env=env, capture_output=True, text=True, timeout=60)
+
+    assert output.stdout.strip() == "None"
+    assert not os.path.exists(str(tmp_path / '.rcm'))
@@ -0,0 +1,111 @@
+# std lib
+import time
+
+import pytest
+
+# pyqt5
+from PyQt5.QtCore import QTimer
+
+# local includes
+from ssh import ssh_pool
+from ssh_stub import SSHStub
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+
+
+@pytest.fixture
+def slow_server():
+    """
+    A login node taking a second to check a password
+    """
+    stub = SSHStub(auth_delay=1.0)
+    stub.start()
+    yield stub
+    ssh_pool.close_all()
+    ssh_pool.credentials.clear()
+    stub.close()
+
+
+def session_widget(port, password):
+    from session_widget import QSessionWidget
+    widget = QSessionWidget(None)
+    widget.port = port
+    widget.host_line.setText(HOST)
+    widget.user_line.setText(USER)
+    widget.pssw_line.setText(password)
+    return widget
+
+
+class StallMeter(object):
+    """
+    Longest gap between the ticks of a 10 ms timer on the gui thread
+    """
+
+    def __init__(self):
+        self.last = None
+        self.longest = 0.0
+        self.timer = QTimer()
+        self.timer.setInterval(10)
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        self.last = time.perf_counter()
+        self.timer.start()
+
+    def tick(self):
+        now = time.perf_counter()
+        self.longest = max(self.longest, now - self.last)
+        self.last = now
+
+
+def test_login_does_not_block_the_gui(qapp, slow_server):
+    widget = session_widget(slow_server.port, slow_server.password)
+    logged_in = []
+    progress = []
+    widget.logged_in.connect(logged_in.append)
+    widget.progress.connect(progress.append)
+
+    meter = StallMeter()
+    meter.start()
+    start = time.perf_counter()
+    widget.login()
+    assert wait_until(lambda: logged_in, timeout=20, app=qapp)
+    duration = time.perf_counter() - start
+    meter.timer.stop()
+
+    report("login", duration_s=duration, longest_stall_ms=1000 * meter.longest)
+    assert logged_in == [USER + "@" + HOST]
+    assert progress
+    assert duration >= 1.0
+    assert meter.longest < 0.25
+    widget.close_session()
+
+
+def test_login_failure_is_signalled(qapp, slow_server):
+    widget = session_widget(slow_server.port, "WRONG")
+    failures = []
+    widget.login_failed.connect(failures.append)
+
+    widget.login()
+    assert wait_until(lambda: failures, timeout=20, app=qapp)
+    assert "invalid credentials" in failures[0]
+    assert widget.login_button.isEnabled()
+    assert widget.session is None
+
+
+def test_closing_the_tab_during_the_login_releases_the_connection(qapp, slow_server):
+    widget = session_widget(slow_server.port, slow_server.password)
+    logged_in = []
+    widget.logged_in.connect(logged_in.append)
+
+    widget.login()
+    wait_until(lambda: slow_server.handshakes, timeout=0.5, app=qapp)
+    widget.close_session()
+
+    key = (HOST, slow_server.port, USER)
+    # the login completes on the worker thread, then the connection is released
+    assert wait_until(lambda: key in ssh_pool._connections and
+                      ssh_pool._connections[key].users == 0, timeout=20, app=qapp)
+    assert not logged_in
@@ -0,0 +1,142 @@
+# std lib
+import json
+import time
+
+import pytest
+
+# local includes
+import metrics
+from metrics import Histogram, Registry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """
+    A registry of its own, with the metrics enabled
+    """
+    registry = Registry()
+    monkeypatch.setattr(metrics, 'enabled', True)
+    monkeypatch.setattr(metrics, 'registry', registry)
+    return registry
+
+
+def test_histogram_quantiles():
+    histogram = Histogram('op', buckets=(0.01, 0.1, 1.0))
+    for value in [0.005] * 90 + [0.05] * 9 + [3.0]:
+        histogram.observe(value)
+
+    assert histogram.count == 100
+    assert histogram.sum == pytest.approx(0.45 + 0.45 + 3.0)
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.95) == 0.1
+    # the last bucket is bounded by the largest value observed
+    assert histogram.quantile(1.0) == 3.0
+    assert Histogram('empty').quantile(0.5) == 0.0
+
+
+def test_timers_and_counters_aggregate(registry):
+    @metrics.timed('slot.work')
+    def work(duration):
+        time.sleep(duration)
+        return duration
+
+    assert work(0.01) == 0.01
+    work(0.02)
+    with metrics.timer('slot.work'):
+        pass
+    metrics.count('errors')
+    metrics.count('errors', 2)
+
+    snapshot = registry.snapshot()
+    histogram = snapshot['histograms']['slot.work']
+    assert histogram['count'] == 3
+    assert 0.03 <= histogram['sum'] < 0.5
+    assert histogram['max'] >= 0.02
+    assert sum(histogram['buckets'].values()) == 3
+    assert snapshot['counters'] == {'errors': 3}
+
+
+def test_failed_calls_are_timed(registry):
+    @metrics.timed('slot.fail')
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        fail()
+    assert registry.histogram('slot.fail').count == 1
+
+
+def test_disabled_metrics_leave_the_functions_untouched(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, 'enabled', False)
+    monkeypatch.setattr(metrics, 'registry', registry)
+
+    def work():
+        pass
+
+    assert metrics.timed('slot.work')(work) is work
+    with metrics.timer('slot.work'):
+        pass
+    metrics.count('errors')
+    metrics.gauge('value', lambda: 1)
+    assert registry.snapshot()['histograms'] == {}
+    assert registry.snapshot()['counters'] == {}
+    assert registry.snapshot()['gauges'] == {}
+
+
+def test_gauges_are_read_with_the_snapshot(registry):
+    values = [1]
+    metrics.gauge('queue.size', lambda: values[-1])
+    metrics.gauge('broken', lambda: 1 / 0)
+
+    values.append(5)
+    assert registry.snapshot()['gauges'] == {'broken': None, 'queue.size': 5}
+    # the broken gauge is left out of the prometheus export
+    assert "broken" not in registry.to_prometheus()
+
+
+def test_reset_keeps_the_timed_histograms(registry):
+    @metrics.timed('slot.work')
+    def work():
+        pass
+
+    work()
+    metrics.count('errors')
+    registry.reset()
+    work()
+
+    snapshot = registry.snapshot()
+    assert snapshot['histograms']['slot.work']['count'] == 1
+    assert snapshot['counters'] == {'errors': 0}
+
+
+def test_prometheus_buckets_are_cumulative(registry):
+    histogram = registry.histogram('ssh.auth')
+    for value in (0.0004, 0.003, 0.003, 100.0):
+        histogram.observe(value)
+    metrics.count('ssh.login_failures')
+    metrics.gauge('ssh.connections', lambda: 2)
+
+    lines = registry.to_prometheus().splitlines()
+    assert 'rcm_ssh_auth_seconds_bucket{le="0.0005"} 1' in lines
+    assert 'rcm_ssh_auth_seconds_bucket{le="0.005"} 3' in lines
+    assert 'rcm_ssh_auth_seconds_bucket{le="60.0"} 3' in lines
+    assert 'rcm_ssh_auth_seconds_bucket{le="+Inf"} 4' in lines
+    assert 'rcm_ssh_auth_seconds_count 4' in lines
+    assert 'rcm_ssh_login_failures_total 1' in lines
+    assert 'rcm_ssh_connections 2' in lines
+
+
+def test_write_replaces_the_file(registry, tmp_path):
+    metrics.count('errors')
+    json_file = str(tmp_path / 'metrics.json')
+    prometheus_file = str(tmp_path / 'metrics.prom')
+
+    metrics.write(json_file)
+    metrics.write(prometheus_file)
+
+    with open(json_file) as metrics_file:
+        assert json.load(metrics_file)['counters'] == {'errors': 1}
+    with open(prometheus_file) as metrics_file:
+        assert "rcm_errors_total 1\n" in metrics_file.read()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['metrics.json', 'metrics.prom']
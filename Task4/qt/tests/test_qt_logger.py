@@ -0,0 +1,110 @@
+# std lib
+import time
+import logging
+import resource
+import threading
+
+import pytest
+
+# pyqt5
+from PyQt5.QtWidgets import QPlainTextEdit
+
+# local includes
+from qt_logger import QTextEditLoggerHandler
+from support import wait_until, report
+
+RECORDS = 100000
+
+
+@pytest.fixture
+def log_pane(qapp):
+    text_edit = QPlainTextEdit()
+    handler = QTextEditLoggerHandler(text_edit, max_blocks=1000, max_queued=10000, interval=20)
+    # not registered in the logging tree, pytest would capture the records too
+    log = logging.Logger('rcm-tests.qt_logger', logging.DEBUG)
+    log.addHandler(handler)
+    yield log, handler, text_edit
+    log.removeHandler(handler)
+    handler.close()
+    text_edit.deleteLater()
+
+
+def peak_rss():
+    """
+    :return: the peak resident memory of the process in KB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def longest_flush(handler):
+    """
+    Wrap the flush of the handler to measure how long it blocks the gui thread
+    """
+    durations = []
+    flush_records = handler.flush_records
+
+    def timed():
+        start = time.perf_counter()
+        flush_records()
+        durations.append(time.perf_counter() - start)
+    handler.timer.timeout.disconnect()
+    handler.timer.timeout.connect(timed)
+    return durations
+
+
+def test_flood_from_a_worker_thread(qapp, log_pane):
+    log, handler, text_edit = log_pane
+    durations = longest_flush(handler)
+
+    def flood():
+        for i in range(RECORDS):
+            log.debug("record %d", i)
+
+    rss = peak_rss()
+    start = time.perf_counter()
+    thread = threading.Thread(target=flood)
+    thread.start()
+    while thread.is_alive():
+        qapp.processEvents()
+    emit_duration = time.perf_counter() - start
+    assert wait_until(lambda: not handler.records and handler.dropped == handler._reported_dropped,
+                      timeout=10, app=qapp)
+
+    report("100k records from a thread", emit_s=emit_duration,
+           longest_flush_ms=1000 * max(durations), flushes=len(durations),
+           blocks=text_edit.blockCount(), dropped=handler.dropped,
+           peak_rss_growth_mb=(peak_rss() - rss) / 1024)
+    assert text_edit.blockCount() <= handler.max_blocks
+    assert "record %d" % (RECORDS - 1) in text_edit.toPlainText() or handler.dropped
+    assert max(durations) < 0.5
+    # the queue and the block count bound the memory, not the number of records
+    assert peak_rss() - rss < 64 * 1024
+
+
+def test_flood_from_the_gui_thread(qapp, log_pane):
+    log, handler, text_edit = log_pane
+    durations = longest_flush(handler)
+
+    start = time.perf_counter()
+    for i in range(RECORDS):
+        log.debug("record %d", i)
+    emit_duration = time.perf_counter() - start
+    assert wait_until(lambda: not handler.records, timeout=10, app=qapp)
+
+    report("100k records from the gui thread", emit_s=emit_duration,
+           longest_flush_ms=1000 * max(durations), blocks=text_edit.blockCount(),
+           dropped=handler.dropped)
+    # nothing is drained while the gui thread logs, the queue keeps the first ones
+    assert handler.dropped == RECORDS - handler.max_queued
+    assert text_edit.blockCount() <= handler.max_blocks
+    assert "log records dropped" in text_edit.toPlainText()
+    assert emit_duration < 5
+
+
+def test_records_keep_their_order(qapp, log_pane):
+    log, handler, text_edit = log_pane
+    for i in range(10):
+        log.warning("line %d", i)
+    assert wait_until(lambda: text_edit.blockCount() == 10, timeout=5, app=qapp)
+    assert [line.split(" - ")[-1] for line in text_edit.toPlainText().splitlines()] == \
+        ["line %d" % i for i in range(10)]
@@ -0,0 +1,61 @@
+# std lib
+import os
+import asyncio
+
+import pytest
+
+# local includes
+from rcm_cli import BulkRunner, parse_targets, list_displays, submit_operation, kill_displays
+
+HOST = '127.0.0.1'
+USER = 'alice'
+QUEUE = "4core_18gb_1h_slurm"
+VNC = "fluxbox_turbovnc"
+
+
+def run(stub, targets, operation, with_display=False):
+    """
+    Run an operation of the command line on the stub
+    :return: the results
+    """
+    runner = BulkRunner(password=stub.password)
+    try:
+        return asyncio.run(runner.run(parse_targets(targets, with_display), operation))
+    finally:
+        runner.close()
+
+
+def queued(stub):
+    return sorted(os.listdir(stub.jobs(USER)))
+
+
+@pytest.fixture
+def queue(ssh_server):
+    """
+    A display submitted by rcm and a batch job of the user submitted without it
+    """
+    session = "%s@%s:%d" % (USER, HOST, ssh_server.port)
+    results = run(ssh_server, [session], submit_operation("viz", QUEUE, VNC, "full_screen"))
+    assert 'error' not in results[0]
+    with open(os.path.join(ssh_server.jobs(USER), "simulation"), 'w') as job_file:
+        job_file.write("4242|simulation|\n")
+    return session
+
+
+def test_list_shows_only_the_displays(ssh_server, queue):
+    results = run(ssh_server, [queue], list_displays)
+
+    assert [result['name'] for result in results] == ["viz"]
+
+
+def test_kill_all_spares_the_other_jobs(ssh_server, queue):
+    results = run(ssh_server, [queue + "/*"], kill_displays, with_display=True)
+
+    assert [(result['name'], result['status']) for result in results] == [("viz", "Killed")]
+    assert queued(ssh_server) == ["simulation"]
+
+
+def test_kill_by_name_spares_a_job_that_is_not_a_display(ssh_server, queue):
+    run(ssh_server, [queue + "/simulation"], kill_displays, with_display=True)
+
+    assert queued(ssh_server) == ["simulation", "viz"]
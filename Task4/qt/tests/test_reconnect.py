@@ -0,0 +1,105 @@
+# std lib
+import time
+import socket
+import struct
+
+import pytest
+
+# local includes
+from ssh import ssh_pool
+from rcm_core import Session
+from tunnel import tunnel_manager
+from fake_cluster import RFB_VERSION
+from connection_supervisor import ConnectionSupervisor, CONNECTED, RECONNECTING, DISCONNECTED
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+
+
+@pytest.fixture
+def session(ssh_server):
+    session = Session(HOST, ssh_server.port, USER).login(ssh_server.password)
+    yield session
+    session.logout()
+
+
+@pytest.fixture
+def supervisor(qapp, session):
+    supervisor = ConnectionSupervisor(HOST, session.port, USER, check_interval=100,
+                                      probe_timeout=1, base_delay=100, max_delay=400)
+    health = []
+    supervisor.health_changed.connect(health.append)
+    supervisor.start()
+    yield supervisor, health
+    supervisor.stop()
+
+
+def vnc_greeting(port):
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        greeting = b''
+        while len(greeting) < len(RFB_VERSION):
+            data = sock.recv(len(RFB_VERSION) - len(greeting))
+            if not data:
+                break
+            greeting += data
+        if greeting:
+            sock.sendall(struct.pack('>Q', 0))
+        return greeting
+
+
+def test_reconnect_after_a_drop(qapp, supervisor, ssh_server):
+    supervisor, health = supervisor
+    reconnected = []
+    supervisor.reconnected.connect(lambda: reconnected.append(time.perf_counter()))
+
+    ssh_server.stop()
+    dropped = time.perf_counter()
+    assert wait_until(lambda: health == [RECONNECTING], timeout=10, app=qapp)
+
+    # the attempts fail while the server is down
+    assert wait_until(lambda: supervisor.attempts >= 2, timeout=10, app=qapp)
+    ssh_server.start(ssh_server.port)
+
+    assert wait_until(lambda: reconnected, timeout=10, app=qapp)
+    report("reconnection", downtime_s=reconnected[0] - dropped, attempts=supervisor.attempts)
+    assert health == [RECONNECTING, CONNECTED]
+    assert ssh_server.handshakes == 2
+    assert ssh_pool.probe(HOST, ssh_server.port, USER)
+
+
+def test_expired_credentials_disconnect(qapp, supervisor, ssh_server):
+    supervisor, health = supervisor
+
+    ssh_server.password = "changed"
+    ssh_server.restart()
+
+    assert wait_until(lambda: DISCONNECTED in health, timeout=10, app=qapp)
+    assert health == [RECONNECTING, DISCONNECTED]
+
+
+def test_backoff_is_exponential_and_jittered(qapp, session):
+    supervisor = ConnectionSupervisor(HOST, session.port, USER, base_delay=1000, max_delay=8000)
+    for attempts, delay in ((0, 1000), (1, 2000), (2, 4000), (3, 8000), (6, 8000)):
+        supervisor.attempts = attempts
+        intervals = set()
+        for _ in range(20):
+            supervisor._schedule_reconnect()
+            intervals.add(supervisor._reconnect_timer.interval())
+        assert all(delay / 2 <= interval <= delay for interval in intervals)
+        assert len(intervals) > 1
+    supervisor.stop()
+
+
+def test_tunnels_move_to_the_new_connection(qapp, supervisor, session, ssh_server):
+    supervisor, health = supervisor
+    supervisor.reconnected.connect(session.move_tunnels)
+    tunnel = session.open_tunnel("viz", '127.0.0.1', ssh_server.vnc_port)
+    assert vnc_greeting(tunnel.local_port) == RFB_VERSION
+
+    ssh_server.restart()
+    assert wait_until(lambda: health == [RECONNECTING, CONNECTED], timeout=10, app=qapp)
+    # the viewer reconnects to the same local port
+    assert wait_until(lambda: tunnel.transport is session.transport(), timeout=5, app=qapp)
+    assert vnc_greeting(tunnel.local_port) == RFB_VERSION
+    assert tunnel in tunnel_manager.tunnels
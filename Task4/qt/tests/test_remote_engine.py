@@ -0,0 +1,144 @@
+# std lib
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+import pytest
+
+# local includes
+from ssh import ssh_pool
+from remote_engine import RemoteCommandEngine, RemoteCommandTimeout, AsyncLoopThread, event_loop
+from worker import AsyncTask
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+
+
+@pytest.fixture
+def engine(ssh_server):
+    ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    engine = RemoteCommandEngine(HOST, ssh_server.port, USER, max_concurrency=4)
+    yield engine
+    engine.close()
+    ssh_pool.release(HOST, ssh_server.port, USER)
+
+
+def wait(coro, timeout=30):
+    return event_loop.submit(coro).result(timeout)
+
+
+def test_commands_share_the_connection(engine, ssh_server):
+    results = wait(engine.run_many(["echo %d" % i for i in range(16)]))
+
+    assert [result.stdout for result in results] == ["%d\n" % i for i in range(16)]
+    assert all(result.ok() for result in results)
+    assert ssh_server.handshakes == 1
+
+
+def test_commands_run_concurrently_within_the_limit(engine):
+    start = time.perf_counter()
+    results = wait(engine.run_many(["sleep 0.3"] * 8))
+    duration = time.perf_counter() - start
+
+    report("8 commands of 0.3 s, 4 at a time", duration_s=duration)
+    assert all(result.ok() for result in results)
+    # two rounds of four, not eight one after the other
+    assert 0.6 <= duration < 2.0
+
+
+def test_stderr_and_exit_status(engine):
+    result = wait(engine.run("echo out; echo err >&2; exit 3"))
+    assert (result.exit_status, result.stdout, result.stderr) == (3, "out\n", "err\n")
+    assert not result.ok()
+
+
+def test_output_is_streamed_as_it_arrives(engine):
+    async def first_chunk():
+        start = time.perf_counter()
+        async for name, data in engine.stream("echo first; sleep 1; echo last"):
+            return name, data, time.perf_counter() - start
+
+    name, data, delay = wait(first_chunk())
+    assert (name, data) == ('stdout', b"first\n")
+    assert delay < 0.8
+
+
+def test_timeout(engine):
+    with pytest.raises(RemoteCommandTimeout):
+        wait(engine.run("sleep 5", timeout=0.3))
+
+
+def test_async_task_delivers_an_immediate_error(qapp):
+    async def fail():
+        raise ValueError("at once")
+
+    errors = []
+    AsyncTask(fail(), on_error=errors.append)
+
+    assert wait_until(lambda: errors, timeout=5, app=qapp)
+    assert str(errors[0]) == "at once"
+
+
+def test_async_task_delivers_the_result(qapp, engine):
+    results = []
+    AsyncTask(engine.run("echo ok"), on_result=results.append)
+
+    assert wait_until(lambda: results, timeout=10, app=qapp)
+    assert results[0].stdout == "ok\n"
+
+
+def test_async_task_delivers_after_the_caller_stored_it(qapp, monkeypatch):
+    def submit_done(coro):
+        coro.close()
+        future = concurrent.futures.Future()
+        future.set_result("done")
+        return future
+
+    # the coroutine ended before the done callback is added
+    monkeypatch.setattr(event_loop, 'submit', submit_done)
+    tasks = {}
+    delivered = []
+    tasks['done'] = AsyncTask(asyncio.sleep(0), lambda result:
+                              delivered.append(tasks.pop('done', None) is not None))
+
+    assert wait_until(lambda: delivered, timeout=5, app=qapp)
+    assert delivered == [True]
+
+
+def stop_loop_under_reader(ssh_server):
+    """
+    Stop the loop of a stream whose reader waits for the consumer
+    :return: True if the channel threads of the engine ended
+    """
+    loop_thread = AsyncLoopThread()
+    engine = RemoteCommandEngine(HOST, ssh_server.port, USER, queue_size=1)
+    started = threading.Event()
+
+    async def read_first_chunk():
+        async for item in engine.stream("head -c 10000000 /dev/zero"):
+            started.set()
+            # the reader fills the queue and waits for this consumer
+            await asyncio.sleep(60)
+
+    loop_thread.submit(read_first_chunk())
+    assert started.wait(10)
+    # the reader is blocked on the full queue when the loop stops
+    time.sleep(0.5)
+    loop_thread.stop()
+
+    # the channel threads of the engine end instead of waiting forever
+    closer = threading.Thread(target=engine._executor.shutdown, kwargs={'wait': True},
+                              daemon=True)
+    closer.start()
+    closer.join(5)
+    return not closer.is_alive()
+
+
+def test_reader_ends_when_the_loop_stops(ssh_server):
+    ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    try:
+        assert stop_loop_under_reader(ssh_server)
+    finally:
+        ssh_pool.release(HOST, ssh_server.port, USER)
@@ -0,0 +1,27 @@
+# local includes
+from session_history import SessionHistory
+
+
+def history(tmp_path, settings):
+    config_file = tmp_path / 'RCM2.cfg'
+    config_file.write_text("[LoginFields]\nhostList = [\"alice@host\"]\n\n[Settings]\n" + settings)
+    return SessionHistory(str(config_file))
+
+
+def test_integer_settings(qapp, tmp_path):
+    settings = history(tmp_path, "max_displays = 8\n")
+    assert settings.get_int('Settings', 'max_displays', 5) == 8
+    assert settings.get_int('Settings', 'stall_threshold', 1000) == 1000
+    assert list(settings.sessions) == ["alice@host"]
+
+
+def test_invalid_integer_settings_use_the_default(qapp, tmp_path, monkeypatch):
+    import session_widget
+    settings = history(tmp_path, "max_displays = many\nstall_threshold = 1.5s\n")
+    assert settings.get_int('Settings', 'max_displays', 5) == 5
+    assert settings.get_int('Settings', 'stall_threshold', 1000) == 1000
+
+    monkeypatch.setattr(session_widget, 'get_session_history', lambda: settings)
+    widget = session_widget.QSessionWidget(None)
+    assert widget.max_displays == 5
+    widget.deleteLater()
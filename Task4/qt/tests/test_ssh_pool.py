@@ -0,0 +1,210 @@
+# std lib
+import time
+import statistics
+
+import pytest
+import paramiko
+
+# local includes
+import ssh
+from ssh import SSHConnectionPool, is_authentication_error
+from ssh_stub import SSHStub, HOST_KEY
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+
+
+@pytest.fixture
+def pool():
+    pool = SSHConnectionPool(key_files=[])
+    yield pool
+    pool.close_all()
+
+
+def run(pool, port, command="echo ok"):
+    with pool.exec_stream(HOST, port, USER, command, timeout=30) as stream:
+        return stream.read()
+
+
+def test_commands_share_one_handshake(pool, ssh_server):
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    for _ in range(20):
+        assert run(pool, ssh_server.port) == (0, "ok\n", "")
+    pool.release(HOST, ssh_server.port, USER)
+
+    assert pool.handshakes == 1
+    assert ssh_server.handshakes == 1
+    assert len(ssh_server.commands) == 20
+
+
+def test_pooled_command_latency(pool, ssh_server):
+    """
+    A command on a new connection, as before the pool, and on the pooled one
+    """
+    unpooled = []
+    for _ in range(5):
+        start = time.perf_counter()
+        pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+        run(pool, ssh_server.port)
+        pool.release(HOST, ssh_server.port, USER)
+        pool.close(HOST, ssh_server.port, USER)
+        unpooled.append(time.perf_counter() - start)
+
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pooled = []
+    for _ in range(20):
+        start = time.perf_counter()
+        run(pool, ssh_server.port)
+        pooled.append(time.perf_counter() - start)
+    pool.release(HOST, ssh_server.port, USER)
+
+    report("command latency", unpooled_ms=1000 * statistics.median(unpooled),
+           pooled_ms=1000 * statistics.median(pooled), handshakes=pool.handshakes)
+    assert pool.handshakes == 6
+    assert statistics.median(pooled) < statistics.median(unpooled)
+
+
+def test_connections_are_keyed_by_user(pool, ssh_server):
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.acquire(HOST, ssh_server.port, "bob", ssh_server.password)
+    assert pool.handshakes == 2
+    assert run(pool, ssh_server.port) == (0, "ok\n", "")
+
+
+def test_wrong_password_does_not_share_the_connection(pool, ssh_server):
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+
+    with pytest.raises(Exception) as error:
+        pool.acquire(HOST, ssh_server.port, USER, "WRONG")
+    assert is_authentication_error(error.value)
+
+    # the same password, or none while it is cached, shares the connection
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.acquire(HOST, ssh_server.port, USER)
+    assert pool.handshakes == 1
+
+
+def test_wrong_password_fails_a_new_connection(pool, ssh_server):
+    with pytest.raises(Exception) as error:
+        pool.acquire(HOST, ssh_server.port, USER, "WRONG")
+    assert is_authentication_error(error.value)
+    assert not pool._connections
+
+
+def test_failed_login_releases_the_connection(pool, monkeypatch):
+    stub = SSHStub(refuse_exec=True)
+    stub.start()
+    monkeypatch.setattr(ssh, 'ssh_pool', pool)
+    try:
+        with pytest.raises(Exception):
+            ssh.ssh_login(HOST, stub.port, USER, stub.password, "ls")
+        assert pool._connections[(HOST, stub.port, USER)].users == 0
+    finally:
+        stub.close()
+
+
+def test_idle_connection_is_closed_without_pool_activity(ssh_server):
+    pool = SSHConnectionPool(key_files=[], idle_timeout=0.3)
+    try:
+        transport = pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+        pool.release(HOST, ssh_server.port, USER)
+        assert wait_until(lambda: not transport.is_active(), timeout=5)
+        assert not pool._connections
+    finally:
+        pool.close_all()
+
+
+def test_busy_connection_is_not_evicted(ssh_server):
+    pool = SSHConnectionPool(key_files=[], idle_timeout=0.2)
+    try:
+        transport = pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+        time.sleep(0.6)
+        assert transport.is_active()
+    finally:
+        pool.close_all()
+
+
+def test_dropped_connection_is_replaced(pool, ssh_server):
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    assert pool.probe(HOST, ssh_server.port, USER)
+
+    ssh_server.restart()
+    assert wait_until(lambda: not pool.probe(HOST, ssh_server.port, USER, timeout=1), timeout=5)
+
+    # the cached password opens the new connection
+    pool.acquire(HOST, ssh_server.port, USER)
+    assert run(pool, ssh_server.port) == (0, "ok\n", "")
+    assert pool.handshakes == 2
+
+
+def test_close_all_closes_the_transports(pool, ssh_server):
+    transport = pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.close_all()
+    assert not transport.is_active()
+    with pytest.raises(Exception):
+        pool.get_transport(HOST, ssh_server.port, USER)
+
+
+def test_host_key_is_saved_on_first_use(pool, ssh_server, tmp_path):
+    pool.known_hosts_file = str(tmp_path / '.ssh' / 'known_hosts')
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.close(HOST, ssh_server.port, USER)
+
+    host_keys = paramiko.HostKeys(pool.known_hosts_file)
+    assert host_keys.lookup("[%s]:%d" % (HOST, ssh_server.port)) == {HOST_KEY.get_name(): HOST_KEY}
+
+    # the known key is accepted and not saved again
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    with open(pool.known_hosts_file, 'r') as known_hosts:
+        assert len(known_hosts.readlines()) == 1
+
+
+def test_host_key_is_saved_after_a_line_without_newline(pool, ssh_server, tmp_path):
+    pool.known_hosts_file = str(tmp_path / 'known_hosts')
+    with open(pool.known_hosts_file, 'w') as known_hosts:
+        known_hosts.write("# no newline")
+
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+
+    with open(pool.known_hosts_file, 'r') as known_hosts:
+        lines = known_hosts.read().splitlines()
+    assert lines[0] == "# no newline"
+    assert lines[1].startswith("[%s]:%d " % (HOST, ssh_server.port))
+
+
+@pytest.mark.parametrize('new_key', [lambda: paramiko.ECDSAKey.generate(),
+                                     lambda: paramiko.RSAKey.generate(2048)],
+                         ids=['same_type', 'other_type'])
+def test_changed_host_key_is_rejected(pool, ssh_server, tmp_path, new_key):
+    pool.known_hosts_file = str(tmp_path / 'known_hosts')
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.close(HOST, ssh_server.port, USER)
+
+    # another server answers on the same address
+    ssh_server.stop()
+    impostor = SSHStub(host_key=new_key())
+    impostor.start(ssh_server.port)
+    try:
+        with pytest.raises(paramiko.BadHostKeyException):
+            pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+        assert not pool._connections
+    finally:
+        impostor.close()
+
+    with open(pool.known_hosts_file, 'r') as known_hosts:
+        assert len(known_hosts.readlines()) == 1
+
+
+def test_stats_count_the_connections_and_their_users(pool, ssh_server):
+    assert pool.stats() == {'connections': 0, 'users': 0, 'warm_ups': 0, 'handshakes': 0}
+
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    pool.acquire(HOST, ssh_server.port, "bob", ssh_server.password)
+    assert pool.stats() == {'connections': 2, 'users': 3, 'warm_ups': 0, 'handshakes': 2}
+
+    pool.release(HOST, ssh_server.port, USER)
+    pool.release(HOST, ssh_server.port, USER)
+    assert pool.stats()['users'] == 1
+    assert pool.stats()['connections'] == 2
@@ -0,0 +1,62 @@
+# std lib
+import os
+import re
+import sys
+import subprocess
+
+# local includes
+from support import report
+
+QT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_rcm(budget):
+    """
+    :return: the exit status and the startup marks in the order they were reported
+    """
+    process = subprocess.run([sys.executable, 'rcm.py', '--startup-budget', str(budget)],
+                             cwd=QT_DIR, capture_output=True, text=True, timeout=60)
+    marks = re.findall(r"startup: (.+?)\s+(\d+\.\d+)s", process.stderr)
+    return process.returncode, process.stderr, [(name, float(elapsed)) for name, elapsed in marks]
+
+
+def test_interactive_after_the_first_paint():
+    exit_code, output, marks = run_rcm(30)
+
+    report("startup", **dict((name.replace(' ', '_') + "_s", elapsed) for name, elapsed in marks))
+    assert exit_code == 0, output
+    names = [name for name, _ in marks]
+    assert names[-2:] == ["first paint", "interactive"]
+    assert "Time to interactive" in output
+    assert "Traceback" not in output
+
+
+def test_over_budget_fails():
+    exit_code, output, _ = run_rcm(0.001)
+
+    assert exit_code == 1, output
+    assert "Traceback" not in output
+
+
+class ExitRecorder(object):
+
+    def __init__(self):
+        self.exit_codes = []
+
+    def exit(self, exit_code):
+        self.exit_codes.append(exit_code)
+
+
+def test_budget_run_preloads_the_icons(qapp, monkeypatch):
+    import rcm
+    import startup_timer
+    preloads = []
+    monkeypatch.setattr(rcm, 'preload_icons',
+                        lambda: preloads.append(startup_timer.elapsed("interactive")))
+
+    app = ExitRecorder()
+    rcm.on_startup_done(app, startup_budget=30)
+
+    # the same startup as without budget, the preload after the measure
+    assert len(preloads) == 1 and preloads[0] is not None
+    assert app.exit_codes == [0]
@@ -0,0 +1,119 @@
+# std lib
+import time
+import resource
+
+import pytest
+
+# local includes
+from ssh import ssh_pool, CommandStream
+from remote_engine import RemoteCommandEngine, event_loop
+from support import report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+SIZE = 500 * 1000 * 1000
+
+
+@pytest.fixture
+def connected(ssh_server):
+    ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    yield ssh_server
+    ssh_pool.release(HOST, ssh_server.port, USER)
+
+
+def peak_rss():
+    """
+    :return: the peak resident memory of the process in KB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def test_large_output_is_streamed_in_bounded_memory(connected):
+    engine = RemoteCommandEngine(HOST, connected.port, USER)
+
+    async def consume():
+        sizes = {'stdout': 0, 'stderr': 0}
+        largest = 0
+        exit_status = None
+        async for name, data in engine.stream("head -c %d /dev/zero; echo done >&2" % SIZE):
+            if name == 'exit':
+                exit_status = data
+                continue
+            sizes[name] += len(data)
+            largest = max(largest, len(data))
+        return sizes, largest, exit_status
+
+    rss = peak_rss()
+    start = time.perf_counter()
+    sizes, largest, exit_status = event_loop.submit(consume()).result(300)
+    duration = time.perf_counter() - start
+    engine.close()
+
+    report("500 MB stream", mb_s=SIZE / duration / 1e6, largest_chunk=largest,
+           peak_rss_growth_mb=(peak_rss() - rss) / 1024)
+    assert sizes == {'stdout': SIZE, 'stderr': len("done\n")}
+    assert exit_status == 0
+    assert largest <= engine.chunk_size
+    # the client and the stub in the same process, far from the 500 MB of the output
+    assert peak_rss() - rss < 100 * 1024
+
+
+def test_output_written_just_before_the_exit_is_not_lost(connected):
+    """
+    The exit status arrives right after the last output
+    """
+    for size in (1, 4096, 100000):
+        for _ in range(20):
+            with ssh_pool.exec_stream(HOST, connected.port, USER,
+                                      "head -c %d /dev/zero; printf e >&2" % size,
+                                      timeout=30) as stream:
+                sizes = {'stdout': 0, 'stderr': 0}
+                for name, data in stream.chunks():
+                    sizes[name] += len(data)
+            assert sizes == {'stdout': size, 'stderr': 1}
+            assert stream.exit_status == 0
+
+
+class RacingChannel(object):
+    """
+    A channel whose last output and exit status arrive together, right
+    after the reader found the buffers empty
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.stdout = [b'first']
+        self.stderr = []
+        self.exited = False
+        self.checks = 0
+
+    def recv_ready(self):
+        return bool(self.stdout)
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr)
+
+    def recv(self, size):
+        return self.stdout.pop(0)
+
+    def recv_stderr(self, size):
+        return self.stderr.pop(0)
+
+    def exit_status_ready(self):
+        self.checks += 1
+        if self.checks == 1:
+            self.stdout.append(b'last')
+            self.stderr.append(b'error')
+            self.exited = True
+        return self.exited
+
+    def recv_exit_status(self):
+        return 0
+
+
+def test_final_drain_after_the_exit_status():
+    stream = CommandStream(RacingChannel(), "command")
+    assert list(stream.chunks()) == [('stdout', b'first'), ('stdout', b'last'),
+                                     ('stderr', b'error')]
+    assert stream.exit_status == 0
@@ -0,0 +1,148 @@
+# std lib
+import time
+import statistics
+
+import pytest
+
+# pyqt5
+from PyQt5.QtCore import QCoreApplication, QEvent
+from PyQt5.QtWidgets import QApplication
+
+# local includes
+from logger import logger
+from support import report
+
+TABS = 50
+
+
+@pytest.fixture
+def main_widget(qapp):
+    import rcm
+    handlers = list(logger.handlers)
+    window = rcm.RCMMainWindow()
+    window.show()
+    qapp.processEvents()
+    yield window.main_widget
+    window.close()
+    for handler in logger.handlers:
+        if handler not in handlers:
+            logger.removeHandler(handler)
+            handler.close()
+    window.deleteLater()
+    settle(qapp)
+
+
+def settle(app):
+    """
+    Run the pending events, the deferred deletions included
+    """
+    app.processEvents()
+    QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+    app.processEvents()
+
+
+def session_widget_count():
+    from session_widget import QSessionWidget
+    return sum(1 for widget in QApplication.allWidgets() if isinstance(widget, QSessionWidget))
+
+
+def time_new_tab(main_widget):
+    start = time.perf_counter()
+    main_widget.on_new()
+    return time.perf_counter() - start
+
+
+def test_plus_tab_is_a_placeholder(main_widget):
+    from session_widget import QSessionWidget
+    tabs = main_widget.tabs
+    assert tabs.widget(tabs.count() - 1) is main_widget.plus_tab
+    assert not isinstance(main_widget.plus_tab, QSessionWidget)
+    assert len(main_widget.session_widgets()) == 1
+
+
+def test_new_tab_from_the_pool(qapp, main_widget):
+    pool = main_widget.widget_pool
+
+    settle(qapp)
+    assert len(pool.widgets) == pool.size
+    pooled = []
+    for _ in range(TABS):
+        pooled.append(time_new_tab(main_widget))
+        # the pool is refilled while the event loop is idle
+        settle(qapp)
+
+    pool.size = 0
+    pool.widgets = []
+    cold = [time_new_tab(main_widget) for _ in range(10)]
+
+    report("time to new tab", pooled_ms=1000 * statistics.median(pooled),
+           built_ms=1000 * statistics.median(cold))
+    assert statistics.median(pooled) < statistics.median(cold)
+
+
+def test_closed_tabs_release_their_widgets(qapp, main_widget):
+    settle(qapp)
+    resident = session_widget_count()
+
+    for _ in range(TABS):
+        main_widget.on_new()
+    settle(qapp)
+    assert session_widget_count() == resident + TABS
+
+    for widget in main_widget.session_widgets()[1:]:
+        main_widget.on_close(widget.uuid)
+    settle(qapp)
+
+    report("resident session widgets", before=resident, tabs=TABS,
+           after_close=session_widget_count())
+    assert len(main_widget.session_widgets()) == 1
+    assert session_widget_count() == resident
+    assert main_widget.tabs.count() == 2
+
+
+def test_thousands_of_tabs_keep_a_flat_latency(qapp, main_widget):
+    """
+    Open and close 2000 tabs, 20 of them open at a time
+    """
+    tabs = main_widget.tabs
+    open_times = []
+    close_times = []
+    for cycle in range(2000):
+        open_times.append(time_new_tab(main_widget))
+        if len(tabs.session_widgets()) > 20:
+            uuid = tabs.session_widgets()[1].uuid
+            start = time.perf_counter()
+            main_widget.on_close(uuid)
+            close_times.append(time.perf_counter() - start)
+        if cycle % 10 == 0:
+            settle(qapp)
+    settle(qapp)
+
+    first_open, last_open = statistics.median(open_times[:200]), statistics.median(open_times[-200:])
+    first_close, last_close = (statistics.median(close_times[:200]),
+                               statistics.median(close_times[-200:]))
+    report("2000 tabs", first_open_ms=1000 * first_open, last_open_ms=1000 * last_open,
+           first_close_ms=1000 * first_close, last_close_ms=1000 * last_close,
+           resident_widgets=session_widget_count())
+    assert last_open < 2 * first_open
+    assert last_close < 2 * first_close
+    assert session_widget_count() <= 21 + main_widget.widget_pool.size
+
+
+def test_lookup_does_not_depend_on_the_tab_count(qapp, main_widget):
+    tabs = main_widget.tabs
+    uuid = tabs.session_widgets()[0].uuid
+
+    def lookup_time():
+        start = time.perf_counter()
+        for _ in range(1000):
+            tabs.session_widget(uuid)
+        return (time.perf_counter() - start) / 1000
+
+    one = lookup_time()
+    for _ in range(200):
+        main_widget.on_new()
+    many = lookup_time()
+
+    report("uuid lookup", one_tab_us=1e6 * one, tabs_200_us=1e6 * many)
+    assert many < 5 * one
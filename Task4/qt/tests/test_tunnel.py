@@ -0,0 +1,256 @@
+# std lib
+import time
+import socket
+import struct
+import threading
+import statistics
+
+import pytest
+
+# local includes
+from ssh import ssh_pool
+from tunnel import TunnelManager
+from fake_cluster import RFB_VERSION
+from support import wait_until, report
+
+HOST = '127.0.0.1'
+USER = 'alice'
+BULK = 64 * 1024 * 1024
+
+
+@pytest.fixture
+def transport(ssh_server):
+    transport = ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    yield transport
+    ssh_pool.release(HOST, ssh_server.port, USER)
+
+
+@pytest.fixture
+def manager():
+    manager = TunnelManager()
+    yield manager
+    manager.stop()
+
+
+@pytest.fixture
+def echo_port():
+    """
+    A server sending back what it receives
+    """
+    listen_socket = socket.socket()
+    listen_socket.bind(('127.0.0.1', 0))
+    listen_socket.listen(8)
+
+    def echo(sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with sock:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                sock.sendall(data)
+
+    def accept():
+        while True:
+            try:
+                sock, _ = listen_socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=echo, args=(sock,), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield listen_socket.getsockname()[1]
+    listen_socket.close()
+
+
+def download(port, size):
+    """
+    Ask the fake vnc server for size bytes
+    :return: the seconds taken by the transfer
+    """
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        greeting = b''
+        while len(greeting) < len(RFB_VERSION):
+            greeting += sock.recv(len(RFB_VERSION) - len(greeting))
+        assert greeting == RFB_VERSION
+
+        buffer = bytearray(1024 * 1024)
+        start = time.perf_counter()
+        sock.sendall(struct.pack('>Q', size))
+        remaining = size
+        while remaining:
+            received = sock.recv_into(buffer, min(remaining, len(buffer)))
+            assert received
+            remaining -= received
+        return time.perf_counter() - start
+
+
+def round_trips(port, count=200):
+    """
+    :return: the durations of count one byte round trips
+    """
+    durations = []
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for _ in range(count):
+            start = time.perf_counter()
+            sock.sendall(b'x')
+            assert sock.recv(1) == b'x'
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def test_bulk_throughput(manager, transport, ssh_server):
+    tunnel = manager.open_tunnel(transport, '127.0.0.1', ssh_server.vnc_port)
+
+    direct = download(ssh_server.vnc_port, BULK)
+    tunnelled = download(tunnel.local_port, BULK)
+
+    report("tunnel throughput", direct_mb_s=BULK / direct / 1e6,
+           tunnel_mb_s=BULK / tunnelled / 1e6)
+    assert tunnel.bytes_received >= BULK
+    assert BULK / tunnelled / 1e6 > 5
+
+
+def test_added_latency(manager, transport, echo_port):
+    tunnel = manager.open_tunnel(transport, '127.0.0.1', echo_port)
+
+    direct = statistics.median(round_trips(echo_port))
+    tunnelled = statistics.median(round_trips(tunnel.local_port))
+
+    report("tunnel latency", direct_ms=1000 * direct, tunnel_ms=1000 * tunnelled,
+           added_ms=1000 * (tunnelled - direct))
+    assert tunnelled - direct < 0.02
+
+
+def tunnel_threads():
+    return [thread.name for thread in threading.enumerate() if thread.name.startswith("rcm-tunnel")]
+
+
+def test_concurrent_streams_share_one_thread(manager, transport, ssh_server):
+    # the shared manager may be running for the other tests
+    threads_before = len(tunnel_threads())
+    tunnels = [manager.open_tunnel(transport, '127.0.0.1', ssh_server.vnc_port)
+               for _ in range(4)]
+    assert len(set(tunnel.local_port for tunnel in tunnels)) == 4
+
+    durations = []
+    clients = [threading.Thread(target=lambda port=tunnel.local_port:
+                                durations.append(download(port, BULK // 8)))
+               for tunnel in tunnels for _ in range(2)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join(60)
+    duration = time.perf_counter() - start
+
+    report("8 concurrent streams", total_mb_s=BULK / duration / 1e6)
+    assert len(durations) == 8
+    assert sum(tunnel.bytes_received for tunnel in tunnels) >= BULK
+    # the selector and the channel openers, no thread per forwarded socket,
+    # the stub in the same process has its own threads
+    assert manager._thread.name == "rcm-tunnels"
+    assert len(tunnel_threads()) - threads_before <= 1 + 4
+
+
+def test_closed_tunnel_stops_listening(manager, transport, ssh_server):
+    tunnel = manager.open_tunnel(transport, '127.0.0.1', ssh_server.vnc_port)
+    download(tunnel.local_port, 1024)
+    manager.close_tunnel(tunnel)
+
+    assert wait_until(lambda: tunnel not in manager.tunnels, timeout=5)
+    with pytest.raises(OSError):
+        socket.create_connection(('127.0.0.1', tunnel.local_port), timeout=1)
+    assert manager.bytes_transferred()[1] >= 1024
+
+
+def test_upload_waits_for_the_channel_window(manager, transport):
+    size = 48 * 1024 * 1024
+    received = []
+    listen_socket = socket.socket()
+    listen_socket.bind(('127.0.0.1', 0))
+    listen_socket.listen(1)
+
+    def read_late():
+        sock, _ = listen_socket.accept()
+        # meanwhile the window of the channel fills up
+        time.sleep(1)
+        total = 0
+        with sock:
+            while total < size:
+                data = sock.recv(1024 * 1024)
+                if not data:
+                    break
+                total += len(data)
+        received.append(total)
+
+    reader = threading.Thread(target=read_late)
+    reader.start()
+    tunnel = manager.open_tunnel(transport, '127.0.0.1', listen_socket.getsockname()[1])
+    full = []
+    flush_to_channel = manager._flush_to_channel
+    manager._flush_to_channel = lambda forward: flush_to_channel(forward) or full.append(1)
+
+    start = time.perf_counter()
+    with socket.create_connection(('127.0.0.1', tunnel.local_port)) as sock:
+        sock.sendall(b'x' * size)
+        reader.join(60)
+    duration = time.perf_counter() - start
+    listen_socket.close()
+
+    report("tunnel upload, late reader", mb_s=size / duration / 1e6, full_window_retries=len(full))
+    assert received == [size]
+    assert wait_until(lambda: tunnel.bytes_sent == size, timeout=5)
+    # backing off, not retrying every few ms for the whole second
+    assert 0 < len(full) < 100
+
+
+def test_stop_ends_the_threads_and_the_tunnels_can_reopen(transport, ssh_server):
+    manager = TunnelManager()
+    tunnel = manager.open_tunnel(transport, '127.0.0.1', ssh_server.vnc_port)
+    download(tunnel.local_port, 1024)
+
+    selector_thread = manager._thread
+    opener_threads = list(manager._executor._threads)
+    assert opener_threads
+
+    manager.stop()
+    assert not selector_thread.is_alive()
+    assert wait_until(lambda: not any(thread.is_alive() for thread in opener_threads), timeout=5)
+    with pytest.raises(OSError):
+        socket.create_connection(('127.0.0.1', tunnel.local_port), timeout=1)
+    # once stopped the requests are ignored
+    manager.close_tunnel(tunnel)
+
+    tunnel = manager.open_tunnel(transport, '127.0.0.1', ssh_server.vnc_port)
+    try:
+        download(tunnel.local_port, 1024)
+    finally:
+        manager.stop()
+
+
+def test_requests_racing_the_stop(transport, ssh_server):
+    errors = []
+
+    def request(manager, tunnel, stopped):
+        try:
+            while not stopped.is_set():
+                manager.set_transport(tunnel, transport)
+        except Exception as e:
+            errors.append(e)
+
+    for _ in range(20):
+        manager = TunnelManager()
+        tunnel = manager.open_tunnel(transport, '127.0.0.1', ssh_server.vnc_port)
+        stopped = threading.Event()
+        threads = [threading.Thread(target=request, args=(manager, tunnel, stopped))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        manager.stop()
+        stopped.set()
+        for thread in threads:
+            thread.join(5)
+
+    assert not errors
@@ -0,0 +1,80 @@
+# std lib
+import socket
+
+import paramiko
+
+# local includes
+from ssh import ssh_pool, ssh_warm_up
+from session_history import SessionHistory
+from ssh_stub import SSHStub
+from support import wait_until
+
+HOST = '127.0.0.1'
+USER = 'alice'
+
+
+def history(tmp_path, *session_names):
+    config_file = tmp_path / 'RCM2.cfg'
+    config_file.write_text('[LoginFields]\nhostList = [%s]\n' %
+                           ", ".join('"%s"' % name for name in session_names))
+    return SessionHistory(str(config_file))
+
+
+def test_login_reuses_the_warmed_up_connection(qapp, tmp_path, ssh_server):
+    recent = history(tmp_path, "%s@%s:%d" % (USER, HOST, ssh_server.port))
+
+    ssh_warm_up(list(recent.sessions))
+    assert wait_until(lambda: ssh_server.handshakes == 1, timeout=10)
+    # the key exchange is done, the user authenticates at the login
+    assert ssh_server.password_checks == 0
+
+    ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    assert ssh_server.handshakes == 1
+    assert ssh_server.password_checks == 1
+    assert not ssh_pool._warm
+
+
+def test_warm_up_skips_the_connected_hosts(qapp, tmp_path, ssh_server):
+    ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+
+    ssh_warm_up(["bob@%s:%d" % (HOST, ssh_server.port)])
+
+    assert not ssh_pool._warm
+    assert ssh_server.handshakes == 1
+
+
+def test_warm_up_with_a_key_authenticates_in_advance(qapp, tmp_path, monkeypatch):
+    key = paramiko.ECDSAKey.generate()
+    key_file = str(tmp_path / 'id_ecdsa')
+    key.write_private_key_file(key_file)
+    monkeypatch.setattr(ssh_pool, 'key_files', [key_file])
+    stub = SSHStub(authorized_keys=[key])
+    stub.start()
+    try:
+        ssh_warm_up(["%s@%s:%d" % (USER, HOST, stub.port)])
+        assert wait_until(lambda: (HOST, stub.port, USER) in ssh_pool._connections, timeout=10)
+
+        ssh_pool.acquire(HOST, stub.port, USER)
+        assert stub.handshakes == 1
+        assert stub.password_checks == 0
+    finally:
+        ssh_pool.close_all()
+        stub.close()
+
+
+def test_failed_warm_up_does_not_break_the_login(qapp, ssh_server, monkeypatch):
+    def fail(hostname, port, username):
+        raise socket.timeout("timed out")
+
+    monkeypatch.setattr(ssh_pool, '_warm_up', fail)
+    ssh_warm_up(["%s@%s:%d" % (USER, HOST, ssh_server.port)])
+
+    ssh_pool.acquire(HOST, ssh_server.port, USER, ssh_server.password)
+    assert ssh_server.handshakes == 1
+    assert not ssh_pool._warm
+
+
+def test_invalid_sessions_are_not_warmed_up(qapp):
+    ssh_warm_up(["%s@%s:ssh" % (USER, HOST), "%s@" % USER])
+
+    assert not ssh_pool._warm
@@ -0,0 +1,108 @@
+# std lib
+import sys
+import time
+import logging
+
+import pytest
+
+# pyqt5
+from PyQt5.QtCore import QTimer
+
+# local includes
+import metrics
+from metrics import Registry
+from watchdog import StallWatchdog, slot_name
+
+
+@pytest.fixture
+def watchdog(qapp):
+    watchdog = StallWatchdog(threshold=200, interval=20)
+    yield watchdog
+    watchdog.stop()
+
+
+def run_event_loop(qapp, watchdog, timeout, until=lambda: False):
+    """
+    Start the watchdog and run the events here, as rcm.main does with exec_
+    """
+    watchdog.start()
+    deadline = time.time() + timeout
+    while not until() and time.time() < deadline:
+        qapp.processEvents()
+        time.sleep(0.005)
+
+
+def blocking_slot():
+    time.sleep(0.5)
+
+
+def test_stall_is_attributed_to_the_blocking_slot(qapp, watchdog, caplog):
+    QTimer.singleShot(0, blocking_slot)
+    with caplog.at_level(logging.WARNING, logger='RCM'):
+        run_event_loop(qapp, watchdog, 5, lambda: watchdog.histograms)
+
+    assert list(watchdog.histograms) == ["test_watchdog.blocking_slot"]
+    histogram = watchdog.histograms["test_watchdog.blocking_slot"]
+    assert histogram.count == 1
+    assert 0.25 < histogram.sum < 1.0
+    # the stack is logged while the gui is blocked, the duration after
+    messages = [record.getMessage() for record in caplog.records]
+    assert "The gui is blocked since" in messages[0]
+    assert "time.sleep(0.5)" in messages[0]
+    assert "The gui was blocked for" in messages[1]
+
+
+def test_stall_skips_the_timing_wrapper(qapp, watchdog, monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, 'enabled', True)
+    monkeypatch.setattr(metrics, 'registry', registry)
+
+    @metrics.timed('slot.timed')
+    def timed_slot():
+        time.sleep(0.4)
+
+    QTimer.singleShot(0, timed_slot)
+    run_event_loop(qapp, watchdog, 5, lambda: watchdog.histograms)
+
+    slot = "test_watchdog.test_stall_skips_the_timing_wrapper.<locals>.timed_slot"
+    assert list(watchdog.histograms) == [slot]
+    assert registry.snapshot()['histograms']['stall.' + slot]['count'] == 1
+
+
+def test_short_slots_are_not_stalls(qapp, watchdog):
+    for delay in range(0, 500, 50):
+        QTimer.singleShot(delay, lambda: time.sleep(0.05))
+    run_event_loop(qapp, watchdog, 0.8)
+
+    assert not watchdog.histograms
+
+
+def test_report_lists_the_longest_stalls_first(watchdog):
+    for slot, durations in (("session_widget.refresh", [0.5, 0.5]),
+                            ("rcm.on_login", [3.0]),
+                            ("display_dialog.accept", [0.2])):
+        watchdog.histograms[slot] = metrics.Histogram(slot)
+        for duration in durations:
+            watchdog.histograms[slot].observe(duration)
+
+    lines = []
+
+    class ReportLogger(object):
+        def debug(self, message):
+            lines.append(message)
+
+    watchdog.report(ReportLogger())
+
+    assert [line.split()[1] for line in lines] == ["rcm.on_login", "session_widget.refresh",
+                                                  "display_dialog.accept"]
+    assert lines[1].split()[2:] == ["2,", "total", "1.00s,", "max", "0.50s"]
+
+
+def test_slot_name_of_the_loop_itself():
+    loop_frame = sys._getframe()
+
+    def slot():
+        return slot_name(sys._getframe(), loop_frame)
+
+    assert slot() == "test_watchdog.test_slot_name_of_the_loop_itself.<locals>.slot"
+    assert slot_name(loop_frame, loop_frame) == "test_watchdog.test_slot_name_of_the_loop_itself"
@@ -0,0 +1,94 @@
+# std lib
+import os
+import sys
+import time
+import subprocess
+import threading
+
+# local includes
+from worker import Worker, start_worker, cancel_worker, stop_workers, thread_pool
+from support import wait_until
+
+QT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def blocked_worker(release, results, started=None):
+    def wait():
+        if started is not None:
+            started.set()
+        return release.wait(10)
+    worker = Worker(wait)
+    worker.signals.result.connect(results.append)
+    worker.signals.finished.connect(lambda: results.append('finished'))
+    return worker
+
+
+def test_worker_delivers_its_result(qapp):
+    results = []
+    worker = Worker(lambda value, progress: progress("half") or value * 2, 21, with_progress=True)
+    worker.signals.progress.connect(results.append)
+    worker.signals.result.connect(results.append)
+    start_worker(worker)
+    assert wait_until(lambda: len(results) == 2, timeout=5, app=qapp)
+    assert results == ["half", 42]
+
+
+def test_cancelled_worker_does_not_signal(qapp):
+    release = threading.Event()
+    started = threading.Event()
+    results = []
+    cancelled = []
+    worker = blocked_worker(release, results, started)
+    worker.on_cancelled = cancelled.append
+    start_worker(worker)
+
+    assert started.wait(5)
+    cancel_worker(worker)
+    release.set()
+    assert wait_until(lambda: cancelled, timeout=5, app=qapp)
+    wait_until(lambda: False, timeout=0.2, app=qapp)
+    assert cancelled == [True]
+    assert not results
+
+
+def test_stop_workers_cancels_the_queued_and_waits_for_the_running(qapp):
+    release = threading.Event()
+    results = []
+    workers = [start_worker(blocked_worker(release, results))
+               for _ in range(thread_pool.maxThreadCount() + 2)]
+
+    # the running ones are blocked until the timeout
+    assert not stop_workers(timeout=100)
+    assert all(worker.is_cancelled() for worker in workers)
+
+    release.set()
+    start = time.perf_counter()
+    assert stop_workers(timeout=5000)
+    assert time.perf_counter() - start < 1
+    qapp.processEvents()
+    assert not results
+
+
+def test_exit_with_a_blocked_worker():
+    """
+    The signals of a worker still running at exit are destroyed with the
+    interpreter, the worker must not abort the application when it ends
+    """
+    script = """
+import sys, time
+from PyQt5.QtWidgets import QApplication
+from worker import Worker, start_worker, stop_workers
+app = QApplication(sys.argv[:1])
+worker = start_worker(Worker(time.sleep, 0.5))
+worker.signals.result.connect(print)
+stop_workers(timeout=0)
+sip_delete = __import__('PyQt5.sip', fromlist=['sip']).delete
+sip_delete(worker.signals)
+time.sleep(1)
+print("exited")
+"""
+    for _ in range(3):
+        process = subprocess.run([sys.executable, '-c', script], cwd=QT_DIR,
+                                 capture_output=True, text=True, timeout=30)
+        assert process.returncode == 0, process.stderr
+        assert "exited" in process.stdout
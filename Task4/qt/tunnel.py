@@ -0,0 +1,432 @@
+# std lib
+import time
+import socket
+import selectors
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# local includes
+import metrics
+from logger import logger
+
+# seconds between the sends to a channel with a full window
+MIN_RETRY_DELAY = 0.001
+MAX_RETRY_DELAY = 0.05
+
+
+class Tunnel(object):
+    """
+    A local port forwarded to remote_host:remote_port through an ssh transport
+    """
+
+    def __init__(self, transport, remote_host, remote_port, local_port=0):
+        """
+        :param local_port: port listening on localhost, 0 to pick a free one
+        """
+        self.transport = transport
+        self.remote_host = remote_host
+        self.remote_port = remote_port
+
+        self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.bind(('127.0.0.1', local_port))
+        self.listen_socket.listen(8)
+        self.listen_socket.setblocking(False)
+        self.local_port = self.listen_socket.getsockname()[1]
+
+        self.forwards = set()
+        self.started = time.time()
+
+        # bytes sent to the remote end and received from it
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def throughput(self):
+        """
+        :return: average MB/s sent and received since the tunnel was opened
+        """
+        elapsed = max(time.time() - self.started, 1e-6)
+        return (self.bytes_sent / elapsed / 1e6,
+                self.bytes_received / elapsed / 1e6)
+
+    def __str__(self):
+        return "localhost:%d -> %s:%d" % (self.local_port, self.remote_host, self.remote_port)
+
+
+class _Forward(object):
+    """
+    One local connection of a tunnel and its ssh channel
+    """
+
+    def __init__(self, tunnel, sock, channel, buffer_size):
+        self.tunnel = tunnel
+        self.sock = sock
+        self.channel = channel
+
+        # reused for every read from the local socket
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+
+        # data read but not written yet, in both directions
+        self.to_channel = b''
+        self.to_socket = None
+
+    def close(self):
+        self.sock.close()
+        self.channel.close()
+
+
+class TunnelManager(object):
+    """
+    Forward the traffic of all the tunnels with a single selector thread
+    instead of one thread per socket
+    """
+
+    def __init__(self, buffer_size=256 * 1024, window_size=4 * 1024 * 1024,
+                 max_packet_size=32768, channel_timeout=15):
+        """
+        :param buffer_size: size of the buffer reading from the local sockets
+        :param window_size: ssh window of the channels, larger windows need
+                            less round trips on high latency links
+        :param max_packet_size: maximum size of the ssh packets of the channels
+        :param channel_timeout: seconds waited for the server to open a channel
+        """
+        self.buffer_size = buffer_size
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.channel_timeout = channel_timeout
+
+        self.tunnels = set()
+
+        # bytes forwarded by the closed tunnels
+        self.closed_bytes_sent = 0
+        self.closed_bytes_received = 0
+
+        self._selector = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._requests = collections.deque()
+        self._wakeup_reader, self._wakeup_writer = None, None
+
+        # seconds before sending again to a channel whose window was full,
+        # doubled while the windows stay full
+        self._retry_delay = MIN_RETRY_DELAY
+
+        # the channels are opened here, waiting for the server reply
+        # would block the traffic of the other tunnels
+        self._executor = None
+
+    def open_tunnel(self, transport, remote_host, remote_port, local_port=0):
+        """
+        Start listening on a local port and forward its connections
+        :return: the Tunnel, its local_port is the one to connect to
+        """
+        tunnel = Tunnel(transport, remote_host, remote_port, local_port)
+        self._start()
+        self._call(self._add_tunnel, tunnel)
+        logger.debug("Opened tunnel " + str(tunnel))
+        return tunnel
+
+    def set_transport(self, tunnel, transport):
+        """
+        Open the next connections of the tunnel on a new transport, after a
+        reconnection. The local port does not change, so the viewer can
+        reconnect to the same address.
+        """
+        self._call(self._set_transport, (tunnel, transport))
+
+    def close_tunnel(self, tunnel):
+        self._call(self._remove_tunnel, tunnel)
+
+    def bytes_transferred(self):
+        """
+        :return: bytes sent and received by all the tunnels, also the closed ones
+        """
+        tunnels = list(self.tunnels)
+        return (self.closed_bytes_sent + sum(tunnel.bytes_sent for tunnel in tunnels),
+                self.closed_bytes_received + sum(tunnel.bytes_received for tunnel in tunnels))
+
+    def close_all(self):
+        for tunnel in list(self.tunnels):
+            self.close_tunnel(tunnel)
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            thread = self._thread
+            executor = self._executor
+            self._thread = None
+            self._executor = None
+        self._call(None, None)
+        thread.join()
+        # the channels still being opened are closed as they are ready
+        executor.shutdown(wait=False)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._selector = selectors.DefaultSelector()
+            self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+            self._wakeup_reader.setblocking(False)
+            self._wakeup_writer.setblocking(False)
+            self._selector.register(self._wakeup_reader, selectors.EVENT_READ, None)
+            self._executor = ThreadPoolExecutor(max_workers=4,
+                                                thread_name_prefix="rcm-tunnel-open")
+            self._thread = threading.Thread(target=self._run, name="rcm-tunnels", daemon=True)
+            self._thread.start()
+
+    def _call(self, function, argument):
+        """
+        Run a function on the selector thread, the sockets are not shared
+        :return: False if the selector thread is stopped
+        """
+        # the lock keeps the wakeup socket open until the request is queued
+        with self._lock:
+            if self._wakeup_writer is None:
+                return False
+            self._requests.append((function, argument))
+            try:
+                self._wakeup_writer.send(b'\0')
+            except BlockingIOError:
+                # the selector thread has many wakeups to read already
+                pass
+            return True
+
+    def _run(self):
+        while True:
+            # retry soon if a channel window was full
+            waiting = any(forward.to_channel for tunnel in self.tunnels for forward in tunnel.forwards)
+            for key, events in self._selector.select(self._retry_delay if waiting else None):
+                if key.data is None:
+                    if not self._handle_requests():
+                        self._shutdown()
+                        return
+                elif isinstance(key.data, Tunnel):
+                    self._accept(key.data)
+                elif key.fileobj is key.data.sock:
+                    self._on_socket_event(key.data, events)
+                else:
+                    self._on_channel_event(key.data)
+
+            if waiting:
+                sent = False
+                for tunnel in list(self.tunnels):
+                    for forward in list(tunnel.forwards):
+                        if forward.to_channel:
+                            sent = self._flush_to_channel(forward) or sent
+                # paramiko has no event for the window updates, the retries
+                # back off while no window opens
+                self._retry_delay = MIN_RETRY_DELAY if sent else \
+                    min(self._retry_delay * 2, MAX_RETRY_DELAY)
+
+    def _handle_requests(self):
+        try:
+            self._wakeup_reader.recv(4096)
+        except BlockingIOError:
+            pass
+        while self._requests:
+            function, argument = self._requests.popleft()
+            if function is None:
+                return False
+            function(argument)
+        return True
+
+    def _shutdown(self):
+        for tunnel in list(self.tunnels):
+            self._remove_tunnel(tunnel)
+        with self._lock:
+            self._wakeup_reader.close()
+            self._wakeup_writer.close()
+            self._wakeup_reader, self._wakeup_writer = None, None
+            requests = list(self._requests)
+            self._requests.clear()
+        # the channels opened meanwhile belong to removed tunnels, they are closed
+        for function, argument in requests:
+            if function == self._add_forward:
+                function(argument)
+        self._selector.close()
+
+    def _add_tunnel(self, tunnel):
+        self.tunnels.add(tunnel)
+        self._selector.register(tunnel.listen_socket, selectors.EVENT_READ, tunnel)
+
+    def _set_transport(self, arguments):
+        tunnel, transport = arguments
+        tunnel.transport = transport
+        # the channels of the old transport are dead
+        for forward in list(tunnel.forwards):
+            self._close_forward(forward)
+
+    def _remove_tunnel(self, tunnel):
+        if tunnel not in self.tunnels:
+            return
+        for forward in list(tunnel.forwards):
+            self._close_forward(forward)
+        self._selector.unregister(tunnel.listen_socket)
+        tunnel.listen_socket.close()
+        self.tunnels.discard(tunnel)
+        self.closed_bytes_sent += tunnel.bytes_sent
+        self.closed_bytes_received += tunnel.bytes_received
+
+        sent, received = tunnel.throughput()
+        logger.debug("Closed tunnel " + str(tunnel) +
+                     " (sent %d bytes, %.2f MB/s, received %d bytes, %.2f MB/s)" %
+                     (tunnel.bytes_sent, sent, tunnel.bytes_received, received))
+
+    def _accept(self, tunnel):
+        try:
+            sock, address = tunnel.listen_socket.accept()
+        except BlockingIOError:
+            return
+        self._executor.submit(self._open_channel, tunnel, sock, address)
+
+    def _open_channel(self, tunnel, sock, address):
+        try:
+            channel = tunnel.transport.open_channel('direct-tcpip',
+                                                    (tunnel.remote_host, tunnel.remote_port),
+                                                    address,
+                                                    window_size=self.window_size,
+                                                    max_packet_size=self.max_packet_size,
+                                                    timeout=self.channel_timeout)
+        except Exception as e:
+            logger.error("Failed to open the tunnel channel to " + tunnel.remote_host +
+                         ":" + str(tunnel.remote_port) + ": " + str(e))
+            sock.close()
+            return
+        if not self._call(self._add_forward, (tunnel, sock, channel)):
+            # the manager is stopped
+            sock.close()
+            channel.close()
+
+    def _add_forward(self, arguments):
+        tunnel, sock, channel = arguments
+        if tunnel not in self.tunnels:
+            # closed while the channel was being opened
+            sock.close()
+            channel.close()
+            return
+
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        channel.settimeout(0.0)
+
+        forward = _Forward(tunnel, sock, channel, self.buffer_size)
+        tunnel.forwards.add(forward)
+        self._selector.register(sock, selectors.EVENT_READ, forward)
+        self._selector.register(channel, selectors.EVENT_READ, forward)
+
+    def _close_forward(self, forward):
+        if forward not in forward.tunnel.forwards:
+            return
+        forward.tunnel.forwards.discard(forward)
+        for fileobj in (forward.sock, forward.channel):
+            try:
+                self._selector.unregister(fileobj)
+            except KeyError:
+                pass
+        forward.close()
+
+    def _update_events(self, forward):
+        """
+        Read from one side only when the other one has room for the data
+        """
+        sock_events = selectors.EVENT_WRITE if forward.to_socket is not None else 0
+        if not forward.to_channel:
+            sock_events |= selectors.EVENT_READ
+        self._modify(forward.sock, sock_events, forward)
+        self._modify(forward.channel,
+                     selectors.EVENT_READ if forward.to_socket is None else 0,
+                     forward)
+
+    def _modify(self, fileobj, events, forward):
+        try:
+            key = self._selector.get_key(fileobj)
+        except KeyError:
+            key = None
+
+        if key is None and events:
+            self._selector.register(fileobj, events, forward)
+        elif key is not None and not events:
+            self._selector.unregister(fileobj)
+        elif key is not None and key.events != events:
+            self._selector.modify(fileobj, events, forward)
+
+    def _on_socket_event(self, forward, events):
+        if events & selectors.EVENT_WRITE:
+            self._flush_to_socket(forward)
+            if forward not in forward.tunnel.forwards:
+                return
+
+        if events & selectors.EVENT_READ and not forward.to_channel:
+            try:
+                count = forward.sock.recv_into(forward.view)
+            except BlockingIOError:
+                return
+            except OSError:
+                count = 0
+            if count == 0:
+                self._close_forward(forward)
+                return
+
+            # paramiko needs bytes, the copy is made once per read
+            forward.to_channel = forward.view[:count].tobytes()
+            self._flush_to_channel(forward)
+
+        if forward in forward.tunnel.forwards:
+            self._update_events(forward)
+
+    def _on_channel_event(self, forward):
+        if forward.to_socket is not None:
+            return
+        try:
+            data = forward.channel.recv(self.buffer_size)
+        except socket.timeout:
+            return
+        if not data:
+            self._close_forward(forward)
+            return
+
+        forward.tunnel.bytes_received += len(data)
+        forward.to_socket = memoryview(data)
+        self._flush_to_socket(forward)
+        if forward in forward.tunnel.forwards:
+            self._update_events(forward)
+
+    def _flush_to_channel(self, forward):
+        """
+        :return: True if some data was sent
+        """
+        try:
+            sent = forward.channel.send(forward.to_channel)
+        except socket.timeout:
+            # the remote window is full
+            return False
+        except Exception:
+            self._close_forward(forward)
+            return False
+
+        forward.tunnel.bytes_sent += sent
+        forward.to_channel = forward.to_channel[sent:]
+        if not forward.to_channel and forward in forward.tunnel.forwards:
+            self._update_events(forward)
+        return sent > 0
+
+    def _flush_to_socket(self, forward):
+        try:
+            sent = forward.sock.send(forward.to_socket)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._close_forward(forward)
+            return
+
+        forward.to_socket = forward.to_socket[sent:] if sent < len(forward.to_socket) else None
+
+
+tunnel_manager = TunnelManager()
+metrics.gauge('tunnel.open', lambda: len(tunnel_manager.tunnels))
+metrics.gauge('tunnel.bytes_sent', lambda: tunnel_manager.bytes_transferred()[0])
+metrics.gauge('tunnel.bytes_received', lambda: tunnel_manager.bytes_transferred()[1])
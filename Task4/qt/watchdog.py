@@ -0,0 +1,158 @@
+# std lib
+import os
+import sys
+import time
+import threading
+import traceback
+
+# pyqt5
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSlot
+
+# local includes
+import metrics
+from logger import logger
+
+# frames of these files are wrappers, not the slot that stalled
+_WRAPPER_FILES = (os.path.abspath(metrics.__file__).rsplit('.', 1)[0],
+                  os.path.abspath(__file__).rsplit('.', 1)[0])
+
+
+def slot_name(frame, loop_frame=None):
+    """
+    :param loop_frame: the frame running the event loop, the slots are
+                       called by Qt on top of it
+    :return: module.function of the outermost frame above the event loop,
+             which is the slot or the event handler being run
+    """
+    frames = []
+    while frame is not None and frame is not loop_frame:
+        frames.append(frame)
+        frame = frame.f_back
+    if frame is None:
+        # not below the event loop, or it is unknown: the whole stack
+        frames = [frame for frame in frames if frame.f_code.co_name != '<module>']
+    elif not frames:
+        # blocked in the code running the event loop itself
+        frames = [loop_frame]
+
+    for frame in reversed(frames):
+        code = frame.f_code
+        if os.path.abspath(code.co_filename).rsplit('.', 1)[0] in _WRAPPER_FILES:
+            continue
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        return module + "." + getattr(code, 'co_qualname', code.co_name)
+    return "unknown"
+
+
+class StallWatchdog(QObject):
+    """
+    Detect when the gui event loop is blocked. A timer on the gui thread
+    beats every interval and a watchdog thread checks the beats: when they
+    stop for longer than the threshold the stack of the gui thread is
+    written to the log, and once the loop runs again the duration of the
+    stall is added to the histogram of the slot that was running.
+    """
+
+    def __init__(self, threshold=1000, interval=100):
+        """
+        :param threshold: ms without beats reported as a stall
+        :param interval: ms between two beats
+        """
+        super(StallWatchdog, self).__init__()
+
+        self.threshold = threshold / 1000.0
+        self.interval = interval / 1000.0
+
+        # slot -> metrics.Histogram of its stalls in seconds
+        self.histograms = {}
+
+        self._gui_thread_id = threading.get_ident()
+        self._loop_frame = None
+        self._last_beat = time.monotonic()
+
+        # slot and stack of the stall in progress, set by the watchdog thread
+        self._stall = None
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.beat)
+
+    def start(self):
+        """
+        Start watching, must be called from the gui thread by the function
+        then running the event loop
+        """
+        self._gui_thread_id = threading.get_ident()
+        self._loop_frame = sys._getframe(1)
+        self._last_beat = time.monotonic()
+        self._timer.start()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rcm-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._loop_frame = None
+
+    @pyqtSlot()
+    def beat(self):
+        now = time.monotonic()
+        stalled = now - self._last_beat - self.interval
+        self._last_beat = now
+
+        with self._lock:
+            stall = self._stall
+            self._stall = None
+        if stall is None and stalled < self.threshold:
+            return
+
+        # a stall shorter than the watchdog check has no stack
+        slot = stall[0] if stall is not None else "unknown"
+        histogram = self.histograms.get(slot)
+        if histogram is None:
+            histogram = self.histograms[slot] = metrics.Histogram(slot)
+        histogram.observe(stalled)
+        metrics.observe('stall.' + slot, stalled)
+        logger.warning("The gui was blocked for %.2fs by %s" % (stalled, slot))
+
+    def report(self, report_logger):
+        """
+        Write the stalls of each slot to the log, the longest first
+        """
+        for slot, histogram in sorted(self.histograms.items(),
+                                      key=lambda item: -item[1].sum):
+            report_logger.debug("stalls: %-48s %4d, total %.2fs, max %.2fs" %
+                                (slot, histogram.count, histogram.sum, histogram.max))
+
+    def _run(self):
+        check_interval = max(0.05, self.threshold / 4)
+        while not self._stop.wait(check_interval):
+            blocked = time.monotonic() - self._last_beat
+            if blocked < self.threshold:
+                continue
+            with self._lock:
+                if self._stall is not None:
+                    # already reported, waiting for the loop to run again
+                    continue
+                blocked = time.monotonic() - self._last_beat
+                if blocked < self.threshold:
+                    # the loop beat meanwhile
+                    continue
+                frame = sys._current_frames().get(self._gui_thread_id)
+                if frame is None:
+                    continue
+                slot = slot_name(frame, self._loop_frame)
+                stack = "".join(traceback.format_stack(frame))
+                self._stall = (slot, stack)
+                del frame
+            logger.warning("The gui is blocked since %.2fs in %s:\n%s" %
+                           (blocked, slot, stack.rstrip()))
@@ -0,0 +1,176 @@
+# std lib
+import threading
+
+# pyqt5
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+# local includes
+from remote_engine import event_loop
+
+
+class WorkerSignals(QObject):
+    """
+    Signals sent back to the gui thread by a worker
+    """
+
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    progress = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    """
+    Run a blocking function on the worker thread pool.
+    The outcome is delivered to the gui thread through the worker signals.
+    """
+
+    def __init__(self, fn, *args, with_progress=False, **kwargs):
+        """
+        :param fn: function to run on the worker thread
+        :param with_progress: if true fn receives a progress callback as keyword argument
+        """
+        super(Worker, self).__init__()
+
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+        # the python side owns the runnable, see start_worker
+        self.setAutoDelete(False)
+
+        # called on the worker thread with the result of fn if the
+        # worker has been cancelled while it was running
+        self.on_cancelled = None
+
+        self._cancelled = threading.Event()
+
+        if with_progress:
+            self.kwargs['progress'] = self.report_progress
+
+    def cancel(self):
+        """
+        Stop delivering the signals, the running function is not interrupted
+        """
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def report_progress(self, message):
+        self._emit('progress', message)
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self._emit('error', e)
+        else:
+            if not self.is_cancelled():
+                self._emit('result', result)
+            elif self.on_cancelled is not None:
+                self.on_cancelled(result)
+
+        self._emit('finished')
+
+        with _active_lock:
+            _active_workers.discard(self)
+
+    def _emit(self, name, *args):
+        """
+        Emit the signal with the name unless the worker has been cancelled
+        """
+        if self.is_cancelled():
+            return
+        try:
+            getattr(self.signals, name).emit(*args)
+        except RuntimeError:
+            # the signals were destroyed at exit while fn was running,
+            # an exception leaving run would abort the application
+            pass
+
+
+# bounded pool shared by all the sessions for the remote operations
+thread_pool = QThreadPool()
+thread_pool.setMaxThreadCount(4)
+
+# keep a reference to the queued and running workers until they are done
+_active_workers = set()
+_active_lock = threading.Lock()
+
+
+def start_worker(worker):
+    with _active_lock:
+        _active_workers.add(worker)
+    thread_pool.start(worker)
+    return worker
+
+
+def cancel_worker(worker):
+    """
+    Cancel a worker, removing it from the pool queue if it is not started yet
+    """
+    worker.cancel()
+    if thread_pool.tryTake(worker):
+        with _active_lock:
+            _active_workers.discard(worker)
+
+
+def stop_workers(timeout=5000):
+    """
+    Cancel all the workers at exit and wait for the running ones, so that
+    none of them signals once the widgets and the signals are destroyed
+    :param timeout: ms to wait, -1 to wait for the blocked ones too
+    :return: True if no worker is running anymore
+    """
+    with _active_lock:
+        workers = list(_active_workers)
+    for worker in workers:
+        cancel_worker(worker)
+    thread_pool.clear()
+    return thread_pool.waitForDone(timeout)
+
+
+class AsyncTask(QObject):
+    """
+    Run a coroutine on the asyncio loop thread and deliver its outcome
+    to the gui thread through Qt signals
+    """
+
+    result = pyqtSignal(object)
+    error = pyqtSignal(object)
+    finished = pyqtSignal()
+
+    def __init__(self, coro, on_result=None, on_error=None):
+        """
+        :param on_result: slot receiving the result of the coroutine
+        :param on_error: slot receiving the exception raised by the coroutine
+        """
+        super(AsyncTask, self).__init__()
+
+        # connected before the coroutine starts, it may end at once: queued,
+        # so that the slots never run before the caller has stored the task
+        if on_result is not None:
+            self.result.connect(on_result, Qt.QueuedConnection)
+        if on_error is not None:
+            self.error.connect(on_error, Qt.QueuedConnection)
+
+        # the done callback keeps the task alive until the coroutine ends
+        self.future = event_loop.submit(coro)
+        self.future.add_done_callback(self._on_done)
+
+    def cancel(self):
+        self.future.cancel()
+
+    def _on_done(self, future):
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if error is not None:
+            self.error.emit(error)
+        else:
+            self.result.emit(future.result())
+        self.finished.emit()